@@ -0,0 +1,147 @@
+"""
+License: MIT
+
+Generates a synthetic pair of input files for merge_genotypes.py: an unphased single-sample VCF file (A) and
+a phased VCF file (B), both written as BGZF with a tabix index.
+
+The sites of every contig are spread over the contig with random gaps. Each site is either in A only, in both
+files, or in B only: a share --overlap of the sites of A is also found in B, and B holds --b-only times as many
+extra sites as A holds sites. Of the shared sites, a share --genotype-mismatch carries a genotype in B that
+disagrees with A, and a share --allele-mismatch carries a different ALT allele in B; agreeing heterozygous
+genotypes are phased either way, 0|1 or 1|0. The INFO column of A is padded to --info-width characters,
+as the annotations of real callers make up most of each line.
+
+Usage: python benchmark/generate_vcf.py a.vcf.gz b.vcf.gz [--sites 1000000] [--overlap 0.9] [--seed 1]
+"""
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workflow", "scripts"))
+from bgzf import open_file
+from vcf_index import TabixIndexer
+from vcf_writers import VcfWriter
+
+BASES = "ACGT"
+
+# unphased genotypes of A with their frequency, and the phased genotypes of B that agree with them
+GENOTYPE_WEIGHTS = {'0/1': 60, '1/1': 35, '0/0': 5}
+AGREEING_PHASED = {'0/0': ('0|0',), '0/1': ('0|1', '1|0'), '1/1': ('1|1',)}
+DISAGREEING_PHASED = {'0/0': ('0|1', '1|1'), '0/1': ('0|0', '1|1'), '1/1': ('0|0', '0|1')}
+
+def vcf_header(contigs, contig_length, sample, info_width):
+    """
+    Returns the header lines of a synthetic VCF file.
+
+    Args:
+    - contigs (list): The contig names.
+    - contig_length (int): The length of every contig.
+    - sample (str): The sample name.
+    - info_width (int): The width of the INFO column, 0 for a file B without INFO and PL fields.
+
+    Returns:
+    - list: The header lines.
+    """
+    header = ["##fileformat=VCFv4.2\n"]
+    header.extend(f"##contig=<ID={contig},length={contig_length}>\n" for contig in contigs)
+    if info_width:
+        header.append('##INFO=<ID=DP,Number=1,Type=Integer,Description="Raw read depth">\n')
+        header.append('##INFO=<ID=PAD,Number=1,Type=String,Description="Filler of the synthetic INFO column">\n')
+        header.append('##FORMAT=<ID=PL,Number=G,Type=Integer,Description="Phred-scaled genotype likelihoods">\n')
+    header.append('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+    header.append(f"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{sample}\n")
+    return header
+
+def generate_pair(file_a, file_b, sites=1000000, contigs=1, overlap=0.9, b_only=0.1, genotype_mismatch=0.01,
+                  allele_mismatch=0.01, info_width=80, spacing=100, sample="sampleA", seed=1):
+    """
+    Writes a synthetic pair of files A and B, see the module description.
+
+    Args:
+    - file_a (str): The path to file A, BGZF-compressed and indexed if the name ends with .gz.
+    - file_b (str): The path to file B, BGZF-compressed and indexed if the name ends with .gz.
+    - sites (int): The number of sites of A, spread evenly over the contigs.
+    - contigs (int): The number of contigs.
+    - overlap (float): The share of the sites of A that are also in B.
+    - b_only (float): The number of sites only in B, relative to the number of sites of A.
+    - genotype_mismatch (float): The share of shared sites where the genotype of B disagrees with A.
+    - allele_mismatch (float): The share of shared sites where B has a different ALT allele.
+    - info_width (int): The width of the INFO column of A.
+    - spacing (int): The mean distance between neighbouring sites.
+    - sample (str): The sample name of both files.
+    - seed (int): The seed of the random number generator.
+
+    Returns:
+    - tuple: The number of records of A and of B.
+    """
+    rng = random.Random(seed)
+    names = [f"chr{i + 1}" for i in range(contigs)]
+    per_contig = [sites // contigs + (i < sites % contigs) for i in range(contigs)]
+    # the positions of a contig never exceed its length, even if every gap is the largest possible
+    contig_length = (max(per_contig) + int(max(per_contig) * b_only) + 1) * (2 * spacing - 1)
+    genotypes, weights = list(GENOTYPE_WEIGHTS), list(GENOTYPE_WEIGHTS.values())
+    padding = max(0, info_width - len("DP=00;PAD="))
+
+    n_a = n_b = 0
+    writers = []
+    for file_path, width in ((file_a, info_width), (file_b, 0)):
+        indexer = TabixIndexer("tbi") if file_path.endswith('.gz') else None
+        file = open_file(file_path, 'wt')
+        writer = VcfWriter(file, indexer=indexer)
+        writer.writelines(vcf_header(names, contig_length, sample, width))
+        writers.append((file_path, file, writer, indexer))
+    (_, _, sink_a, _), (_, _, sink_b, _) = writers
+
+    for contig, n_sites in zip(names, per_contig):
+        n_extra = int(n_sites * b_only + rng.random())
+        # every position is drawn once, shuffled into sites of A (first n_sites) and sites only in B
+        in_a = [True] * n_sites + [False] * n_extra
+        rng.shuffle(in_a)
+        pos = 0
+        for site_in_a in in_a:
+            pos += rng.randint(1, 2 * spacing - 1)
+            ref = rng.choice(BASES)
+            alt = rng.choice(BASES.replace(ref, ""))
+            genotype = rng.choices(genotypes, weights)[0]
+            if site_in_a:
+                pl = "0,30,255" if genotype == '0/1' else "255,30,0" if genotype == '1/1' else "0,60,255"
+                info = f"DP={rng.randint(10, 99)};PAD={'x' * padding}" if info_width else "."
+                sink_a.write(f"{contig}\t{pos}\t.\t{ref}\t{alt}\t{rng.randint(20, 999)}\t.\t{info}\tGT:PL\t{genotype}:{pl}\n")
+                n_a += 1
+                if rng.random() >= overlap:
+                    continue
+                if rng.random() < allele_mismatch:
+                    alt = rng.choice(BASES.replace(ref, "").replace(alt, ""))
+            phased = DISAGREEING_PHASED if site_in_a and rng.random() < genotype_mismatch else AGREEING_PHASED
+            sink_b.write(f"{contig}\t{pos}\t.\t{ref}\t{alt}\t.\t.\t.\tGT\t{rng.choice(phased[genotype])}\n")
+            n_b += 1
+
+    for file_path, file, writer, indexer in writers:
+        writer.close()
+        file.close()
+        if indexer is not None:
+            indexer.write(indexer.index_path(file_path), file.buffer.raw.virtual_offset)
+    return n_a, n_b
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic pair of unphased (A) and phased (B) VCF files.")
+    parser.add_argument("file_a", help="output path of file A, BGZF-compressed and indexed if the name ends with .gz")
+    parser.add_argument("file_b", help="output path of file B, BGZF-compressed and indexed if the name ends with .gz")
+    parser.add_argument("--sites", type=int, default=1000000, help="number of sites of A (default: 1000000)")
+    parser.add_argument("--contigs", type=int, default=1, help="number of contigs the sites are spread over (default: 1)")
+    parser.add_argument("--overlap", type=float, default=0.9, help="share of the sites of A that are also in B (default: 0.9)")
+    parser.add_argument("--b-only", type=float, default=0.1, help="number of sites only in B, relative to the sites of A (default: 0.1)")
+    parser.add_argument("--genotype-mismatch", type=float, default=0.01,
+                        help="share of shared sites whose genotype in B disagrees with A (default: 0.01)")
+    parser.add_argument("--allele-mismatch", type=float, default=0.01,
+                        help="share of shared sites with a different ALT allele in B (default: 0.01)")
+    parser.add_argument("--info-width", type=int, default=80, help="width of the INFO column of A (default: 80)")
+    parser.add_argument("--spacing", type=int, default=100, help="mean distance between neighbouring sites (default: 100)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the random number generator (default: 1)")
+    args = parser.parse_args()
+
+    n_a, n_b = generate_pair(args.file_a, args.file_b, args.sites, args.contigs, args.overlap, args.b_only, args.genotype_mismatch,
+                             args.allele_mismatch, args.info_width, args.spacing, seed=args.seed)
+    print(f"INFO: Wrote {n_a} records to {args.file_a} and {n_b} records to {args.file_b}", file=sys.stderr)
@@ -0,0 +1,136 @@
+"""
+License: MIT
+
+Micro-benchmark of the per-record hot path of merge_genotypes.py.
+
+The bundled test VCFs in test/ are scaled up by repeating their records with shifted positions.
+The records are held in memory, so only tokenizing and genotype injection are measured and compared
+against the split-based implementation that merge_genotypes.py used before, which is kept below.
+Two scenarios are run: the test files as they are (few matching sites) and file A against a phased
+copy of itself, so that every site goes through genotype injection.
+
+Finally, the scaled files are written as BGZF and replace_genotypes is run end to end with each engine.
+
+Usage: python benchmark/microbenchmark.py [--scale 500] [--repeat 3]
+"""
+
+import os
+import sys
+import gzip
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workflow", "scripts"))
+import bgzf
+import vcf_writers
+import vcf_reader
+import record_merge
+import merge_genotypes
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test")
+
+def legacy_parse_vcf_line(line):
+    parts = line.strip().split('\t')
+    coordinate = (parts[0], int(parts[1]))
+    format_genotype = parts[9].split(':')[0]
+    format_other = "".join(parts[9].split(':')[1:])
+    return coordinate, (line, parts[3], parts[4], format_genotype, format_other)
+
+def legacy_inject_genotype(coordinate, record_a, record_b):
+    (line_a, ref_a, alt_a, format_genotype_a, format_other_a) = record_a
+    (line_b, ref_b, alt_b, format_genotype_b, format_other_b) = record_b
+    if format_genotype_a not in record_merge.ALLOWED_GENOTYPES:
+        sys.exit("Error: unexpected genotype in file A")
+    if format_genotype_b not in map(record_merge.phase_genotype, record_merge.ALLOWED_GENOTYPES):
+        sys.exit("Error: unexpected genotype in file B")
+    inconsistent_genotypes = format_genotype_a.split('/') != format_genotype_b.split('|')
+    inconsistent_alleles = (ref_a, alt_a) != (ref_b, alt_b)
+    line_b_parts = line_b.strip().split('\t')
+    modified_line_a_parts = line_a.strip().split('\t')
+    modified_line_a_parts[9] = f"{format_genotype_b}:{format_other_a}"
+    return '\t'.join(modified_line_a_parts) + '\n'
+
+def read_body(file_path):
+    with gzip.open(file_path, 'rt') as file:
+        return [line for line in file if not line.startswith('#')]
+
+def scale_lines(lines, scale):
+    """
+    Repeats the records scale times, shifting the positions of every copy behind the previous one.
+    """
+    span = max(int(line.split('\t', 2)[1]) for line in lines)
+    scaled = []
+    for copy in range(scale):
+        for line in lines:
+            contig, pos, rest = line.split('\t', 2)
+            scaled.append(f"{contig}\t{int(pos) + copy * span}\t{rest}")
+    return scaled
+
+def read_header(file_path):
+    with gzip.open(file_path, 'rt') as file:
+        return [line for line in file if line.startswith('#')]
+
+def write_vcf(file_path, header, lines):
+    with bgzf.open_file(file_path, 'wt') as file:
+        file.writelines(header)
+        file.writelines(lines)
+
+def run_pipeline(file_a, file_b, output, engine):
+    """
+    Runs replace_genotypes end to end from BGZF inputs to a BGZF output.
+    """
+    with bgzf.open_file(output, 'wt') as output_file:
+        with vcf_writers.VcfWriter(output_file) as sink:
+            merge_genotypes.replace_genotypes(file_a, file_b, sink=sink, engine=engine, write_header=True)
+
+def run(lines_a, lines_b, parse, inject):
+    """
+    Tokenizes both inputs and injects the genotypes of B into A, returns the number of output characters.
+    """
+    records_b = dict(parse(line) for line in lines_b)
+    size = 0
+    for line in lines_a:
+        coordinate, record_a = parse(line)
+        record_b = records_b.get(coordinate)
+        size += len(inject(coordinate, record_a, record_b) if record_b is not None else record_a[0])
+    return size
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the merge_genotypes.py hot path.")
+    parser.add_argument("--scale", type=int, default=500, help="number of copies of the test records (default: 500)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs, the fastest is reported (default: 3)")
+    args = parser.parse_args()
+
+    lines_a = scale_lines(read_body(os.path.join(TEST_DIR, "vcf-unphased", "sampleA.chr1.vcf.gz")), args.scale)
+    lines_b = scale_lines(read_body(os.path.join(TEST_DIR, "vcf-phased", "sampleA.chr1.vcf.gz")), args.scale)
+    lines_a_phased = [line.replace('/', '|') for line in lines_a]
+
+    for scenario, (inputs_a, inputs_b) in (("test files", (lines_a, lines_b)), ("all sites matched", (lines_a, lines_a_phased))):
+        n_records = len(inputs_a) + len(inputs_b)
+        results = {}
+        for name, parse, inject in (("legacy", legacy_parse_vcf_line, legacy_inject_genotype),
+                                    ("current", vcf_reader.parse_vcf_line, record_merge.inject_genotype)):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                run(inputs_a, inputs_b, parse, inject)
+                timings.append(time.perf_counter() - start)
+            results[name] = n_records / min(timings)
+            print(f"{scenario}\t{name}\t{results[name]:,.0f} records/s")
+        print(f"{scenario}\tspeedup\t{results['current'] / results['legacy']:.2f}x")
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_a, file_b, output = (os.path.join(directory, name) for name in ("a.vcf.gz", "b.vcf.gz", "out.vcf.gz"))
+        write_vcf(file_a, read_header(os.path.join(TEST_DIR, "vcf-unphased", "sampleA.chr1.vcf.gz")), lines_a)
+        write_vcf(file_b, read_header(os.path.join(TEST_DIR, "vcf-phased", "sampleA.chr1.vcf.gz")), lines_b)
+        n_records = len(lines_a) + len(lines_b)
+        for engine in merge_genotypes.ENGINES:
+            if engine == "block" and merge_genotypes.np is None:
+                continue
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                run_pipeline(file_a, file_b, output, engine)
+                timings.append(time.perf_counter() - start)
+            print(f"end to end ({engine})\t{n_records / min(timings):,.0f} records/s")
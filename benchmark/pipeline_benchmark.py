@@ -0,0 +1,197 @@
+"""
+License: MIT
+
+Pipeline-level benchmark of merge_genotypes.py on synthetic inputs.
+
+For every requested number of sites, a pair of files A and B is generated with generate_vcf.py and
+merge_genotypes.py is run on it as a separate process, once per engine of each backend. The pysam backend runs 
+the dict and stream engines.
+Each run is timed from process start to exit, so imports, decompression, merging, compression and indexing are
+all included. The peak resident set size of the process is taken from its resource usage.
+
+The report is a JSON file with the generator parameters, the environment and one result per run: the wall
+time of the fastest of --repeat runs, the records of A and B per second, the largest peak RSS and the size of
+the output. A run that exits with a non-zero status has no throughput. Given a baseline report from an earlier
+run, results whose throughput dropped by more than --tolerance are listed, as are runs that failed, and the
+exit status is non-zero.
+
+Usage: python benchmark/pipeline_benchmark.py [--sites 100000,1000000] [--report report.json] [--baseline old.json]
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+
+from generate_vcf import generate_pair
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workflow", "scripts", "merge_genotypes.py")
+
+sys.path.insert(0, os.path.dirname(SCRIPT))
+import merge_genotypes
+
+def run_merge(arguments):
+    """
+    Runs merge_genotypes.py in a new process.
+
+    Args:
+    - arguments (list): The command line arguments of merge_genotypes.py.
+
+    Returns:
+    - tuple: The wall time in seconds, the peak RSS in bytes and the exit status.
+    """
+    with tempfile.TemporaryFile() as error:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, SCRIPT] + arguments, stdout=subprocess.DEVNULL, stderr=error)
+        # wait4 returns the resource usage of this process alone, unlike getrusage(RUSAGE_CHILDREN)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        status = os.waitstatus_to_exitcode(status)
+        if status != 0:
+            error.seek(0)
+            message = error.read().decode(errors='replace').strip()[-500:]
+            print(f"WARNING: merge_genotypes.py {' '.join(arguments)} failed with status {status}: {message}", file=sys.stderr)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return seconds, peak_rss, status
+
+def benchmark(file_a, file_b, n_records, output, engines, repeat=3, extra_arguments=(), backends=("python",)):
+    """
+    Runs every engine of every backend on one pair of files.
+
+    Args:
+    - file_a (str): The path to file A.
+    - file_b (str): The path to file B.
+    - n_records (int): The number of records of A and B together.
+    - output (str): The path of the merged output, overwritten by every run.
+    - engines (list): The engines to run.
+    - repeat (int): The number of runs of each engine; the fastest is reported.
+    - extra_arguments (list): Further command line arguments of merge_genotypes.py.
+    - backends (list): The backends to run, out of merge_genotypes.BACKENDS.
+
+    Returns:
+    - list: One result dict per backend and engine.
+    """
+    results = []
+    for backend, engine in ((backend, engine) for backend in backends for engine in engines):
+        if backend == "pysam" and engine == "block":
+            continue
+        arguments = [file_a, file_b, output, "--engine", engine, "--backend", backend] + list(extra_arguments)
+        runs = [run_merge(arguments) for _ in range(repeat)]
+        status = max((run[2] for run in runs), key=abs)
+        # a run that fails early would otherwise look like the fastest one
+        seconds = min(run[0] for run in runs) if status == 0 else None
+        results.append({
+            "backend": backend,
+            "engine": engine,
+            "records": n_records,
+            "seconds": seconds,
+            "records_per_second": n_records / seconds if seconds else None,
+            "peak_rss_bytes": max(run[1] for run in runs),
+            "output_bytes": os.path.getsize(output) if os.path.exists(output) else None,
+            "status": status,
+        })
+        result = results[-1]
+        throughput = f"{result['records_per_second']:,.0f} records/s" if seconds else f"failed with status {status}"
+        print(f"{n_records} records\t{backend}\t{engine}\t{throughput}\t"
+              f"{result['peak_rss_bytes'] / 2**20:,.1f} MiB peak RSS\t{result['output_bytes'] or 0:,} bytes output")
+    return results
+
+def compare_reports(report, baseline, tolerance=0.1):
+    """
+    Compares the throughput of a report with that of a baseline report, matching results by
+    number of sites, backend and engine. Results without a backend are of the python backend; results of 
+    earlier reports in another mode than text are skipped.
+    A run that failed in the report counts as a regression; runs that failed in the baseline are not compared.
+
+    Args:
+    - report (dict): The current report.
+    - baseline (dict): The baseline report.
+    - tolerance (float): The relative drop in records per second that is still accepted.
+
+    Returns:
+    - list: Tuples of sites, backend, engine, baseline and current records per second of every regression, 
+      None for a failed run or a result missing from the baseline.
+    """
+    def by_key(report):
+        return {(result["sites"], result.get("backend", "python"), result["engine"]): result["records_per_second"] 
+                for result in report["results"] if result.get("mode", "text") == "text"}
+
+    current, previous = by_key(report), by_key(baseline)
+    regressions = []
+    for key, after in current.items():
+        before = previous.get(key)
+        if after is None or before is not None and after < before * (1 - tolerance):
+            regressions.append(key + (before, after))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark merge_genotypes.py end to end on synthetic VCF files.")
+    parser.add_argument("--sites", default="100000,1000000",
+                        help="comma-separated numbers of sites of A to generate, one benchmark each (default: 100000,1000000)")
+    parser.add_argument("--contigs", type=int, default=1, help="number of contigs, see generate_vcf.py (default: 1)")
+    parser.add_argument("--overlap", type=float, default=0.9, help="share of the sites of A that are also in B (default: 0.9)")
+    parser.add_argument("--b-only", type=float, default=0.1, help="number of sites only in B, relative to the sites of A (default: 0.1)")
+    parser.add_argument("--genotype-mismatch", type=float, default=0.01,
+                        help="share of shared sites whose genotype in B disagrees with A (default: 0.01)")
+    parser.add_argument("--allele-mismatch", type=float, default=0.01,
+                        help="share of shared sites with a different ALT allele in B (default: 0.01)")
+    parser.add_argument("--info-width", type=int, default=80, help="width of the INFO column of A (default: 80)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the random number generator (default: 1)")
+    parser.add_argument("--engines", default=",".join(merge_genotypes.ENGINES),
+                        help=f"comma-separated engines to run (default: {','.join(merge_genotypes.ENGINES)})")
+    parser.add_argument("--backends", default="python,pysam",
+                        help="comma-separated backends to run, pysam only if it is installed (default: python,pysam)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each engine, the fastest is reported (default: 3)")
+    parser.add_argument("--threads", type=int, default=1, help="--threads of merge_genotypes.py (default: 1)")
+    parser.add_argument("--work-dir", help="directory for the generated files, kept after the run (default: a temporary directory)")
+    parser.add_argument("--report", default="benchmark_report.json", help="path of the JSON report (default: benchmark_report.json)")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare the throughput with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative drop in records per second below the baseline that counts as a regression (default: 0.1)")
+    args = parser.parse_args()
+
+    engines = args.engines.split(",")
+    if "block" in engines and merge_genotypes.np is None:
+        print("WARNING: NumPy is not installed, skipping the block engine", file=sys.stderr)
+        engines.remove("block")
+    backends = args.backends.split(",")
+    if "pysam" in backends and merge_genotypes.pysam is None:
+        print("WARNING: pysam is not installed, skipping the pysam backend", file=sys.stderr)
+        backends.remove("pysam")
+    parameters = dict(contigs=args.contigs, overlap=args.overlap, b_only=args.b_only, genotype_mismatch=args.genotype_mismatch,
+                      allele_mismatch=args.allele_mismatch, info_width=args.info_width, seed=args.seed)
+    report = {
+        "parameters": dict(parameters, repeat=args.repeat, threads=args.threads),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                        "numpy": getattr(merge_genotypes.np, "__version__", None), 
+                        "pysam": getattr(merge_genotypes.pysam, "__version__", None)},
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        directory = args.work_dir or temporary_directory
+        os.makedirs(directory, exist_ok=True)
+        for sites in map(int, args.sites.split(",")):
+            file_a, file_b, output = (os.path.join(directory, f"{sites}.{name}.vcf.gz") for name in ("a", "b", "merged"))
+            n_a, n_b = generate_pair(file_a, file_b, sites, **parameters)
+            for result in benchmark(file_a, file_b, n_a + n_b, output, engines, args.repeat, ["--threads", str(args.threads)], backends):
+                report["results"].append(dict(result, sites=sites, input_bytes=os.path.getsize(file_a) + os.path.getsize(file_b)))
+
+    with open(args.report, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"INFO: Wrote {args.report}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_reports(report, json.load(baseline_file), args.tolerance)
+        for sites, backend, engine, before, after in regressions:
+            before = "no result" if before is None else f"{before:,.0f}"
+            after = "failed" if after is None else f"{after:,.0f} records/s"
+            print(f"REGRESSION: {sites} sites\t{backend}\t{engine}\t{before} -> {after}", file=sys.stderr)
+        if regressions:
+            sys.exit(f"Error: {len(regressions)} results failed or are more than {args.tolerance:.0%} slower than {args.baseline}")
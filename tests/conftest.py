@@ -0,0 +1,99 @@
+"""
+License: MIT
+
+Fixtures shared by the tests. The scripts in workflow/scripts import each other as sibling modules,
+so that directory is put on the module search path.
+"""
+
+import os
+import sys
+import gzip
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, "workflow", "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from bgzf import open_file
+from vcf_index import TabixIndexer
+from vcf_writers import VcfWriter
+
+# the test pair of the workflow, compressed with gzip instead of bgzip
+FILE_A = os.path.join(ROOT, "test", "vcf-unphased", "sampleA.chr1.vcf.gz")
+FILE_B = os.path.join(ROOT, "test", "vcf-phased", "sampleA.chr1.vcf.gz")
+
+# the output of merge_genotypes.py before the engines were added, for the test pair
+EXPECTED = os.path.join(ROOT, "tests", "data", "sampleA.chr1.merged.vcf.gz")
+
+# the event counts of that merge
+EXPECTED_COUNTS = {
+    "read_lines":                     381,
+    "inconsistent_ref_alt_genotypes": 0,
+    "inconsistent_ref_alt_alleles":   0,
+    "replaced_genotypes":             13,
+    "kept_genotypes":                 368,
+    "dropped_duplicates":             0,
+    "ambiguous_duplicates":           0,
+}
+
+def read_lines(file_path):
+    """
+    Returns the lines of a plain or gzipped text file.
+    """
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rt') as file:
+        return file.readlines()
+
+def run_merge(file_a, file_b, output_path, *options, error=False):
+    """
+    Runs merge_genotypes.py on file A and B and fails the test if it exits with an error, or without one if
+    error is set.
+
+    Returns:
+    - dict: The event counts printed by the script, or str: its error message if error is set.
+    """
+    result = subprocess.run([sys.executable, os.path.join(SCRIPTS, "merge_genotypes.py"), file_a, file_b, output_path,
+                             *options], capture_output=True, text=True)
+    if error:
+        if result.returncode == 0:
+            pytest.fail("merge_genotypes.py did not fail")
+        return result.stderr
+    if result.returncode != 0:
+        pytest.fail(result.stderr)
+    counts = {}
+    for line in result.stdout.splitlines():
+        event, _, count = line.partition('\t')
+        if count.isdigit():
+            counts[event] = int(count)
+    return counts
+
+def write_vcf(file_path, lines, index_format="tbi"):
+    """
+    Writes lines to a VCF file, BGZF-compressed and indexed if the name ends with .gz.
+
+    Returns:
+    - str: The path to the file.
+    """
+    indexer = TabixIndexer(index_format) if file_path.endswith('.gz') else None
+    file = open_file(file_path, 'wt')
+    with VcfWriter(file, indexer=indexer) as writer:
+        writer.writelines(lines)
+    file.close()
+    if indexer is not None:
+        indexer.write(indexer.index_path(file_path), file.buffer.raw.virtual_offset)
+    return file_path
+
+@pytest.fixture(scope="session")
+def expected_lines():
+    return read_lines(EXPECTED)
+
+@pytest.fixture(scope="session")
+def bgzf_pair(tmp_path_factory):
+    """
+    The test pair rewritten as BGZF with tabix indices, as required for regions, --jobs and the pysam backend.
+    """
+    directory = tmp_path_factory.mktemp("bgzf")
+    return (write_vcf(str(directory / "a.vcf.gz"), read_lines(FILE_A)),
+            write_vcf(str(directory / "b.vcf.gz"), read_lines(FILE_B)))
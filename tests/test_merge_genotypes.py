@@ -0,0 +1,312 @@
+"""
+License: MIT
+
+Regression tests of merge_genotypes.py: every engine and mode must write the output of the original
+script for the test pair of the workflow and count the same events.
+"""
+
+import random
+import io
+import gzip
+import os
+
+import pytest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+from bcf import BcfWriter
+from merge_genotypes import merge_files, replace_genotypes
+from vcf_index import TabixIndexer
+from vcf_reader import iter_vcf_records, read_bcf_stream, read_vcf_records
+from conftest import FILE_A, FILE_B, EXPECTED, EXPECTED_COUNTS, read_lines, run_merge, write_vcf
+
+ENGINES = ("dict", "stream", "block")
+
+ENGINE_MODES = [
+    ("dict", ()),
+    ("stream", ()),
+    ("block", ()),
+    ("block", ("--block-size", "4096")),
+    ("dict", ("--lazy",)),
+    ("stream", ("--lazy",)),
+]
+
+requires_numpy = pytest.mark.skipif(numpy is None, reason="the block engine requires NumPy")
+requires_pysam = pytest.mark.skipif(pysam is None, reason="requires pysam")
+
+def engine_params(engines=ENGINES):
+    return [pytest.param(engine, marks=requires_numpy) if engine == "block" else engine for engine in engines]
+
+def records(file_path):
+    """
+    Returns the coordinate, REF, ALT and genotype of every record of a VCF or BCF file.
+    """
+    return [(coordinate, ref, alt, genotype) for coordinate, (_, ref, alt, genotype, _) in iter_vcf_records(file_path)]
+
+def check_counts(counts, **changed):
+    expected = dict(EXPECTED_COUNTS, **changed)
+    assert {event: counts[event] for event in expected} == expected
+
+def test_read_vcf_records():
+    vcf = read_vcf_records(FILE_A)
+    assert len(vcf) == EXPECTED_COUNTS["read_lines"]
+    for (chrom, pos), (line, ref, alt, genotype, sample_offset) in vcf.items():
+        parts = line.split('\t')
+        assert (parts[0], int(parts[1]), parts[3], parts[4]) == (chrom, pos, ref, alt)
+        assert line[sample_offset:] == parts[9] and parts[9].startswith(genotype + ':')
+
+@pytest.mark.parametrize("engine, options", [
+    pytest.param(engine, options, marks=requires_numpy) if engine == "block" else (engine, options)
+    for engine, options in ENGINE_MODES])
+@pytest.mark.parametrize("suffix", [".vcf", ".vcf.gz"])
+def test_engines_match_baseline(tmp_path, expected_lines, engine, options, suffix):
+    output = str(tmp_path / f"out{suffix}")
+    counts = run_merge(FILE_A, FILE_B, output, "--engine", engine, *options)
+    assert read_lines(output) == expected_lines
+    check_counts(counts)
+
+@pytest.mark.parametrize("index_format", ["tbi", "csi"])
+def test_output_index(tmp_path, expected_lines, index_format):
+    output = str(tmp_path / "out.vcf.gz")
+    run_merge(FILE_A, FILE_B, output, "--index", index_format)
+    assert read_lines(output) == expected_lines
+    with gzip.open(f"{output}.{index_format}", 'rb') as index:
+        assert index.read(4) == index_format.upper().encode() + b'\1'
+
+def test_required_index(tmp_path):
+    lines = read_lines(FILE_A)
+    header = [line for line in lines if line.startswith('#')]
+    body = [line for line in lines if not line.startswith('#')]
+    file_a = write_vcf(str(tmp_path / "a.vcf"), header + body[::-1])
+    output = str(tmp_path / "out.vcf.gz")
+    # the dict engine writes the records of A in their order, which cannot be indexed
+    assert "its index cannot be built" in run_merge(file_a, FILE_B, output, "--index", "tbi", error=True)
+    run_merge(file_a, FILE_B, output, "--index", "auto")
+    assert not os.path.exists(f"{output}.tbi")
+
+    long_contig = [line.replace("length=", "length=999") if line.startswith("##contig=<ID=chr28,") else line for line in lines]
+    assert long_contig != lines
+    file_a = write_vcf(str(tmp_path / "long.vcf"), long_contig)
+    assert "use a csi index" in run_merge(file_a, FILE_B, output, "--index", "tbi", error=True)
+
+@pytest.mark.parametrize("engine", engine_params())
+def test_regions_cover_contig(tmp_path, expected_lines, bgzf_pair, engine):
+    output = str(tmp_path / "out.vcf.gz")
+    counts = run_merge(*bgzf_pair, output, "--engine", engine, "--region", "chr28:1-10000000")
+    assert read_lines(output) == expected_lines
+    check_counts(counts)
+
+@pytest.mark.parametrize("engine", engine_params())
+def test_region_subset(tmp_path, expected_lines, bgzf_pair, engine):
+    output = str(tmp_path / "out.vcf")
+    run_merge(*bgzf_pair, output, "--engine", engine, "--region", "chr28:20000-50000")
+    body = [line for line in expected_lines if not line.startswith('#') and 20_000 <= int(line.split('\t')[1]) <= 50_000]
+    assert body
+    assert [line for line in read_lines(output) if not line.startswith('#')] == body
+
+@pytest.mark.parametrize("engine", engine_params())
+def test_jobs(tmp_path, expected_lines, bgzf_pair, engine):
+    output = str(tmp_path / "out.vcf.gz")
+    counts = run_merge(*bgzf_pair, output, "--engine", engine, "--jobs", "2")
+    assert read_lines(output) == expected_lines
+    check_counts(counts)
+
+ORDER_HEADER = [
+    "##fileformat=VCFv4.2\n",
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n',
+    '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read depth">\n',
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n",
+]
+
+def order_records(contigs, sample):
+    return [f"{contig}\t{pos}\t.\tC\tT\t50\t.\t.\tGT:DP\t{sample}\n" for contig in contigs for pos in (10, 20)]
+
+@pytest.mark.parametrize("contig_lines, contigs_a, contigs_b", [
+    # A without ##contig lines runs c2 before c1, B the other way round
+    ([], ["c2", "c1"], ["c1", "c2"]),
+    # A starts with a contig that its header does not list
+    (["##contig=<ID=c1>\n"], ["cX", "c1"], ["cX", "c1"]),
+])
+def test_stream_keeps_order_of_a(tmp_path, capsys, contig_lines, contigs_a, contigs_b):
+    header = ORDER_HEADER[:1] + contig_lines + ORDER_HEADER[1:]
+    file_a = write_vcf(str(tmp_path / "a.vcf"), header + order_records(contigs_a, "0/1:20"))
+    file_b = write_vcf(str(tmp_path / "b.vcf"), header + order_records(contigs_b, "1|0:20"))
+    outputs = {}
+    for engine in ("dict", "stream"):
+        outputs[engine] = str(tmp_path / f"{engine}.vcf")
+        counts = merge_files(file_a, file_b, outputs[engine], engine=engine)
+        assert counts["replaced_genotypes"] == 4
+    assert read_lines(outputs["stream"]) == read_lines(outputs["dict"])
+    assert [line for line in read_lines(outputs["stream"]) if not line.startswith('#')] == order_records(contigs_a, "1|0:20")
+    # A is sorted, only B may be sorted again
+    assert file_a not in capsys.readouterr().err
+
+def test_jobs_keep_order_of_a(tmp_path):
+    # cX has no ##contig line and is merged between the listed contigs, as A holds it
+    header = ORDER_HEADER[:1] + ["##contig=<ID=c1>\n", "##contig=<ID=c2>\n"] + ORDER_HEADER[1:]
+    file_a = write_vcf(str(tmp_path / "a.vcf.gz"), header + order_records(["c1", "cX", "c2"], "0/1:20"))
+    file_b = write_vcf(str(tmp_path / "b.vcf.gz"), header + order_records(["c1", "cX", "c2"], "1|0:20"))
+    output = str(tmp_path / "out.vcf.gz")
+    counts = run_merge(file_a, file_b, output, "--jobs", "3")
+    assert counts["replaced_genotypes"] == 6
+    assert [line for line in read_lines(output) if not line.startswith('#')] == order_records(["c1", "cX", "c2"], "1|0:20")
+
+@pytest.mark.parametrize("engine", engine_params())
+def test_cache(tmp_path, expected_lines, engine):
+    for run in range(2):
+        # the first run adds B to the cache, the second reads it from there
+        output = str(tmp_path / f"out{run}.vcf")
+        counts = run_merge(FILE_A, FILE_B, output, "--engine", engine, "--cache-dir", str(tmp_path / "cache"))
+        assert read_lines(output) == expected_lines
+        check_counts(counts)
+
+@pytest.mark.parametrize("unsorted", ["a", "b"])
+def test_stream_sorts_unsorted_input(tmp_path, capsys, expected_lines, unsorted):
+    files = {"a": FILE_A, "b": FILE_B}
+    lines = read_lines(files[unsorted])
+    header = [line for line in lines if line.startswith('#')]
+    body = [line for line in lines if not line.startswith('#')]
+    random.Random(1).shuffle(body)
+    files[unsorted] = write_vcf(str(tmp_path / f"{unsorted}.vcf"), header + body)
+    output = str(tmp_path / "out.vcf")
+    # a small buffer makes the external sort spill several runs
+    counts = merge_files(files["a"], files["b"], output, engine="stream", sort_buffer=4096, sort_dir=str(tmp_path))
+    assert read_lines(output) == expected_lines
+    check_counts(counts)
+    # only the unsorted input is sorted
+    err = capsys.readouterr().err
+    assert err.count("INFO:") == 1 and f"INFO: {files[unsorted]} is not sorted" in err
+    # without a sink, replace_genotypes repeats the merge itself
+    content = replace_genotypes(files["a"], files["b"], engine="stream", write_header=True, sort_buffer=4096, sort_dir=str(tmp_path))
+    assert content.splitlines(True) == expected_lines
+
+DUPLICATE_HEADER = [
+    "##fileformat=VCFv4.2\n",
+    "##contig=<ID=c1,length=1000>\n",
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n',
+    '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read depth">\n',
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n",
+]
+
+@pytest.mark.parametrize("engine", engine_params())
+def test_duplicate_positions(tmp_path, engine):
+    # B holds an indel next to a SNP and repeats a record: A takes the genotype with its alleles, the last repeat wins
+    file_a = write_vcf(str(tmp_path / "a.vcf"), DUPLICATE_HEADER + [
+        "c1\t10\t.\tC\tT\t50\t.\t.\tGT:DP\t0/1:20\n",
+        "c1\t20\t.\tA\tG\t50\t.\t.\tGT:DP\t0/1:20\n",
+        "c1\t30\t.\tC\tT\t50\t.\t.\tGT:DP\t0/1:20\n",
+    ])
+    file_b = write_vcf(str(tmp_path / "b.vcf"), DUPLICATE_HEADER + [
+        "c1\t10\t.\tC\tT\t.\t.\t.\tGT\t1|0\n",
+        "c1\t20\t.\tAT\tA\t.\t.\t.\tGT\t1|1\n",
+        "c1\t20\t.\tA\tG\t.\t.\t.\tGT\t0|1\n",
+        "c1\t30\t.\tC\tT\t.\t.\t.\tGT\t0|1\n",
+        "c1\t30\t.\tC\tT\t.\t.\t.\tGT\t1|0\n",
+    ])
+    output = str(tmp_path / "out.vcf")
+    counts = run_merge(file_a, file_b, output, "--engine", engine)
+    assert [line for line in read_lines(output) if not line.startswith('#')] == [
+        "c1\t10\t.\tC\tT\t50\t.\t.\tGT:DP\t1|0:20\n",
+        "c1\t20\t.\tA\tG\t50\t.\t.\tGT:DP\t0|1:20\n",
+        "c1\t30\t.\tC\tT\t50\t.\t.\tGT:DP\t1|0:20\n",
+    ]
+    assert counts["replaced_genotypes"] == 3
+    assert counts["dropped_duplicates"] == 1
+    assert counts["ambiguous_duplicates"] == 0
+
+@pytest.mark.parametrize("engine", engine_params())
+def test_duplicate_alleles(tmp_path, engine):
+    # an indel next to a SNP in A: only the record of A with the alleles of B takes its genotype
+    file_a = write_vcf(str(tmp_path / "a.vcf"), DUPLICATE_HEADER + [
+        "c1\t10\t.\tC\tT\t50\t.\t.\tGT:DP\t0/1:20\n",
+        "c1\t20\t.\tAT\tA\t50\t.\t.\tGT:DP\t0/1:20\n",
+        "c1\t20\t.\tA\tG\t50\t.\t.\tGT:DP\t0/1:20\n",
+    ])
+    file_b = write_vcf(str(tmp_path / "b.vcf"), DUPLICATE_HEADER + [
+        "c1\t10\t.\tC\tT\t.\t.\t.\tGT\t1|0\n",
+        "c1\t20\t.\tA\tG\t.\t.\t.\tGT\t0|1\n",
+    ])
+    output = str(tmp_path / "out.vcf")
+    counts = run_merge(file_a, file_b, output, "--engine", engine)
+    assert [line for line in read_lines(output) if not line.startswith('#')] == [
+        "c1\t10\t.\tC\tT\t50\t.\t.\tGT:DP\t1|0:20\n",
+        "c1\t20\t.\tAT\tA\t50\t.\t.\tGT:DP\t0/1:20\n",
+        "c1\t20\t.\tA\tG\t50\t.\t.\tGT:DP\t0|1:20\n",
+    ]
+    assert counts["replaced_genotypes"] == 2
+    assert counts["kept_genotypes"] == 1
+    assert counts["ambiguous_duplicates"] == 1
+
+@requires_pysam
+@pytest.mark.parametrize("engine", ["dict", "stream"])
+def test_pysam_backend(tmp_path, bgzf_pair, engine):
+    output = str(tmp_path / "out.vcf.gz")
+    counts = run_merge(*bgzf_pair, output, "--engine", engine, "--backend", "pysam")
+    assert records(output) == records(EXPECTED)
+    check_counts(counts)
+
+@requires_pysam
+def test_pysam_backend_falls_back_for_gzip(tmp_path, expected_lines):
+    # htslib cannot seek in plain gzip, so the python backend merges the test pair
+    output = str(tmp_path / "out.vcf.gz")
+    counts = run_merge(FILE_A, FILE_B, output, "--backend", "pysam")
+    assert read_lines(output) == expected_lines
+    check_counts(counts)
+
+def to_bcf(tmp_path, file_paths):
+    """
+    Converts VCF files to BCF files in tmp_path.
+
+    Returns:
+    - list: The paths to the BCF files.
+    """
+    paths = []
+    for index, path in enumerate(file_paths):
+        paths.append(str(tmp_path / f"{index}.bcf"))
+        with pysam.VariantFile(path) as source, pysam.VariantFile(paths[-1], 'wb', header=source.header) as target:
+            for record in source:
+                target.write(record)
+    return paths
+
+@requires_pysam
+@pytest.mark.parametrize("engine", ["dict", "stream"])
+def test_bcf_round_trip(tmp_path, bgzf_pair, engine):
+    output = str(tmp_path / "out.bcf")
+    counts = run_merge(*to_bcf(tmp_path, bgzf_pair), output, "--engine", engine)
+    assert records(output) == records(EXPECTED)
+    check_counts(counts)
+
+@requires_pysam
+def test_bcf_write_block(tmp_path, bgzf_pair):
+    # a block of records is written and indexed like the same records written one by one
+    header, records = read_bcf_stream(to_bcf(tmp_path, bgzf_pair)[0])
+    data = [fields[0] for _, fields in records]
+    outputs = []
+    for write in ("write", "write_block"):
+        content, indexer = io.BytesIO(), TabixIndexer("csi", bcf=True)
+        with BcfWriter(content, indexer=indexer) as writer:
+            writer.write_header(header)
+            if write == "write":
+                for record in data:
+                    writer.write(record)
+            else:
+                writer.write_block(b''.join(data))
+        index_path = str(tmp_path / f"{write}.csi")
+        indexer.write(index_path, lambda offset: offset)
+        with open(index_path, 'rb') as index:
+            outputs.append((content.getvalue(), index.read()))
+    assert outputs[0] == outputs[1]
+
+@requires_pysam
+@requires_numpy
+def test_block_engine_rejects_bcf(tmp_path, bgzf_pair):
+    output = str(tmp_path / "out.vcf.gz")
+    assert "BCF" in run_merge(*to_bcf(tmp_path, bgzf_pair), output, "--engine", "block", error=True)
+    assert not os.path.exists(output)
@@ -0,0 +1,75 @@
+"""
+License: MIT
+
+Tests of the tabix and CSI indices written while a BGZF output is written and read back by VcfIndex.
+"""
+
+import pytest
+
+from bgzf import BgzfReader
+from vcf_index import VcfIndex, find_index, concat_bgzf
+from vcf_reader import read_vcf_stream
+from conftest import FILE_A, read_lines, write_vcf
+
+def body_lines(lines):
+    return [line for line in lines if not line.startswith('#')]
+
+def read_from(file_path, virtual_offset, count):
+    """
+    Returns count lines read from a virtual offset of a BGZF file.
+    """
+    reader = BgzfReader(file_path)
+    reader.seek_virtual(virtual_offset)
+    data = b''
+    while data.count(b'\n') < count:
+        chunk = reader.read(65536)
+        if not chunk:
+            break
+        data += chunk
+    reader.close()
+    return [line + '\n' for line in data.decode().split('\n')[:count]]
+
+@pytest.mark.parametrize("index_format", ["tbi", "csi"])
+def test_index_round_trip(tmp_path, index_format):
+    lines = read_lines(FILE_A)
+    body = body_lines(lines)
+    path = write_vcf(str(tmp_path / "a.vcf.gz"), lines, index_format)
+    index = VcfIndex(f"{path}.{index_format}")
+    assert index.csi == (index_format == "csi")
+    assert list(index.refs) == ["chr28"]
+    assert find_index(path).csi == index.csi
+
+    for record in (0, 100, len(body) - 1):
+        pos = int(body[record].split('\t')[1])
+        offset = index.start_offset("chr28", pos - 1, pos)
+        assert offset is not None
+        # the first record at or after the start offset that overlaps the position is the record itself
+        candidates = read_from(path, offset, len(body))
+        assert body[record] in candidates
+        assert all(int(line.split('\t')[1]) < pos for line in candidates[:candidates.index(body[record])])
+    assert index.start_offset("chr1", 0, 1000) is None
+
+@pytest.mark.parametrize("index_format", ["tbi", "csi"])
+def test_region_read(tmp_path, index_format):
+    lines = read_lines(FILE_A)
+    path = write_vcf(str(tmp_path / "a.vcf.gz"), lines, index_format)
+    _, records = read_vcf_stream(path, regions=[("chr28", 20_000, 50_000)])
+    expected = [line for line in body_lines(lines) if 20_000 <= int(line.split('\t')[1]) <= 50_000]
+    assert expected
+    assert [fields[0] for _, fields in records] == expected
+
+@pytest.mark.parametrize("index_format", ["tbi", "csi"])
+def test_concat_combines_indices(tmp_path, index_format):
+    lines = read_lines(FILE_A)
+    header = [line for line in lines if line.startswith('#')]
+    body = body_lines(lines)
+    half = len(body) // 2
+    chunks = [write_vcf(str(tmp_path / "chunk1.vcf.gz"), header + body[:half], index_format),
+              write_vcf(str(tmp_path / "chunk2.vcf.gz"), body[half:], index_format)]
+    output = str(tmp_path / "out.vcf.gz")
+    concat_bgzf(chunks, output, index_format)
+    assert read_lines(output) == lines
+
+    pos = int(body[half].split('\t')[1])
+    index = VcfIndex(f"{output}.{index_format}")
+    assert body[half] in read_from(output, index.start_offset("chr28", pos - 1, pos), len(body))
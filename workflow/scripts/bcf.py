@@ -0,0 +1,310 @@
+"""
+License: MIT
+
+Reading and writing of BCF 2.2. Only CHROM, POS, REF, ALT and the GT of one sample are decoded; a record is 
+otherwise kept as the bytes it was read as, so that the phased genotype of B can be written over the GT values 
+of A without re-encoding the record.
+"""
+
+import sys
+import gzip
+import re
+import struct
+
+from regions import CONTIG_ID_PATTERN
+from vcf_writers import DEFAULT_BUFFER_SIZE, VcfWriter
+
+# BCF 2.2: magic and version of the header, fixed part of each record (l_shared, l_indiv, CHROM, POS, rlen, QUAL, 
+# n_allele << 16 | n_info, n_fmt << 24 | n_sample), size and struct code of each type of typed values
+BCF_MAGIC = b'BCF\x02'
+BCF_VERSION = b'\x02'
+BCF_RECORD = struct.Struct('<IIiiifII')
+BCF_TYPE_SIZES = (0, 1, 2, 4, 0, 4, 0, 1)
+BCF_INT_CODES = {1: 'b', 2: 'h', 4: 'i'}
+# the "end of vector" value that pads the GT of a lower ploidy, by integer size
+BCF_VECTOR_END = {1: -127, 2: -32767, 4: -2147483647}
+BCF_LENGTHS = struct.Struct('<II')
+BCF_IDX_PATTERN = re.compile(r'[<,]IDX=(\d+)')
+# number of decompressed bytes of a BCF file sliced into records at once
+BCF_CHUNK_SIZE = 1 << 20
+
+# genotypes of the GT values of BCF records and the other way round, decoded or encoded once each
+_BCF_GENOTYPES = {}
+_BCF_GENOTYPE_VALUES = {}
+
+def is_bcf(file_path):
+    """
+    Checks whether a file is BCF, compressed with bgzip or not, by the magic at its start.
+    """
+    with open(file_path, 'rb') as file:
+        magic = file.read(len(BCF_MAGIC))
+    if magic[:2] == b'\x1f\x8b':
+        with gzip.open(file_path, 'rb') as file:
+            magic = file.read(len(BCF_MAGIC))
+    return magic == BCF_MAGIC
+
+class BcfWriter(VcfWriter):
+    """
+    Collects the records of a BCF file A, see read_bcf_stream, and writes them to an open binary file in batches 
+    like a VcfWriter. The header lines are written through write_header, which encodes them as a BCF header. 
+    Records are indexed by the contig index, position and reference length of their fixed part.
+
+    Args:
+    - file (file object): The open output file, BGZF-compressed for a BCF file.
+    - buffer_size (int): Number of bytes to collect before writing them in one batch.
+    - indexer (TabixIndexer): A TabixIndexer for BCF that receives every record with its offsets, if given.
+    """
+    def __init__(self, file, buffer_size=DEFAULT_BUFFER_SIZE, indexer=None):
+        super().__init__(file, buffer_size, indexer)
+        self._separator = b''
+
+    def write_header(self, lines):
+        text = ''.join(lines).encode() + b'\0'
+        header = b''.join((BCF_MAGIC, BCF_VERSION, struct.pack('<I', len(text)), text))
+        if self.indexer is not None:
+            # the ##contig lines decide the depth of the CSI index
+            for line in lines:
+                self.indexer.add(line, 0, 0)
+        self._lines.append(header)
+        self._size += len(header)
+        self.offset += len(header)
+
+    def write(self, record):
+        self._lines.append(record)
+        self._size += len(record)
+        if self.indexer is not None:
+            _, _, contig, pos, rlen = struct.unpack_from('<IIiii', record)
+            self.indexer.add_interval(contig, pos, pos + max(rlen, 1), self.offset, self.offset + len(record))
+            self.offset += len(record)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def write_block(self, data):
+        """
+        Writes any number of complete BCF records, split by the lengths at the start of each record, so that 
+        every record is indexed.
+        """
+        offset = 0
+        while offset < len(data):
+            shared, indiv = struct.unpack_from('<II', data, offset)
+            end = offset + 8 + shared + indiv
+            self.write(data[offset:end])
+            offset = end
+
+class BcfHeader:
+    """
+    The dictionaries of a BCF header, through which BCF records refer to contigs and fields: contigs are numbered 
+    in the order of the ##contig lines, the IDs of FILTER, INFO and FORMAT lines in order of first appearance 
+    after PASS. An IDX field of a header line gives the number explicitly.
+
+    Args:
+    - header (list): The header lines.
+    """
+    def __init__(self, header):
+        self.contigs = {}
+        self.strings = {'PASS': 0}
+        for line in header:
+            if not line.startswith(('##contig=<', '##FILTER=<', '##INFO=<', '##FORMAT=<')):
+                continue
+            name, idx = CONTIG_ID_PATTERN.search(line), BCF_IDX_PATTERN.search(line)
+            if name is None:
+                continue
+            if line.startswith('##contig='):
+                self.contigs[int(idx.group(1)) if idx else len(self.contigs)] = name.group(1)
+            elif name.group(1) not in self.strings:
+                self.strings[name.group(1)] = int(idx.group(1)) if idx else len(self.strings)
+        self.contig_ids = {name: i for i, name in self.contigs.items()}
+
+def read_bcf_header(file, file_path):
+    """
+    Reads the header of a BCF file from an open binary stream, which is left at the first record.
+
+    Args:
+    - file (file object): The BCF file, opened in binary mode.
+    - file_path (str): The path to the BCF file, for error messages.
+
+    Returns:
+    - list: The header lines.
+    """
+    magic = file.read(len(BCF_MAGIC) + len(BCF_VERSION))
+    if magic[:len(BCF_MAGIC)] != BCF_MAGIC:
+        sys.exit(f"Error: {file_path} is not a BCF file")
+    l_text, = struct.unpack('<I', file.read(4))
+    return file.read(l_text).rstrip(b'\0').decode().splitlines(True)
+
+def bcf_typed(data, offset):
+    """
+    Reads the type descriptor of a typed value of a BCF record.
+
+    Returns:
+    - tuple: The type, the number of values and the offset of the first value.
+    """
+    descriptor = data[offset]
+    count = descriptor >> 4
+    offset += 1
+    if count == 15:
+        # the number of values follows as a typed integer
+        size = BCF_TYPE_SIZES[data[offset] & 15]
+        count = int.from_bytes(data[offset + 1:offset + 1 + size], 'little', signed=True)
+        offset += 1 + size
+    return descriptor & 15, count, offset
+
+def bcf_genotype(values, size):
+    """
+    Formats the GT values of one sample of a BCF record as in a VCF line, e.g. the values 2, 5 as "0|1". 
+    Each value is (allele + 1) << 1, 0 for a missing allele, with the lowest bit set if the allele is phased.
+
+    Args:
+    - values (bytes): The GT values of the sample.
+    - size (int): The size of each value in bytes.
+
+    Returns:
+    - str: The genotype.
+    """
+    key = (values, size)
+    genotype = _BCF_GENOTYPES.get(key)
+    if genotype is None:
+        alleles = []
+        for value in struct.unpack(f'<{len(values) // size}{BCF_INT_CODES[size]}', values):
+            if value == BCF_VECTOR_END[size]:
+                break
+            if alleles:
+                alleles.append('|' if value & 1 else '/')
+            alleles.append(str((value >> 1) - 1) if value > 1 else '.')
+        genotype = _BCF_GENOTYPES[key] = ''.join(alleles) or '.'
+    return genotype
+
+def bcf_genotype_values(genotype, size, count):
+    """
+    Encodes a phased genotype, e.g. "0|1", as the GT values of one sample of a BCF record, see bcf_genotype.
+
+    Args:
+    - genotype (str): The phased genotype.
+    - size (int): The size of each value in bytes.
+    - count (int): The number of values of each sample, the ploidy of the record.
+
+    Returns:
+    - bytes: The GT values, padded to count values.
+    """
+    key = (genotype, size, count)
+    values = _BCF_GENOTYPE_VALUES.get(key)
+    if values is None:
+        alleles = [int(allele) for allele in genotype.split('|')]
+        if len(alleles) > count:
+            sys.exit(f"Error: Genotype {genotype!r} of file B has more alleles than the GT of the BCF record of file A")
+        codes = [(alleles[0] + 1) << 1] + [(allele + 1) << 1 | 1 for allele in alleles[1:]]
+        codes.extend([BCF_VECTOR_END[size]] * (count - len(codes)))
+        values = _BCF_GENOTYPE_VALUES[key] = struct.pack(f'<{count}{BCF_INT_CODES[size]}', *codes)
+    return values
+
+def bcf_record_parser(header, column=0):
+    """
+    Returns the function that decodes a BCF record into the form of parse_vcf_line. Only CHROM, POS, REF, ALT 
+    and the GT of one sample are decoded; the rest of the record is kept as the bytes it was read as. 
+    The sample offset is the offset of the GT values of the sample in the record, their size and their number.
+
+    Args:
+    - header (BcfHeader): The dictionaries of the BCF header.
+    - column (int): The sample to take the genotype from, 0 for the first.
+
+    Returns:
+    - callable: Takes a BCF record and returns the genomic coordinate and a tuple of (record, ref, alt, format_genotype, sample_offset).
+    """
+    contigs, gt_key, unpack = header.contigs, header.strings.get('GT'), BCF_RECORD.unpack_from
+    # the usual GT of an int8 key followed by int8 values, and the genotypes of its values
+    gt_descriptor = bytes((0x11, gt_key)) if gt_key is not None and gt_key < 128 else None
+    genotypes = {}
+
+    def parse(record):
+        l_shared, _, chrom, pos, _, _, n_allele_info, n_fmt_sample = unpack(record)
+        coordinate = (contigs[chrom], pos + 1)
+        # ID, then REF and the ALT alleles as typed strings, read inline unless longer than 14 characters
+        offset = 32
+        descriptor = record[offset]
+        if descriptor < 0xf0:
+            offset += 1 + (descriptor >> 4)
+        else:
+            _, count, offset = bcf_typed(record, offset)
+            offset += count
+        n_allele = n_allele_info >> 16
+        descriptor = record[offset]
+        if n_allele == 2 and descriptor < 0xf0 and record[offset + 1 + (descriptor >> 4)] < 0xf0:
+            # a biallelic record with short alleles
+            end = offset + 1 + (descriptor >> 4)
+            ref, alt = record[offset + 1:end], record[end + 1:end + 1 + (record[end] >> 4)]
+        else:
+            alleles = []
+            for _ in range(n_allele):
+                _, count, offset = bcf_typed(record, offset)
+                alleles.append(record[offset:offset + count])
+                offset += count
+            ref, alt = alleles[0], b','.join(alleles[1:]) if n_allele > 1 else b'.'
+        ref, alt = ref.decode(), alt.decode()
+
+        # FORMAT fields: a typed key, a type descriptor and the values of every sample
+        n_sample = n_fmt_sample & 0xffffff
+        offset = 8 + l_shared
+        if record[offset:offset + 2] == gt_descriptor and column < n_sample and record[offset + 2] < 0xf0:
+            count = record[offset + 2] >> 4
+            if record[offset + 2] & 15 == 1:
+                start = offset + 3 + column * count
+                values = record[start:start + count]
+                genotype = genotypes.get(values)
+                if genotype is None:
+                    genotype = genotypes[values] = bcf_genotype(values, 1)
+                return coordinate, (record, ref, alt, genotype, (start, 1, count))
+        for _ in range(n_fmt_sample >> 24):
+            kind, _, offset = bcf_typed(record, offset)
+            size = BCF_TYPE_SIZES[kind]
+            key = int.from_bytes(record[offset:offset + size], 'little', signed=True)
+            kind, count, offset = bcf_typed(record, offset + size)
+            width = BCF_TYPE_SIZES[kind] * count
+            if key == gt_key and column < n_sample:
+                start = offset + column * width
+                genotype = bcf_genotype(record[start:start + width], BCF_TYPE_SIZES[kind])
+                return coordinate, (record, ref, alt, genotype, (start, BCF_TYPE_SIZES[kind], count))
+            offset += n_sample * width
+        return coordinate, (record, ref, alt, '.', None)
+    return parse
+
+def parse_bcf_genotypes(record, sample_offset, columns):
+    """
+    Reads the genotypes of some samples of a BCF record, see parse_sample_genotypes.
+
+    Args:
+    - record (bytes): A BCF record.
+    - sample_offset (tuple): The sample offset of the first sample, as returned by bcf_record_parser.
+    - columns (list): The samples, 0 for the first.
+
+    Returns:
+    - list: The genotype of every requested sample.
+    """
+    if sample_offset is None:
+        return ['.'] * len(columns)
+    start, size, count = sample_offset
+    width = size * count
+    return [bcf_genotype(record[start + column * width:start + (column + 1) * width], size) for column in columns]
+
+def iter_bcf_records(file, parse):
+    # records are sliced from chunks of the decompressed stream, each starts with l_shared and l_indiv
+    with file:
+        data, pos, size = b'', 0, 0
+        unpack = BCF_LENGTHS.unpack_from
+        while True:
+            if size - pos >= 8:
+                l_shared, l_indiv = unpack(data, pos)
+                end = pos + 8 + l_shared + l_indiv
+                if end <= size:
+                    yield parse(data[pos:end])
+                    pos = end
+                    continue
+                need = end - pos
+            else:
+                need = 8
+            chunk = file.read(max(BCF_CHUNK_SIZE, need))
+            if not chunk:
+                if pos < size:
+                    sys.exit("Error: Truncated BCF record at the end of the file")
+                return
+            data, pos = data[pos:] + chunk, 0
+            size = len(data)
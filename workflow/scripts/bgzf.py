@@ -0,0 +1,242 @@
+"""
+License: MIT
+
+Reading and writing of BGZF, the blocked gzip format of bgzip. Blocks are inflated and deflated in a thread 
+pool shared by all streams of a process, with IO_THREADS workers.
+"""
+
+import io
+import os
+import gzip
+import zlib
+import struct
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# number of threads used to inflate and deflate BGZF blocks
+IO_THREADS = 1
+
+# uncompressed size of a BGZF block as written by bgzip, small enough that every block stays below 64 KiB compressed
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_HEADER = struct.Struct('<4BI2BH2BHH')
+BGZF_FOOTER = struct.Struct('<II')
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+_THREAD_POOL = None
+_THREAD_POOL_PID = None
+
+def thread_pool():
+    """
+    Returns the thread pool shared by all BGZF streams of this process, with IO_THREADS workers.
+    """
+    global _THREAD_POOL, _THREAD_POOL_PID
+    if _THREAD_POOL is None or _THREAD_POOL_PID != os.getpid():
+        _THREAD_POOL = ThreadPoolExecutor(IO_THREADS)
+        _THREAD_POOL_PID = os.getpid()
+    return _THREAD_POOL
+
+def is_bgzf(file_path):
+    """
+    Checks whether a file starts with a BGZF block, i.e. it was compressed with bgzip.
+
+    Args:
+    - file_path (str): The path to the file.
+
+    Returns:
+    - bool: True for BGZF files, False for plain gzip or other files.
+    """
+    with open(file_path, 'rb') as file:
+        header = file.read(BGZF_HEADER.size)
+    if len(header) < BGZF_HEADER.size:
+        return False
+    magic1, magic2, method, flags, _, _, _, xlen, si1, si2, _, _ = BGZF_HEADER.unpack(header)
+    return (magic1, magic2, method) == (31, 139, 8) and flags & 4 and xlen == 6 and (si1, si2) == (66, 67)
+
+def compress_block(data, level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+    Compresses up to BGZF_BLOCK_SIZE bytes into one BGZF block.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = BGZF_HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(cdata) + BGZF_HEADER.size + BGZF_FOOTER.size - 1)
+    return header + cdata + BGZF_FOOTER.pack(zlib.crc32(data), len(data))
+
+def decompress_block(block):
+    """
+    Decompresses one BGZF block including its header and footer.
+    """
+    data = zlib.decompress(block[BGZF_HEADER.size:-BGZF_FOOTER.size], -15)
+    crc, size = BGZF_FOOTER.unpack(block[-BGZF_FOOTER.size:])
+    if len(data) != size or zlib.crc32(data) != crc:
+        raise OSError("Corrupt BGZF block: CRC or size mismatch")
+    return data
+
+class BgzfReader(io.RawIOBase):
+    """
+    Reads a BGZF file, inflating blocks ahead of the consumer in the shared thread pool.
+
+    Args:
+    - file_path (str): The path to the BGZF file.
+    - threads (int): Number of threads to use, defaults to IO_THREADS.
+    """
+    def __init__(self, file_path, threads=None):
+        self.threads = threads or IO_THREADS
+        self._file = open(file_path, 'rb')
+        self._pending = deque()
+        self._block = b''
+        self._block_offset = 0
+
+    def readable(self):
+        return True
+
+    def _read_raw_block(self):
+        header = self._file.read(BGZF_HEADER.size)
+        if not header:
+            return None
+        if len(header) < BGZF_HEADER.size:
+            raise OSError("Truncated BGZF block header")
+        fields = BGZF_HEADER.unpack(header)
+        if fields[:4] != (31, 139, 8, 4) or fields[7:10] != (6, 66, 67):
+            raise OSError("Not a BGZF file or unsupported extra field layout")
+        rest = self._file.read(fields[11] + 1 - BGZF_HEADER.size)
+        return header + rest
+
+    def _next_block(self):
+        if self.threads == 1:
+            block = self._read_raw_block()
+            return None if block is None else decompress_block(block)
+        # keep a few blocks per thread in flight
+        while len(self._pending) < 4 * self.threads:
+            block = self._read_raw_block()
+            if block is None:
+                break
+            self._pending.append(thread_pool().submit(decompress_block, block))
+        if not self._pending:
+            return None
+        return self._pending.popleft().result()
+
+    def readinto(self, buffer):
+        while self._block_offset >= len(self._block):
+            block = self._next_block()
+            if block is None:
+                return 0
+            self._block, self._block_offset = block, 0
+        size = min(len(buffer), len(self._block) - self._block_offset)
+        buffer[:size] = self._block[self._block_offset:self._block_offset + size]
+        self._block_offset += size
+        return size
+
+    def seek_virtual(self, virtual_offset):
+        """
+        Moves the reader to a BGZF virtual offset as found in tabix and CSI indices.
+        """
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._file.seek(virtual_offset >> 16)
+        self._block = self._next_block() or b''
+        self._block_offset = virtual_offset & 0xffff
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            self._file.close()
+        super().close()
+
+class BgzfWriter(io.RawIOBase):
+    """
+    Writes a BGZF file, deflating full blocks in the shared thread pool. 
+    Blocks are written in order and the file ends with the BGZF EOF marker.
+
+    Args:
+    - file_path (str): The path to the output file.
+    - threads (int): Number of threads to use, defaults to IO_THREADS.
+    - level (int): The zlib compression level.
+    """
+    def __init__(self, file_path, threads=None, level=zlib.Z_DEFAULT_COMPRESSION):
+        self.threads = threads or IO_THREADS
+        self.level = level
+        self._file = open(file_path, 'wb')
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._offset = 0
+        # compressed offset of every written block, all blocks but the last hold BGZF_BLOCK_SIZE bytes
+        self.block_offsets = array('q')
+
+    def writable(self):
+        return True
+
+    def _write_block(self, block):
+        self.block_offsets.append(self._offset)
+        self._file.write(block)
+        self._offset += len(block)
+
+    def _submit(self, data):
+        if self.threads == 1:
+            self._write_block(compress_block(data, self.level))
+            return
+        self._pending.append(thread_pool().submit(compress_block, data, self.level))
+        # bound the number of blocks in flight
+        while len(self._pending) > 2 * self.threads:
+            self._write_block(self._pending.popleft().result())
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= BGZF_BLOCK_SIZE:
+            view = memoryview(self._buffer)
+            start = 0
+            while len(self._buffer) - start >= BGZF_BLOCK_SIZE:
+                self._submit(bytes(view[start:start + BGZF_BLOCK_SIZE]))
+                start += BGZF_BLOCK_SIZE
+            view.release()
+            del self._buffer[:start]
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_block(self._pending.popleft().result())
+            self._file.write(BGZF_EOF)
+            self._file.close()
+        super().close()
+
+    def virtual_offset(self, offset):
+        """
+        Converts an offset in the uncompressed stream into a BGZF virtual offset. 
+        Only valid for data that has already been written to disk.
+        """
+        block, within = divmod(offset, BGZF_BLOCK_SIZE)
+        if block < len(self.block_offsets):
+            return self.block_offsets[block] << 16 | within
+        return self._offset << 16
+
+def open_file(file_path, _mode='rt'):
+    """
+    Opens a file, handling both regular and gzipped files. 
+    Gzipped and BCF output is written as BGZF, bgzip-compressed input is read block-parallel with IO_THREADS threads.
+
+    Args:
+    - file_path (str): The path to the file.
+
+    Returns:
+    - file object: An open file object.
+    """
+    if file_path.endswith(('.gz', '.bcf')):
+        if 'w' in _mode:
+            file = io.BufferedWriter(BgzfWriter(file_path), BGZF_BLOCK_SIZE)
+        elif is_bgzf(file_path):
+            file = io.BufferedReader(BgzfReader(file_path), BGZF_BLOCK_SIZE)
+        elif file_path.endswith('.gz'):
+            return gzip.open(file_path, _mode)
+        else:
+            # uncompressed BCF
+            return open(file_path, _mode)
+        return file if 'b' in _mode else io.TextIOWrapper(file)
+    else:
+        return open(file_path, _mode)
@@ -0,0 +1,545 @@
+"""
+License: MIT
+
+The block engine (requires NumPy): A and B are tokenized in large blocks of bytes with array operations, B is 
+held in sorted arrays per contig and the records of each block of A are matched against them with a vectorized join.
+"""
+
+import io
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import merge_events
+from merge_events import EVENT_LOGGER
+from bgzf import BGZF_BLOCK_SIZE, BgzfReader, open_file
+from vcf_index import find_index
+from bcf import is_bcf
+from vcf_reader import read_vcf_header, sample_column
+from phased_index import PHASED_GENOTYPES
+from record_merge import ALLOWED_GENOTYPES, ALLOWED_PHASED_GENOTYPES
+
+# number of bytes of file A or B tokenized at once by the block engine, a few 100k records of a typical VCF
+DEFAULT_BLOCK_SIZE = 1 << 26
+
+# the phased genotypes of B by their 2-bit code, as spliced into lines of A
+PHASED_GENOTYPES_BYTES = tuple(genotype.encode() for genotype in PHASED_GENOTYPES)
+
+def splice_genotype_bytes(line, sample_offset, genotype):
+    """
+    Replaces the sample column of a line of the block engine by a genotype followed by the other FORMAT fields 
+    of the column, in the same way as inject_genotype.
+
+    Args:
+    - line (bytes): The line from file A.
+    - sample_offset (int): The offset of the sample column in the line.
+    - genotype (bytes): The genotype from file B.
+
+    Returns:
+    - bytes: The modified line.
+    """
+    line = line.rstrip()
+    end = line.find(b'\t', sample_offset)
+    if end < 0:
+        end = len(line)
+    format_other = line[sample_offset:end].partition(b':')[2]
+    if format_other.find(b':') >= 0:
+        format_other = format_other.replace(b':', b'')
+    return b''.join((line[:sample_offset], genotype, b':', format_other, line[end:], b'\n'))
+
+def translate_newlines(data):
+    """
+    Converts CRLF and CR line endings into LF, as reading in text mode does.
+    """
+    if data.find(b'\r') >= 0:
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return data
+
+def gather_segments(buffer, starts, lengths):
+    """
+    Concatenates the segments buffer[starts[i]:starts[i] + lengths[i]] of a NumPy array into one array.
+    """
+    offsets = np.cumsum(lengths) - lengths
+    return buffer[np.arange(int(lengths.sum())) + np.repeat(starts - offsets, lengths)]
+
+def segments_equal(buffer_a, starts_a, lengths_a, buffer_b, starts_b, lengths_b):
+    """
+    Compares the segments of two NumPy byte arrays pairwise, see gather_segments.
+
+    Returns:
+    - numpy.ndarray: A boolean array, True where both segments hold the same bytes.
+    """
+    equal = lengths_a == lengths_b
+    rows = np.flatnonzero(equal & (lengths_a > 0))
+    if len(rows):
+        lengths = lengths_a[rows]
+        same_bytes = gather_segments(buffer_a, starts_a[rows], lengths) == gather_segments(buffer_b, starts_b[rows], lengths)
+        equal[rows] = np.logical_and.reduceat(same_bytes, np.cumsum(lengths) - lengths)
+    return equal
+
+def parse_integers(buffer, starts, ends):
+    """
+    Parses the decimal numbers buffer[starts[i]:ends[i]] of a NumPy byte array, all digit positions at once.
+
+    Returns:
+    - tuple: The numbers as int64 array and a boolean array that is False where a segment is not a number.
+    """
+    widths = ends - starts
+    # column k holds the k-th digit from the right, numbers of more than 18 digits are rejected
+    width = min(int(widths.max(initial=0)), 18)
+    has_digit = np.arange(width) < widths[:, None]
+    digits = buffer[np.maximum(ends[:, None] - 1 - np.arange(width), 0)] - np.uint8(ord('0'))
+    valid = (widths > 0) & (widths <= 18) & ((digits <= 9) | ~has_digit).all(axis=1)
+    digits[~has_digit] = 0
+    values = digits.astype(np.int64) @ 10 ** np.arange(width, dtype=np.int64)
+    return values, valid
+
+class VcfBlock:
+    """
+    Body lines of a VCF file held in one bytes buffer and tokenized with NumPy for the block engine. 
+    Record i spans data[starts[i]:ends[i] + 1], its first nine tabs are at tabs[i] and the selected sample 
+    column spans data[sample_starts[i]:sample_ends[i]]. The position of each record is parsed into positions 
+    and its contig is contig_names[contig_ids[i]]. Lines starting with '#' are skipped as in iter_vcf_records.
+
+    Args:
+    - data (bytes): Complete lines; a missing newline after the last line is added and noted in unterminated.
+    - column (int): The selected sample column, 0 for the first, see select_sample.
+    """
+    __slots__ = ('data', 'buffer', 'unterminated', 'starts', 'ends', 'tabs', 'all_tabs', 'first_tabs', 'tab_counts', 
+                 'sample_column', 'sample_starts', 'sample_ends', 'positions', 'contig_ids', 'contig_names')
+
+    def __init__(self, data, column=0):
+        self.unterminated = not data.endswith(b'\n')
+        if self.unterminated:
+            data += b'\n'
+        self.data = data
+        buffer = self.buffer = np.frombuffer(data, dtype=np.uint8)
+
+        ends = np.flatnonzero(buffer == ord('\n'))
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        all_tabs = np.flatnonzero(buffer == ord('\t'))
+        # the tabs of line i are all_tabs[first_tabs[i]:first_tabs[i] + tab_counts[i]]
+        first_tabs = np.searchsorted(all_tabs, starts)
+        tab_counts = np.searchsorted(all_tabs, ends) - first_tabs
+        body = buffer[starts] != ord('#')
+        self.starts, self.ends, self.tab_counts = starts[body], ends[body], tab_counts[body]
+        self.all_tabs, self.first_tabs = all_tabs, first_tabs[body]
+
+        short = np.flatnonzero(self.tab_counts < 9)
+        if len(short):
+            sys.exit(f"Error: VCF record with fewer than 10 columns: {self.line(short[0]).decode(errors='replace').rstrip()}")
+        self.tabs = all_tabs[self.first_tabs[:, None] + np.arange(9)]
+        self.select_sample(column)
+
+        self.positions, valid = parse_integers(buffer, self.tabs[:, 0] + 1, self.tabs[:, 1])
+        invalid = np.flatnonzero(~valid)
+        if len(invalid):
+            sys.exit(f"Error: Invalid position in VCF record: {self.line(invalid[0]).decode(errors='replace').rstrip()}")
+        self._set_contigs()
+
+    def _set_contigs(self):
+        # records of a contig follow each other, so names are only decoded where they change
+        n = len(self.starts)
+        widths = self.tabs[:, 0] - self.starts
+        columns = self.starts[:, None] + np.arange(int(widths.max(initial=0)))
+        names = np.where(columns < self.tabs[:, :1], self.buffer[np.minimum(columns, len(self.buffer) - 1)], 0)
+        changes = np.flatnonzero(np.concatenate(([True], (names[1:] != names[:-1]).any(axis=1))))[:n]
+        contig_ids = {}
+        run_ids = [contig_ids.setdefault(self.data[self.starts[i]:self.tabs[i, 0]].decode(), len(contig_ids)) for i in changes.tolist()]
+        self.contig_names = list(contig_ids)
+        self.contig_ids = np.repeat(np.array(run_ids, dtype=np.int64), np.diff(np.append(changes, n)))
+
+    def line(self, i):
+        return self.data[self.starts[i]:self.ends[i] + 1]
+
+    def select_sample(self, column):
+        """
+        Selects the sample column read by genotype_codes, 0 for the first sample.
+        """
+        short = np.flatnonzero(self.tab_counts < 9 + column)
+        if len(short):
+            sys.exit(f"Error: VCF record without sample column {column + 1}: {self.line(short[0]).decode(errors='replace').rstrip()}")
+        self.sample_column = column
+        self.sample_starts = self.tabs[:, 8] + 1 if column == 0 else self.all_tabs[self.first_tabs + 8 + column] + 1
+        # the sample column ends at the next tab or at the end of the line
+        next_tabs = self.all_tabs[np.minimum(self.first_tabs + 9 + column, len(self.all_tabs) - 1)]
+        self.sample_ends = np.where(self.tab_counts > 9 + column, next_tabs, self.ends)
+
+    def genotype_codes(self, rows, separator):
+        """
+        Returns the 2-bit codes (see PHASED_GENOTYPES) of the genotypes of the given records, or 255 for 
+        genotypes other than 0/0, 0/1, 1/0 and 1/1 with the given separator. The genotype ends at the first 
+        colon of the selected sample column; without one, trailing whitespace of a last column is dropped as in parse_vcf_line.
+
+        Args:
+        - rows (numpy.ndarray): The indices of the records.
+        - separator (str): "/" for unphased or "|" for phased genotypes.
+
+        Returns:
+        - numpy.ndarray: The genotype codes as uint8.
+        """
+        buffer = self.buffer
+        last = len(buffer) - 1
+        starts = self.sample_starts[rows]
+        sample_ends = self.sample_ends[rows]
+
+        # a genotype of three characters followed by a colon or by the end of the column is settled at once, 
+        # other sample columns are searched one by one
+        ends = starts + 3
+        settled = (ends == sample_ends) | ((ends < sample_ends) & (buffer[np.minimum(ends, last)] == ord(':')))
+        strip = self.tab_counts[rows] == 9 + self.sample_column
+        for i in np.flatnonzero(~settled).tolist():
+            start, sample_end = int(starts[i]), int(sample_ends[i])
+            colon = self.data.find(b':', start, sample_end)
+            if colon >= 0:
+                ends[i] = colon
+            elif strip[i]:
+                ends[i] = start + len(self.data[start:sample_end].rstrip())
+            else:
+                ends[i] = sample_end
+
+        first = buffer[np.minimum(starts, last)].astype(np.int16) - ord('0')
+        second = buffer[np.minimum(starts + 2, last)].astype(np.int16) - ord('0')
+        valid = (ends - starts == 3) & (buffer[np.minimum(starts + 1, last)] == ord(separator)) & (first >= 0) & (first <= 1) & (second >= 0) & (second <= 1)
+        return np.where(valid, first * 2 + second, 255).astype(np.uint8)
+
+def read_vcf_blocks(file_path, regions=None, block_size=DEFAULT_BLOCK_SIZE, sample=None, column=0):
+    """
+    Opens a VCF file for the block engine and returns its header and a generator over blocks of its body, 
+    see read_vcf_stream. Line endings are converted into LF as in text mode reading.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions.
+    - block_size (int): The number of bytes read per block, extended to the end of the last line.
+    - sample (str): The sample selected in every block, by default the first sample column.
+    - column (int): The sample column selected in every block, instead of looking up sample.
+
+    Returns:
+    - tuple: A list with header lines and a generator of (VcfBlock, rows), where rows holds the indices 
+      of the records of the block to be merged.
+    """
+    if is_bcf(file_path):
+        sys.exit(f"Error: The block engine cannot read the BCF file {file_path}, use the dict or stream engine")
+    if regions is not None:
+        header = read_vcf_header(file_path)
+        if sample is not None:
+            column = sample_column(header, sample, file_path)
+        return header, _iter_region_blocks(file_path, regions, block_size, column)
+
+    file = open_file(file_path, 'rb')
+    header = []
+    first_line = b''
+    for line in file:
+        if not line.startswith(b'#'):
+            first_line = line
+            break
+        header.append(line)
+    header = [translate_newlines(line).decode() for line in header]
+    if sample is not None:
+        column = sample_column(header, sample, file_path)
+    return header, _iter_blocks(file, first_line, block_size, column=column)
+
+def _iter_blocks(file, first_line, block_size, first_block_size=None, column=0):
+    with file:
+        data = first_line + file.read(first_block_size or block_size)
+        while data:
+            if not data.endswith(b'\n'):
+                data += file.readline()
+            # the records at the position of the last line are kept in one block, see merge_blocks
+            start = data.rfind(b'\n', 0, len(data) - 1) + 1
+            tab = data.find(b'\t', data.find(b'\t', start) + 1)
+            following = b''
+            if tab >= 0:
+                prefix = data[start:tab + 1]
+                following = file.readline()
+                while following.startswith(prefix):
+                    data += following
+                    following = file.readline()
+            block = VcfBlock(translate_newlines(data), column)
+            yield block, np.arange(len(block.starts))
+            if first_block_size is not None:
+                first_block_size = min(first_block_size * 2, block_size)
+            data = following + file.read(first_block_size or block_size)
+
+def _iter_region_blocks(file_path, regions, block_size, column=0):
+    index = find_index(file_path)
+    if index is None:
+        print(f"WARNING: {file_path} is not indexed, scanning the whole file for the requested regions", file=sys.stderr)
+        by_contig = {}
+        for contig, start, end in regions:
+            by_contig.setdefault(contig, ([], []))
+            by_contig[contig][0].append(start)
+            by_contig[contig][1].append(end)
+        header, blocks = read_vcf_blocks(file_path, None, block_size, column=column)
+        for block, rows in blocks:
+            keep = np.zeros(len(rows), dtype=bool)
+            for contig_id, contig in enumerate(block.contig_names):
+                if contig in by_contig:
+                    starts, ends = (np.array(bounds, dtype=np.int64) for bounds in by_contig[contig])
+                    group = np.flatnonzero(block.contig_ids == contig_id)
+                    positions = block.positions[group]
+                    i = np.searchsorted(starts, positions, 'right') - 1
+                    keep[group[(i >= 0) & (positions <= ends[np.maximum(i, 0)])]] = True
+            yield block, rows[keep]
+        return
+
+    for contig, start, end in regions:
+        virtual_offset = index.start_offset(contig, start - 1, end)
+        if virtual_offset is None:
+            continue
+        reader = BgzfReader(file_path)
+        reader.seek_virtual(virtual_offset)
+        # small regions are read in small blocks, the block size doubles up to block_size
+        blocks = _iter_blocks(io.BufferedReader(reader, BGZF_BLOCK_SIZE), b'', block_size, min(BGZF_BLOCK_SIZE, block_size), column)
+        for block, rows in blocks:
+            # reading stops at the first record past the region, as in iter_region_records
+            beyond = block.positions > end
+            if contig in block.contig_names:
+                beyond |= block.contig_ids != block.contig_names.index(contig)
+            else:
+                beyond[:] = True
+            stop = np.flatnonzero(beyond)
+            if len(stop):
+                rows = rows[:stop[0]]
+            yield block, rows[block.positions[rows] >= start]
+            if len(stop):
+                break
+        blocks.close()
+
+class PhasedArrays:
+    """
+    The phased genotypes of file B in NumPy arrays per contig for the block engine, see PhasedIndex. 
+    For each contig, positions are sorted and records that share a position are kept next to each other, 
+    unless they also share REF and ALT: then the last one wins. REF and ALT of each record are kept as one 
+    tab-separated segment of a byte array, the genotypes as 2-bit codes or 255 if they are not a phased genotype.
+    """
+    def __init__(self):
+        self.contigs = {}
+        # positions of records replaced by a later record with the same REF and ALT, by contig
+        self.dropped = {}
+        self._parts = {}
+
+    def add(self, block, rows):
+        codes = block.genotype_codes(rows, '|')
+        allele_starts = block.tabs[rows, 2] + 1
+        allele_lengths = block.tabs[rows, 4] - allele_starts
+        contig_ids = block.contig_ids[rows]
+        positions = block.positions[rows]
+        for contig_id, contig in enumerate(block.contig_names):
+            selected = contig_ids == contig_id
+            if selected.any():
+                alleles = gather_segments(block.buffer, allele_starts[selected], allele_lengths[selected])
+                self._parts.setdefault(contig, []).append((positions[selected], codes[selected], allele_lengths[selected], alleles))
+
+    def finish(self):
+        for contig, parts in self._parts.items():
+            positions, codes, allele_lengths, alleles = (np.concatenate(column) for column in zip(*parts))
+            allele_starts = np.cumsum(allele_lengths) - allele_lengths
+            order = np.argsort(positions, kind='stable')
+            positions = positions[order]
+            keep = np.ones(len(positions), dtype=bool)
+            dropped = []
+            shared = np.flatnonzero(positions[1:] == positions[:-1])
+            if len(shared):
+                # records that share a position are rare, their alleles are compared one by one
+                seen = set()
+                for i in np.union1d(shared, shared + 1)[::-1].tolist():
+                    start, length = allele_starts[order[i]], allele_lengths[order[i]]
+                    key = (int(positions[i]), alleles[start:start + length].tobytes())
+                    if key in seen:
+                        keep[i] = False
+                        dropped.append(key[0])
+                    seen.add(key)
+            order = order[keep]
+            self.contigs[contig] = (positions[keep], codes[order], allele_starts[order], allele_lengths[order], alleles)
+            self.dropped[contig] = dropped[::-1]
+        self._parts = {}
+
+def read_phased_arrays(file_path, regions=None, block_size=DEFAULT_BLOCK_SIZE, sample=None):
+    """
+    Reads the phased genotypes of file B block by block into PhasedArrays.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions, or None for all records.
+    - block_size (int): The number of bytes read per block.
+    - sample (str): The sample to read, by default the first sample column.
+
+    Returns:
+    - PhasedArrays: The phased genotypes by contig.
+    """
+    index = PhasedArrays()
+    header, blocks = read_vcf_blocks(file_path, regions, block_size, sample=sample)
+    for block, rows in blocks:
+        index.add(block, rows)
+    index.finish()
+    return index
+
+def read_phased_arrays_by_sample(file_path, samples, regions=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Reads the phased genotypes of several samples of a multi-sample file B in one pass, into one PhasedArrays 
+    per sample. Every block is tokenized once and its sample columns are selected one after another.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - samples (list): The sample names.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions, or None for all records.
+    - block_size (int): The number of bytes read per block.
+
+    Returns:
+    - dict: The PhasedArrays of every sample.
+    """
+    header = read_vcf_header(file_path)
+    columns = {sample: sample_column(header, sample, file_path) for sample in samples}
+    indices = {sample: PhasedArrays() for sample in columns}
+    header, blocks = read_vcf_blocks(file_path, regions, block_size, column=max(columns.values()))
+    for block, rows in blocks:
+        for sample, column in columns.items():
+            block.select_sample(column)
+            indices[sample].add(block, rows)
+    for index in indices.values():
+        index.finish()
+    return indices
+
+def log_block_events(event, mask, positions, contig_ids, contig_names):
+    """
+    Counts the events of a block in EVENT_LOGGER and passes their positions to merge_events.EVENT_SINK, if one is set.
+
+    Args:
+    - event (str): The event type, a key of EVENT_LOGGER.
+    - mask (numpy.ndarray): Boolean array, True for the records with this event.
+    - positions (numpy.ndarray): The positions of the records.
+    - contig_ids (numpy.ndarray): The contig ids of the records, indices of contig_names.
+    - contig_names (list): The contig names of the block.
+    """
+    count = int(mask.sum())
+    EVENT_LOGGER[event] += count
+    if merge_events.EVENT_SINK is not None and count:
+        for contig_id, contig in enumerate(contig_names):
+            selected = mask & (contig_ids == contig_id)
+            if selected.any():
+                merge_events.EVENT_SINK.extend(event, contig, positions[selected].tolist())
+
+def merge_blocks(blocks_a, index_b, sink):
+    """
+    Block engine: matches the records of each block of file A against the phased genotypes of file B with 
+    a sorted join, checks genotypes and alleles with array operations and writes the block with the 
+    genotypes of matched records replaced. Unmatched records are copied in runs of unchanged lines.
+
+    Args:
+    - blocks_a (iterator): Blocks of file A as yielded by read_vcf_blocks.
+    - index_b (PhasedArrays): The phased genotypes of file B.
+    - sink (VcfWriter): Receives the updated blocks.
+    """
+    for block, rows in blocks_a:
+        n = len(rows)
+        if not n:
+            continue
+        positions = block.positions[rows]
+        contig_ids = block.contig_ids[rows]
+        # records of A that share their position with a neighbour, blocks do not split them (see _iter_blocks)
+        same = (positions[1:] == positions[:-1]) & (contig_ids[1:] == contig_ids[:-1])
+        shared_a = np.zeros(n, dtype=bool)
+        shared_a[1:] |= same
+        shared_a[:-1] |= same
+        allele_starts = block.tabs[rows, 2] + 1
+        allele_lengths = block.tabs[rows, 4] - allele_starts
+
+        matched = np.zeros(n, dtype=bool)
+        ambiguous = np.zeros(n, dtype=bool)
+        codes_b = np.zeros(n, dtype=np.uint8)
+        alleles_equal = np.ones(n, dtype=bool)
+        alleles_b = {}
+        for contig_id, contig in enumerate(block.contig_names):
+            arrays = index_b.contigs.get(contig)
+            if arrays is None:
+                continue
+            positions_b, contig_codes_b, allele_starts_b, allele_lengths_b, contig_alleles_b = arrays
+            group = np.flatnonzero(contig_ids == contig_id)
+            found = np.minimum(np.searchsorted(positions_b, positions[group]), len(positions_b) - 1)
+            hit = positions_b[found] == positions[group]
+            group, found = group[hit], found[hit]
+            # of several records of B or A at a position, the one of B with the alleles of A is taken
+            following = np.minimum(found + 1, len(positions_b) - 1)
+            shared = np.flatnonzero((following != found) & (positions_b[following] == positions[group]) | shared_a[group])
+            if len(shared):
+                for k in shared.tolist():
+                    row, j = group[k], found[k]
+                    alleles_a = block.buffer[allele_starts[row]:allele_starts[row] + allele_lengths[row]].tobytes()
+                    found[k] = -1
+                    while j < len(positions_b) and positions_b[j] == positions[row]:
+                        start = allele_starts_b[j]
+                        if contig_alleles_b[start:start + allele_lengths_b[j]].tobytes() == alleles_a:
+                            found[k] = j
+                            break
+                        j += 1
+                resolved = found >= 0
+                ambiguous[group[~resolved]] = True
+                group, found = group[resolved], found[resolved]
+            matched[group] = True
+            codes_b[group] = contig_codes_b[found]
+            alleles_equal[group] = segments_equal(block.buffer, allele_starts[group], allele_lengths[group],
+                                                  contig_alleles_b, allele_starts_b[found], allele_lengths_b[found])
+            if merge_events.VERBOSE:
+                for row, start, length in zip(group.tolist(), allele_starts_b[found].tolist(), allele_lengths_b[found].tolist()):
+                    alleles_b[row] = tuple(contig_alleles_b[start:start + length].tobytes().decode().split('\t'))
+
+        codes_a = block.genotype_codes(rows, '/')
+        invalid = np.flatnonzero(matched & ((codes_a == 255) | (codes_b == 255)))
+        if len(invalid):
+            if codes_a[invalid[0]] == 255:
+                sys.exit(f"Error: Unphased genotype in file A must be {','.join(sorted(ALLOWED_GENOTYPES))}")
+            sys.exit(f"Error: Phased genotype in file B must be {','.join(sorted(ALLOWED_PHASED_GENOTYPES))}")
+        inconsistent_genotypes = matched & (codes_a != codes_b)
+        inconsistent_alleles = matched & ~alleles_equal
+
+        for event, mask in (("read_lines", np.ones(n, dtype=bool)), ("inconsistent_ref_alt_genotypes", inconsistent_genotypes),
+                            ("inconsistent_ref_alt_alleles", inconsistent_alleles), ("replaced_genotypes", matched), ("kept_genotypes", ~matched), 
+                            ("ambiguous_duplicates", ambiguous)):
+            log_block_events(event, mask, positions, contig_ids, block.contig_names)
+        if merge_events.VERBOSE:
+            _print_block_events(block, rows, matched, codes_a, codes_b, inconsistent_genotypes, inconsistent_alleles, alleles_b, ambiguous)
+
+        # unchanged lines are copied in runs, only matched lines are rewritten one by one
+        breaks = np.ones(n, dtype=bool)
+        breaks[1:] = (rows[1:] != rows[:-1] + 1) | matched[1:] | matched[:-1]
+        run_starts = np.flatnonzero(breaks)
+        run_ends = np.append(run_starts[1:], n)
+        data = block.data
+        starts, ends = block.starts[rows].tolist(), block.ends[rows].tolist()
+        sample_starts = (block.tabs[rows, 8] + 1).tolist()
+        matched_list, codes_b_list = matched.tolist(), codes_b.tolist()
+        pieces = []
+        for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+            if matched_list[run_start]:
+                start = starts[run_start]
+                pieces.append(splice_genotype_bytes(data[start:ends[run_start] + 1], sample_starts[run_start] - start, PHASED_GENOTYPES_BYTES[codes_b_list[run_start]]))
+            else:
+                pieces.append(data[starts[run_start]:ends[run_end - 1] + 1])
+        if block.unterminated and ends[-1] == len(data) - 1 and not matched_list[-1]:
+            pieces[-1] = pieces[-1][:-1]
+        output = b''.join(pieces)
+        sink.write_block(output.decode())
+
+def _print_block_events(block, rows, matched, codes_a, codes_b, inconsistent_genotypes, inconsistent_alleles, alleles_b, ambiguous):
+    for i, row in enumerate(rows.tolist()):
+        coordinate = (block.contig_names[block.contig_ids[row]], int(block.positions[row]))
+        if ambiguous[i]:
+            start = block.tabs[row, 2] + 1
+            alleles_a = tuple(block.data[start:block.tabs[row, 4]].decode().split('\t'))
+            print(f"WARNING: None of the records of file B at coordinate {coordinate} has the REF and ALT alleles {alleles_a}", file=sys.stderr)
+        if not matched[i]:
+            print("INFO: Kept genotype at coordinate", coordinate, file=sys.stderr)
+            continue
+        if inconsistent_genotypes[i]:
+            genotype_a, genotype_b = PHASED_GENOTYPES[codes_a[i]], PHASED_GENOTYPES[codes_b[i]]
+            print(f"INFO: Inconsistent REF and ALT genotypes at coordinate {coordinate}: {genotype_a.split('|')} vs {genotype_b.split('|')}", file=sys.stderr)
+        if inconsistent_alleles[i]:
+            start = block.tabs[row, 2] + 1
+            alleles_a = tuple(block.data[start:block.tabs[row, 4]].decode().split('\t'))
+            print(f"WARNING: Inconsistent REF and ALT alleles at coordinate {coordinate}: {alleles_a} vs {alleles_b[i]}", file=sys.stderr)
+        print("INFO: Replaced genotype at coordinate", coordinate, file=sys.stderr)
@@ -0,0 +1,243 @@
+"""
+License: MIT
+
+Merges many pairs of files with merge_genotypes.py in one long-lived pool of worker processes, e.g. all samples
+of a chromosome, so that the interpreter start-up and imports are paid once per worker instead of once per pair.
+
+The manifest is a tab-separated file with one pair per line: the unphased VCF file (A), the phased VCF-like
+file (B), the output VCF file and, optionally, the log file that receives the event counts of this pair in the
+format read by aggregate_stats.R (default, also for an empty column: the output path with .log appended) and
+the sample of a multi-sample file B whose genotypes are injected. Empty lines and lines starting with '#' are ignored.
+
+Pairs that name a sample of the same multi-sample file B are merged together: a worker reads the genotypes of all
+their samples in one pass over B and then merges the pairs one after another. With more workers than such files,
+the samples of a file B are spread over several workers, each of which reads B once. The stream engine reads B
+alongside A and therefore merges every pair on its own.
+
+Pairs are handed to the workers largest file A first, so that a long chromosome does not start last.
+A pair that fails is reported and the remaining pairs are still merged; the exit status is non-zero then.
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import bgzf
+from merge_genotypes import merge_files, ENGINES, BACKENDS
+from merge_events import print_event_counts
+from vcf_index import INDEX_FORMATS
+from vcf_writers import DEFAULT_BUFFER_SIZE
+from vcf_reader import read_vcf_header, sample_column
+from phased_index import read_phased_indices
+from block_engine import read_phased_arrays_by_sample, DEFAULT_BLOCK_SIZE
+
+def read_manifest(file_path):
+    """
+    Reads the pairs of a batch manifest.
+
+    Args:
+    - file_path (str): The path to the tab-separated manifest.
+
+    Returns:
+    - list: Tuples of file A, file B, output and log path and sample (None for the first sample column), 
+      in the order of the manifest.
+    """
+    entries = []
+    with open(file_path) as manifest:
+        for line_number, line in enumerate(manifest, 1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\r\n').split('\t')
+            if len(fields) not in (3, 4, 5):
+                sys.exit(f"Error: Line {line_number} of manifest {file_path} must have 3 to 5 tab-separated columns, found {len(fields)}")
+            fields.extend([""] * (5 - len(fields)))
+            if not fields[3]:
+                fields[3] = fields[2] + ".log"
+            fields[4] = fields[4] or None
+            entries.append(tuple(fields))
+
+    outputs = [entry[2] for entry in entries]
+    if len(set(outputs)) != len(outputs):
+        sys.exit(f"Error: Manifest {file_path} lists the same output file more than once")
+    return entries
+
+def init_worker(threads):
+    """
+    Sets up a worker process of the pool, which then merges one pair after another.
+
+    Args:
+    - threads (int): The number of BGZF threads of the worker.
+    """
+    bgzf.IO_THREADS = threads
+
+def merge_entry(entry, options, phased=None):
+    """
+    Merges one pair of a manifest and writes its event counts to the log file of the pair.
+
+    Args:
+    - entry (tuple): File A, file B, output and log path and sample.
+    - options (dict): Keyword arguments passed on to merge_files.
+    - phased (PhasedIndex or PhasedArrays): The genotypes of the sample read beforehand, see read_phased.
+
+    Returns:
+    - tuple: The entry.
+    """
+    file_a, file_b, output_path, log_path, sample = entry
+    try:
+        counts = merge_files(file_a, file_b, output_path, sample=sample, phased=phased, **options)
+    except BaseException:
+        # do not leave a truncated output behind that looks complete, nor an index that a later output could be paired with
+        for path in (output_path, output_path + ".tbi", output_path + ".csi"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    with open(log_path, "w") as log_file:
+        print_event_counts(counts, log_file)
+    return entry
+
+def read_phased(file_b, samples, options):
+    """
+    Reads the genotypes of several samples of a multi-sample file B in one pass, in the form used by the engine.
+
+    Args:
+    - file_b (str): The path to file B.
+    - samples (list): The sample names.
+    - options (dict): Keyword arguments passed on to merge_files.
+
+    Returns:
+    - dict: The PhasedIndex, or PhasedArrays for the block engine, of every sample.
+    """
+    if options.get("engine") == "block":
+        return read_phased_arrays_by_sample(file_b, samples, block_size=options.get("block_size", DEFAULT_BLOCK_SIZE))
+    return read_phased_indices(file_b, samples)
+
+def merge_entries(entries, options):
+    """
+    Merges a task of one or more pairs. The genotypes of pairs that share a multi-sample file B are read 
+    at once, see plan_tasks.
+
+    Args:
+    - entries (list): Tuples of file A, file B, output and log path and sample.
+    - options (dict): Keyword arguments passed on to merge_files.
+
+    Returns:
+    - list: Tuples of every entry and the error that made it fail, or None.
+    """
+    if len(entries) == 1:
+        return [(merge_entry(entries[0], options), None)]
+    results = []
+    try:
+        # a sample missing from B fails its own pair only
+        header = read_vcf_header(entries[0][1])
+        found = []
+        for entry in entries:
+            try:
+                sample_column(header, entry[4], entry[1])
+                found.append(entry)
+            except SystemExit as error:
+                results.append((entry, error))
+        entries = found
+        phased = read_phased(entries[0][1], [entry[4] for entry in entries], options) if entries else {}
+    except (Exception, SystemExit) as error:
+        return results + [(entry, error) for entry in entries]
+    for entry in entries:
+        try:
+            results.append((merge_entry(entry, options, phased.pop(entry[4])), None))
+        except (Exception, SystemExit) as error:
+            results.append((entry, error))
+    return results
+
+def plan_tasks(entries, options, workers=1):
+    """
+    Groups the pairs into the tasks handed to the workers. Pairs that name a sample of the same file B form 
+    one task, split into up to as many tasks as there are workers per such file B. Any other pair, and every 
+    pair of the stream engine, is a task of its own.
+
+    Args:
+    - entries (list): Tuples of file A, file B, output and log path and sample.
+    - options (dict): Keyword arguments passed on to merge_files.
+    - workers (int): The number of worker processes.
+
+    Returns:
+    - list: Lists of entries, largest file A first.
+    """
+    def size(entry):
+        return os.path.getsize(entry[0]) if os.path.exists(entry[0]) else 0
+
+    tasks, groups = [], {}
+    for entry in entries:
+        if entry[4] is None or options.get("engine") == "stream":
+            tasks.append([entry])
+        else:
+            groups.setdefault(entry[1], []).append(entry)
+
+    for group in groups.values():
+        samples = [entry[4] for entry in group]
+        if len(set(samples)) != len(samples):
+            # the same sample can only be taken once from a single read of B
+            tasks.extend([entry] for entry in group)
+            continue
+        n_tasks = max(1, min(len(group), workers // len(groups)))
+        group.sort(key=size, reverse=True)
+        tasks.extend(group[i::n_tasks] for i in range(n_tasks))
+
+    # longest processing time first: hand out the largest inputs before the small ones
+    return sorted(tasks, key=lambda task: sum(map(size, task)), reverse=True)
+
+def run_batch(entries, options, workers=1, threads=1):
+    """
+    Merges all pairs in a pool of worker processes.
+
+    Args:
+    - entries (list): Tuples of file A, file B, output and log path and sample.
+    - options (dict): Keyword arguments passed on to merge_files.
+    - workers (int): The number of worker processes.
+    - threads (int): The number of BGZF threads of every worker.
+
+    Returns:
+    - list: The entries that failed.
+    """
+    tasks = plan_tasks(entries, options, workers)
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=min(workers, max(1, len(tasks))), initializer=init_worker, initargs=(threads,)) as pool:
+        futures = {pool.submit(merge_entries, task, options): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except (Exception, SystemExit) as error:
+                results = [(entry, error) for entry in futures[future]]
+            for entry, error in results:
+                if error is not None:
+                    print(f"ERROR: Merging {entry[0]} and {entry[1]} into {entry[2]} failed: {error}", file=sys.stderr)
+                    failed.append(entry)
+                else:
+                    print(f"INFO: Merged {entry[0]} and {entry[1]} into {entry[2]}", file=sys.stderr)
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge many pairs of files listed in a manifest with one pool of worker processes.")
+    parser.add_argument("manifest", help="tab-separated file with one pair per line: file A, file B, output and optionally a log file and a sample of file B")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes, each merging one pair at a time (default: 1)")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="number of threads per worker for BGZF decompression and compression (default: 1)")
+    parser.add_argument("--engine", choices=ENGINES, default="dict",
+                        help="merge engine, see merge_genotypes.py (default: dict)")
+    parser.add_argument("--backend", choices=BACKENDS, default="python",
+                        help="reader and writer of the VCF files, see merge_genotypes.py (default: python)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                        help=f"number of bytes of each input tokenized at once by the block engine (default: {DEFAULT_BLOCK_SIZE})")
+    parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE,
+                        help=f"number of characters collected before they are written to the output (default: {DEFAULT_BUFFER_SIZE})")
+    parser.add_argument("--index", choices=INDEX_FORMATS, default="auto",
+                        help="index written next to gzipped outputs (default: auto)")
+    args = parser.parse_args()
+
+    entries = read_manifest(args.manifest)
+    options = dict(engine=args.engine, index_format=args.index,
+                   buffer_size=args.buffer_size, block_size=args.block_size, backend=args.backend)
+    failed = run_batch(entries, options, max(1, args.workers), max(1, args.threads))
+    if failed:
+        sys.exit(f"Error: {len(failed)} of {len(entries)} pairs failed")
@@ -0,0 +1,95 @@
+"""
+License: MIT
+
+Helpers to run merge_genotypes.py on chunks of a chromosome (scatter) and to combine the results (gather):
+
+ - plan:     splits the contigs of an unphased VCF file (A) into windows of a fixed size, one region per line.
+ - concat:   concatenates the BGZF outputs of all chunks without recompressing them and combines their indices.
+ - sum-logs: sums the event counts of the per-chunk logs into the log format read by aggregate_stats.R.
+"""
+
+import sys
+import argparse
+
+from vcf_index import concat_bgzf
+from regions import CONTIG_ID_PATTERN
+from vcf_reader import read_contigs, read_vcf_header
+
+def plan_chunks(file_path, chunk_size):
+    """
+    Splits the contigs of a VCF file into windows of chunk_size bp, so that the merged chunks concatenated 
+    in order hold every record of the file. The contigs with records are taken in the order of their first 
+    record, from the tabix or CSI index of the file if it has one and otherwise by scanning the file.
+    Their lengths come from the matching ##contig lines; without a length, a contig forms a single chunk.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - chunk_size (int): The window size in bp.
+
+    Returns:
+    - list: The regions as strings contig:start-end with 1-based inclusive coordinates.
+    """
+    lengths = {}
+    for line in read_vcf_header(file_path):
+        match = CONTIG_ID_PATTERN.search(line) if line.startswith('##contig=') else None
+        if match and 'length=' in line:
+            lengths[match.group(1)] = int(line.split('length=')[1].split(',')[0].rstrip('>\n'))
+    regions = []
+    for contig in read_contigs(file_path):
+        length = lengths.get(contig)
+        if length is None:
+            regions.append(contig)
+        else:
+            regions.extend(f"{contig}:{start}-{min(start + chunk_size - 1, length)}" for start in range(1, length + 1, chunk_size))
+    return regions
+
+def sum_logs(log_paths):
+    """
+    Sums the event counts of several merge_genotypes.py logs.
+
+    Args:
+    - log_paths (list): The paths to the log files.
+
+    Returns:
+    - dict: The summed count of every event, in order of first appearance.
+    """
+    counts = {}
+    for log_path in log_paths:
+        with open(log_path) as log_file:
+            for line in log_file:
+                if line.strip():
+                    event, count = line.rstrip('\n').split('\t')
+                    counts[event] = counts.get(event, 0) + int(count)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scatter and gather helpers for chunked runs of merge_genotypes.py.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan = subparsers.add_parser("plan", help="write the regions of all chunks of the contigs of file A, one per line")
+    plan.add_argument("file_a", help="VCF file with unphased genotypes (A)")
+    plan.add_argument("chunk_size", type=int, help="size of each chunk in bp")
+    plan.add_argument("output", help="output file with one region per line")
+
+    concat = subparsers.add_parser("concat", help="concatenate the BGZF outputs of all chunks")
+    concat.add_argument("output", help="concatenated BGZF output")
+    concat.add_argument("chunks", nargs="+", help="BGZF outputs of the chunks in order")
+    concat.add_argument("--index", choices=("tbi", "csi", "none"), default="none",
+                        help="combine the chunk indices with this extension into an index of the output (default: none)")
+
+    logs = subparsers.add_parser("sum-logs", help="sum the event counts of the chunk logs and print them")
+    logs.add_argument("logs", nargs="+", help="logs of merge_genotypes.py")
+
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        if args.chunk_size < 1:
+            sys.exit("Error: chunk size must be positive")
+        with open(args.output, "w") as output_file:
+            for region in plan_chunks(args.file_a, args.chunk_size):
+                print(region, file=output_file)
+    elif args.command == "concat":
+        concat_bgzf(args.chunks, args.output, None if args.index == "none" else args.index)
+    else:
+        for event, count in sum_logs(args.logs).items():
+            print(f"{event}\t{count}")
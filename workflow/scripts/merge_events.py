@@ -0,0 +1,230 @@
+"""
+License: MIT
+
+Event counts, event positions and phase profiling of merge_genotypes.py.
+
+EVENT_LOGGER holds the counts of the current merge. EVENT_SINK and PROFILER are set by merge_files for the 
+duration of a merge; other modules read them, and VERBOSE, through this module.
+"""
+
+import os
+import sys
+import json
+import time
+from array import array
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+EVENT_LOGGER = {
+        "read_lines":                      0,
+        "inconsistent_ref_alt_genotypes":  0,
+        "inconsistent_ref_alt_alleles":    0,
+        "replaced_genotypes":              0,
+        "kept_genotypes":                  0,
+        "dropped_duplicates":              0,
+        "ambiguous_duplicates":            0,
+    }
+
+# optional EventSink that records the coordinate of every logged event
+EVENT_SINK = None
+
+# optional PhaseProfiler that measures the time spent in each phase of a merge
+PROFILER = None
+
+VERBOSE = False
+
+def log_event(event, coordinate):
+    """
+    Counts an event in EVENT_LOGGER and passes its coordinate to EVENT_SINK, if one is set.
+
+    Args:
+    - event (str): The event type, a key of EVENT_LOGGER.
+    - coordinate (tuple): The genomic coordinate of the event.
+    """
+    EVENT_LOGGER[event] += 1
+    if EVENT_SINK is not None:
+        EVENT_SINK.add(event, coordinate)
+
+class EventSink:
+    """
+    Writes the positions of logged events to disk, one file per contig and event type 
+    (<directory>/<contig>.<event>.pos). Each file holds the positions as 64-bit integers in 
+    native byte order and can be loaded with array('q').fromfile or numpy.fromfile(path, dtype='int64').
+
+    Args:
+    - directory (str): The output directory, created if missing.
+    - flush_size (int): Number of positions held per file before they are appended to it.
+    """
+    def __init__(self, directory, flush_size=1 << 16):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_size = flush_size
+        self._positions = {}
+        self._written = set()
+
+    def add(self, event, coordinate):
+        key = (coordinate[0], event)
+        positions = self._positions.get(key)
+        if positions is None:
+            positions = self._positions[key] = array('q')
+        positions.append(coordinate[1])
+        if len(positions) >= self.flush_size:
+            self._flush(key, positions)
+
+    def extend(self, event, contig, positions):
+        """
+        Adds the positions of many events of one type on one contig at once.
+        """
+        key = (contig, event)
+        array_positions = self._positions.get(key)
+        if array_positions is None:
+            array_positions = self._positions[key] = array('q')
+        array_positions.extend(positions)
+        if len(array_positions) >= self.flush_size:
+            self._flush(key, array_positions)
+
+    def _flush(self, key, positions):
+        # files of a previous run are truncated on the first write
+        mode = 'ab' if key in self._written else 'wb'
+        with open(os.path.join(self.directory, "{}.{}.pos".format(*key)), mode) as file:
+            positions.tofile(file)
+        self._written.add(key)
+        del positions[:]
+
+    def close(self):
+        for key, positions in self._positions.items():
+            self._flush(key, positions)
+        self._positions = {}
+
+class PhaseProfiler:
+    """
+    Measures the wall and CPU time spent in each phase of a merge (see PROFILE_PHASES). Phases may be nested, 
+    e.g. writing within merging; time is charged to the innermost phase only, so that the times of all phases 
+    add up to the total. Time outside of any phase is charged to "other". CPU time includes the BGZF threads.
+    """
+    def __init__(self):
+        self.phases = {}
+        self._stack = ["other"]
+        self._start = self._last = (time.perf_counter(), time.process_time())
+
+    def _charge(self):
+        now = (time.perf_counter(), time.process_time())
+        times = self.phases.setdefault(self._stack[-1], [0.0, 0.0])
+        times[0] += now[0] - self._last[0]
+        times[1] += now[1] - self._last[1]
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        self._charge()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge()
+            self._stack.pop()
+
+    def report(self, counts):
+        """
+        Returns the times of all phases so far, the throughput and the peak RSS of this process.
+
+        Args:
+        - counts (dict): The event counts of the merge.
+
+        Returns:
+        - dict: The profile, as written by write_profile.
+        """
+        self._charge()
+        wall = self._last[0] - self._start[0]
+        return {
+            "wall_seconds": wall,
+            "cpu_seconds": self._last[1] - self._start[1],
+            "records": counts.get("read_lines", 0),
+            "records_per_second": counts.get("read_lines", 0) / wall if wall > 0 else None,
+            "peak_rss_bytes": peak_rss(),
+            "phases": {name: {"wall_seconds": times[0], "cpu_seconds": times[1]} 
+                       for name, times in sorted(self.phases.items(), key=lambda item: PROFILE_PHASES.index(item[0]))},
+        }
+
+# phases measured by PhaseProfiler; the stream engine parses both files while merging, the block engine parses A while merging
+PROFILE_PHASES = ("read_header", "parse_a", "parse_b", "merge", "write", "other")
+
+def profile_phase(name):
+    """
+    Returns a context manager that charges the time spent in it to a phase of PROFILER, if one is set.
+    """
+    return nullcontext() if PROFILER is None else PROFILER.phase(name)
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None where it is unknown.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def write_profile(profile, file_path):
+    """
+    Writes a profile as returned by PhaseProfiler.report to a JSON file.
+    """
+    with open(file_path, "w") as file:
+        json.dump(profile, file, indent=2)
+        file.write("\n")
+
+def combine_profiles(profiles, wall_seconds):
+    """
+    Combines the profiles of merges run in parallel: times and records are summed, the peak RSS is the largest. 
+
+    Args:
+    - profiles (list): Profiles as returned by PhaseProfiler.report.
+    - wall_seconds (float): The wall time of the whole parallel merge.
+
+    Returns:
+    - dict: The combined profile; its phase times are summed over all processes.
+    """
+    records = sum(profile["records"] for profile in profiles)
+    phases = {}
+    for profile in profiles:
+        for name, times in profile["phases"].items():
+            total = phases.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+            total["wall_seconds"] += times["wall_seconds"]
+            total["cpu_seconds"] += times["cpu_seconds"]
+    rss = [profile["peak_rss_bytes"] for profile in profiles if profile["peak_rss_bytes"] is not None]
+    return {
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": sum(profile["cpu_seconds"] for profile in profiles),
+        "records": records,
+        "records_per_second": records / wall_seconds if wall_seconds > 0 else None,
+        "peak_rss_bytes": max(rss) if rss else None,
+        "processes": len(profiles),
+        "phases": phases,
+    }
+
+def log_dropped_duplicates(dropped):
+    """
+    Logs the records of file B that were dropped when it was read into a PhasedIndex or PhasedArrays.
+
+    Args:
+    - dropped (dict): The positions of the dropped records by contig, see PhasedIndex.dropped.
+    """
+    for contig, positions in dropped.items():
+        EVENT_LOGGER["dropped_duplicates"] += len(positions)
+        if EVENT_SINK is not None and len(positions):
+            EVENT_SINK.extend("dropped_duplicates", contig, positions)
+
+def print_event_counts(counts, file=sys.stdout):
+    """
+    Prints event counts as one tab-separated line of event and count each, the log format read by aggregate_stats.R.
+
+    Args:
+    - counts (dict): The count of every event.
+    - file (file): The file to print to.
+    """
+    for event, count in counts.items():
+        print(f"{event}\t{count}", file=file)
@@ -8,6 +8,8 @@ This script reads in a VCF file for a single sample (called "A") and another VCF
 
 The unphased genotype in file A is indicated by "0/0", "0/1", or "1/1". 
 The phased genotype in file B is indicated by "0|0", "0|1", or "1|1". 
+File B may hold several samples, e.g. a cohort VCF from a phasing tool; the sample whose genotypes are injected is 
+then chosen by name, and each line of B is only scanned up to the column of that sample.
 
 The script then iterates over genomic coordinates in both files and does the following operations: 
  1. If the coordinate is present in both files, the genotype from file B is used to replaced the unphased genotype in file A. 
@@ -16,174 +18,618 @@ The script then iterates over genomic coordinates in both files and does the fol
 
 In all cases where matching coordinates in file A and B are present the REF and ALT allele are checked for consistency.
 
+A coordinate may hold several records, e.g. the split records of a multiallelic site or an indel next to a SNP. 
+Every record of A is written. A record of A is merged with the record of B at its coordinate if both files hold 
+only one there; otherwise it is merged with the record of B with the same REF and ALT. If none of them has the 
+alleles of A, the genotype of A is kept and the record is counted as "ambiguous_duplicates". Records of A that 
+share a coordinate are expected next to each other, as in any sorted file. Of records of B that share the 
+coordinate, REF and ALT, only the last one is used; the others are counted as "dropped_duplicates".
+
 All remaining contents from file A are kept to ensure adherence to the VCF format.
+
+A and B may also be BCF files. Only CHROM, POS, REF, ALT and GT of a BCF record are decoded; the record is 
+otherwise carried as the bytes it was read as, and the phased genotype is written over the GT values of A, 
+so a BCF file A is merged into a BCF output without re-encoding its records.
+
+Three engines are available:
+ - "dict" (default) reads A into a list and B into a compact index searched by coordinate. It tolerates 
+   unsorted input but holds every record of A and B in memory.
+ - "stream" walks both coordinate-sorted files at the same time and writes each line as soon as its 
+   coordinate is settled, keeping only a handful of records in memory. Contigs are expected in the order 
+   of the ##contig lines in the header of file A; contigs not listed there are ranked by first appearance. 
+   Sortedness is checked while merging: if an input turns out not to be sorted, the merge starts over with 
+   that input sorted by an external merge sort in temporary files, so memory stays bounded.
+ - "block" (requires NumPy) tokenizes A and B in large blocks of bytes with array operations. B is held in 
+   sorted arrays per contig, the records of each block of A are matched against them with a vectorized join 
+   and only the matched lines are rewritten in Python. Input may be unsorted; records of A are written 
+   in their original order.
+
+This script holds the command line and the merge driver; the rest lives in the modules next to it: bgzf.py, 
+vcf_index.py, bcf.py, vcf_reader.py, vcf_writers.py and pysam_backend.py read and write the files, regions.py 
+handles contigs and regions, record_merge.py, phased_index.py, stream_engine.py, block_engine.py and 
+phased_cache.py match and merge the records, and merge_events.py counts events and profiles the phases.
 """
 
+import io
+import os
 import sys
-import gzip
-
-def phase_genotype(gt): 
-    return gt.replace('/', '|')
-
-ALLOWED_GENOTYPES = {'0/0', '1/0', '0/1', '1/1'}
-
-EVENT_LOGGER = {
-        "read_lines":                      [],
-        "inconsistent_ref_alt_genotypes":  [],
-        "inconsistent_ref_alt_alleles":    [],
-        "replaced_genotypes":              [],
-        "kept_genotypes":                  [],
-    }
-
-VERBOSE = False
-
-def open_file(file_path, _mode='rt'):
+import json
+import time
+import shutil
+import cProfile
+import argparse
+import tempfile
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+import merge_events
+import bgzf
+from merge_events import (EVENT_LOGGER, EventSink, PhaseProfiler, combine_profiles, log_dropped_duplicates, log_event, print_event_counts,
+                          profile_phase, write_profile)
+from bgzf import is_bgzf, open_file
+from vcf_index import INDEX_FORMATS, TabixIndexer, concat_bgzf, find_index
+from regions import MAX_POSITION, contig_order, normalize_regions, parse_region, read_bed_regions
+from vcf_writers import CallableMask, DEFAULT_BUFFER_SIZE, MaskWriter, MultihetsepWriter, TeeWriter, VcfWriter
+from bcf import BcfWriter, is_bcf
+from pysam_backend import PysamWriter, pysam
+from vcf_reader import parse_deferred, read_contigs, read_vcf_header, read_vcf_stream, record_parser, sample_column
+from phased_index import read_phased_index
+from record_merge import flag_shared_records, inject_genotype, inject_genotype_bcf, inject_genotype_pysam, keep_genotype, match_record
+from stream_engine import DEFAULT_SORT_BUFFER, UnsortedInputError, check_sorted, external_sort, merge_sorted_records
+from block_engine import DEFAULT_BLOCK_SIZE, merge_blocks, read_phased_arrays, read_vcf_blocks, np
+from phased_cache import DEFAULT_CACHE_SIZE, PhasedCache
+
+ENGINES = ("dict", "stream", "block")
+
+# "vcf" writes file A with injected genotypes, "multihetsep" the input format of MSMC2, see MultihetsepWriter
+OUTPUT_FORMATS = ("vcf", "multihetsep")
+
+# "python" reads and writes VCF with the BGZF, tabix and parsing code of these scripts, "pysam" with htslib
+# through pysam.VariantFile (requires pysam), see read_pysam_stream and PysamWriter
+BACKENDS = ("python", "pysam")
+
+# the options of each engine, which replace_genotypes passes on to run_dict_engine, run_stream_engine or run_block_engine
+ENGINE_OPTIONS = {
+    "dict": ("lazy",),
+    "stream": ("lazy", "sort_inputs", "sort_buffer", "sort_dir"),
+    "block": ("block_size",),
+}
+
+def replace_genotypes(file_a, file_b, sink=None, engine="dict", write_header=False, regions=None, sample=None, phased=None, 
+                      output_format="vcf", mask=None, multihetsep=None, backend="python", **engine_options):
     """
-    Opens a file, handling both regular and gzipped files.
+    Replaces unphased genotypes in file A with phased genotypes from file B based on genomic coordinates.
 
     Args:
-    - file_path (str): The path to the file.
+    - file_a (str): Path to the VCF file for sample A.
+    - file_b (str): Path to the VCF-like file containing phased genotypes.
+    - sink (VcfWriter): Receives the updated lines one by one. If omitted, the lines are collected and returned.
+    - engine (str): The merge engine, "dict", "stream" (for coordinate-sorted input, see run_stream_engine) or "block" 
+      (requires NumPy).
+    - write_header (bool): Whether to write the header of file A first. It is read from the same 
+      stream as the records, so file A is decompressed only once.
+    - regions (list): Regions as tuples of contig, start and end (1-based, inclusive). Only records of A 
+      whose position lies within them are merged, using the tabix or CSI index of A and B if present.
+    - sample (str): The sample of a multi-sample file B whose genotypes are injected, by default the first sample column.
+    - phased (PhasedIndex or PhasedArrays): The genotypes of B read beforehand, e.g. by read_phased_indices for the 
+      dict engine or read_phased_arrays_by_sample for the block engine. File B is then not read again.
+    - output_format (str): One of OUTPUT_FORMATS; "multihetsep" writes the heterozygous sites of the merged records 
+      in the input format of MSMC2 instead of VCF lines, see MultihetsepWriter. It requires sorted input.
+    - mask (CallableMask): Receives every record of A as it is written, to build the callability mask in the same pass. 
+      It also decides which sites of a multihetsep output are called. The caller closes it.
+    - multihetsep (VcfWriter): Receives the multihetsep lines of the merged records next to the VCF lines of the sink, 
+      see TeeWriter. The mask then decides which sites are called, as for the multihetsep output format.
+    - backend (str): One of BACKENDS. "pysam" reads A and B with htslib and writes to a PysamWriter, which always 
+      writes the header. It supports the dict and stream engines (for sorted input) and VCF output without a mask. 
+      The "python" backend reads BCF files with read_bcf_stream in the dict and stream engines; the records of 
+      a BCF file A are written as BCF to a BcfWriter, without a mask.
+    - engine_options: The options of the engine as listed in ENGINE_OPTIONS, see run_dict_engine, run_stream_engine and 
+      run_block_engine. If the stream engine raises UnsortedInputError and no sink is given, the merge is repeated 
+      with that input added to sort_inputs.
 
     Returns:
-    - file object: An open file object.
+    - str: The updated content for sample A in VCF format if no sink is given (uncompressed BCF for a 
+      BCF file A), otherwise None.
     """
-    if file_path.endswith('.gz'):
-        return gzip.open(file_path, _mode)
-    else:
-        return open(file_path, 'r')
+    if engine not in ENGINES:
+        sys.exit(f"Error: Unknown engine '{engine}', must be one of {', '.join(ENGINES)}")
+    unknown = sorted(set(engine_options) - set(ENGINE_OPTIONS[engine]))
+    if unknown:
+        sys.exit(f"Error: The {engine} engine takes no option {', '.join(unknown)}")
+    if output_format not in OUTPUT_FORMATS:
+        sys.exit(f"Error: Unknown output format '{output_format}', must be one of {', '.join(OUTPUT_FORMATS)}")
+    if backend not in BACKENDS:
+        sys.exit(f"Error: Unknown backend '{backend}', must be one of {', '.join(BACKENDS)}")
+    sort_inputs = engine_options.get("sort_inputs", ())
+    if backend == "pysam":
+        if engine == "block" or output_format != "vcf" or mask is not None or multihetsep is not None:
+            sys.exit("Error: The pysam backend supports the dict and stream engines with VCF output, without mask and multihetsep")
+        if not isinstance(sink, PysamWriter) or not write_header:
+            sys.exit("Error: The pysam backend writes to a PysamWriter, which always writes the header")
+        if sort_inputs:
+            sys.exit(f"Error: The pysam backend cannot sort file {sort_inputs[0].upper()}, use the dict engine for unsorted input")
+    bcf_a = backend == "python" and is_bcf(file_a)
+    if bcf_a and (output_format != "vcf" or mask is not None or multihetsep is not None or sink is not None and not isinstance(sink, BcfWriter)):
+        sys.exit("Error: The records of a BCF file A are written as BCF to a BcfWriter, without a mask and multihetsep")
+    if multihetsep is not None and output_format != "vcf":
+        sys.exit("Error: A multihetsep file is written next to a VCF output only")
+    for input_name in sort_inputs:
+        if backend == "python" and is_bcf(file_a if input_name == "a" else file_b):
+            sys.exit(f"Error: BCF file {input_name.upper()} cannot be sorted, use the dict engine for unsorted input")
+    if phased is not None and engine == "stream":
+        sys.exit("Error: The stream engine reads file B itself and cannot use genotypes read beforehand")
+
+    if regions is not None:
+        with profile_phase("read_header"):
+            regions = normalize_regions(regions, contig_order(read_vcf_header(file_a)))
+
+    while True:
+        writer = sink
+        if sink is None:
+            content = io.BytesIO() if bcf_a else io.StringIO()
+            writer = BcfWriter(content) if bcf_a else VcfWriter(content)
+        output = writer
+        if output_format == "multihetsep":
+            output = MultihetsepWriter(writer, mask)
+        elif multihetsep is not None:
+            output = TeeWriter(writer, MultihetsepWriter(multihetsep, mask))
+        elif mask is not None:
+            output = MaskWriter(writer, mask)
+
+        try:
+            if engine == "block":
+                run_block_engine(file_a, file_b, output, write_header, regions, sample, phased, **engine_options)
+            elif engine == "stream":
+                run_stream_engine(file_a, file_b, output, write_header, regions, sample, backend, **engine_options)
+            else:
+                run_dict_engine(file_a, file_b, output, write_header, regions, sample, phased, backend, **engine_options)
+        except UnsortedInputError as error:
+            if sink is not None:
+                raise
+            print(f"INFO: {error}, merging again with file {error.input_name.upper()} sorted by an external sort", file=sys.stderr)
+            for event in EVENT_LOGGER:
+                EVENT_LOGGER[event] = 0
+            engine_options["sort_inputs"] = tuple(engine_options.get("sort_inputs", ())) + (error.input_name,)
+            continue
+        if sink is not None:
+            return None
+        writer.close()
+        return content.getvalue()
+
+def open_records_a(file_a, sink, write_header, regions, backend, lazy):
+    """
+    Opens file A for the dict and stream engines and writes its header to the sink first if write_header is set, 
+    or always to a PysamWriter.
 
-def read_vcf_header(file_path):
+    Returns:
+    - tuple: The header lines of A, a generator of its records and the function that injects a genotype of B into them.
+    """
+    with profile_phase("read_header"):
+        header_a, records_a = read_vcf_stream(file_a, regions, backend=backend, lazy=lazy)
+    bcf_a = backend == "python" and is_bcf(file_a)
+    if backend == "pysam":
+        sink.open(header_a)
+        header_a = str(header_a).splitlines(True)
+    elif bcf_a and write_header:
+        sink.write_header(header_a)
+    elif write_header:
+        sink.writelines(header_a)
+    inject = inject_genotype_pysam if backend == "pysam" else inject_genotype_bcf if bcf_a else inject_genotype
+    return header_a, records_a, inject
+
+def run_dict_engine(file_a, file_b, sink, write_header, regions, sample, phased, backend, lazy=False):
     """
-    Reads a VCF file and returns list with the header lines
+    Dict engine: reads A into a list and B into a PhasedIndex, unless phased is given, and merges every record of A 
+    with the records of B at its coordinate. The arguments are those of replace_genotypes.
 
     Args:
-    - file_path (str): The path to the VCF file.
-
-    Returns:
-    - list: A list with header lines
+    - lazy (bool): Whether to parse only the coordinate of each VCF line of A, and REF, ALT and the genotype only 
+      for records that meet a record of B, see parse_vcf_line_lazy. This saves memory when few sites of A are in B.
     """
-    vcf_data = []
-    with open_file(file_path) as file:
-        for line in file:
-            if line.startswith('#'):
-                vcf_data.append(line)
-    return vcf_data
+    header_a, records_a, inject = open_records_a(file_a, sink, write_header, regions, backend, lazy)
+    with profile_phase("parse_a"):
+        vcf_a = list(records_a)
+    with profile_phase("parse_b"):
+        vcf_b = phased if phased is not None else read_phased_index(file_b, regions, sample, backend)
+    log_dropped_duplicates(vcf_b.dropped)
+
+    with profile_phase("merge"):
+        for coordinate, record_a, shared in flag_shared_records(vcf_a):
+            log_event("read_lines", coordinate)
+            records_b = vcf_b.get_all(coordinate)
+            if records_b:
+                record_a = parse_deferred(record_a)
+            record_b = match_record(coordinate, record_a, records_b, shared)
+            if record_b is not None:
+                sink.write(inject(coordinate, record_a, record_b))
+            else:
+                # Coordinate not present in file B, use genotype from file A
+                sink.write(keep_genotype(coordinate, record_a))
+
+def run_stream_engine(file_a, file_b, sink, write_header, regions, sample, backend, lazy=False, sort_inputs=(), 
+                 sort_buffer=DEFAULT_SORT_BUFFER, sort_dir=None):
+    """
+    Stream engine: merges A and B with merge_sorted_records while checking that they are sorted. The arguments 
+    are those of replace_genotypes.
 
+    Args:
+    - lazy (bool): Whether to defer parsing the lines of A, see run_dict_engine.
+    - sort_inputs (tuple): The inputs, "a" and/or "b", that are sorted with external_sort before merging. 
+      The other inputs are checked to be sorted and UnsortedInputError is raised otherwise.
+    - sort_buffer (int): The number of bytes of lines sorted in memory by external_sort.
+    - sort_dir (str): The directory of the temporary files of external_sort.
+    """
+    header_a, records_a, inject = open_records_a(file_a, sink, write_header, regions, backend, lazy)
+    order = contig_order(header_a)
+    header_b, records_b = read_vcf_stream(file_b, regions, sample, backend=backend)
+    if "b" in sort_inputs:
+        # B is sorted like A, so the contigs of A that its header does not list are needed beforehand
+        for contig in read_contigs(file_a):
+            order.add(contig)
+        column = sample_column(header_b, sample, file_b) if sample is not None else None
+        records_b = external_sort(records_b, order.rank, record_parser(column), sort_buffer, sort_dir)
+    if "a" in sort_inputs:
+        records_a = external_sort(records_a, order.add, record_parser(lazy=lazy), sort_buffer, sort_dir)
+    records_a, records_b = check_sorted(records_a, order, "a", file_a), check_sorted(records_b, order, "b", file_b)
+    with profile_phase("merge"):
+        sink.writelines(merge_sorted_records(records_a, records_b, order, inject, file_b))
+
+def run_block_engine(file_a, file_b, sink, write_header, regions, sample, phased, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Block engine: reads A in blocks and B into PhasedArrays, unless phased is given, and merges them with 
+    merge_blocks. The arguments are those of replace_genotypes.
 
-def read_vcf(file_path):
+    Args:
+    - block_size (int): The number of bytes of A and B tokenized at once.
     """
-    Reads a VCF file and returns a dictionary where the keys are genomic coordinates
-    and the values are the corresponding genotypes.
+    if np is None:
+        sys.exit("Error: The block engine requires NumPy")
+    with profile_phase("read_header"):
+        header_a, blocks_a = read_vcf_blocks(file_a, regions, block_size)
+    if write_header:
+        sink.writelines(header_a)
+    if phased is None:
+        with profile_phase("parse_b"):
+            phased = read_phased_arrays(file_b, regions, block_size, sample)
+    log_dropped_duplicates(phased.dropped)
+    with profile_phase("merge"):
+        merge_blocks(blocks_a, phased, sink)
+
+def merge_files(file_a, file_b, output_path, engine="dict", index_format="auto", write_header=True, regions=None, 
+                buffer_size=DEFAULT_BUFFER_SIZE, block_size=DEFAULT_BLOCK_SIZE, event_dir=None, sample=None, phased=None, 
+                profile=None, output_format="vcf", mask=None, mask_min_depth=0, mask_max_depth=None, mask_min_qual=0, 
+                cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, sort_buffer=DEFAULT_SORT_BUFFER, sort_dir=None, backend="python", 
+                lazy=False, multihetsep=None):
+    """
+    Merges file A and B into an output file like the command line does: a gzipped output is written as BGZF 
+    and indexed while it is written. The event counts are reset first, so that one process can merge many 
+    pairs of files one after another. With the pysam backend, htslib writes the output and indexes it afterwards. 
+    An output whose name ends with .bcf is written as BCF with a CSI index; the python backend requires 
+    file A to be BCF for it and writes the output of a BCF file A as BCF only.
 
     Args:
-    - file_path (str): The path to the VCF file.
+    - file_a (str): Path to the VCF file for sample A.
+    - file_b (str): Path to the VCF-like file containing phased genotypes.
+    - output_path (str): Path to the output VCF file, gzipped if the name ends with .gz, BCF if it ends with .bcf.
+    - engine (str): The merge engine, see replace_genotypes.
+    - index_format (str): The index written next to a gzipped output, one of INDEX_FORMATS. BCF is indexed as CSI. 
+      An output that cannot be indexed is an error with "tbi" or "csi"; with "auto" no index is written then.
+    - write_header (bool): Whether to write the header of file A.
+    - regions (list): Regions as tuples of contig, start and end (1-based, inclusive), or None for all records.
+    - buffer_size (int): The number of characters collected before they are written to the output.
+    - block_size (int): The number of bytes of A and B tokenized at once by the block engine.
+    - event_dir (str): If given, the positions of every logged event are written to this directory.
+    - sample (str): The sample of a multi-sample file B, see replace_genotypes.
+    - phased (PhasedIndex or PhasedArrays): The genotypes of B read beforehand, see replace_genotypes.
+    - profile (str): If given, the time spent in each phase, the throughput and the peak RSS are written 
+      to this JSON file, see PhaseProfiler.
+    - output_format (str): One of OUTPUT_FORMATS, see replace_genotypes. A multihetsep output is not indexed.
+    - mask (str): If given, the callable positions of A are written to this BED file, see CallableMask.
+    - mask_min_depth (int): The smallest depth of a callable record.
+    - mask_max_depth (int): The largest depth of a callable record, or None for no limit.
+    - mask_min_qual (float): The smallest QUAL of a callable record.
+    - cache_dir (str): If given, the genotypes of B are read from a PhasedCache in this directory, where they are 
+      added on first use. Not used by the stream engine, for regions or if phased is given.
+    - cache_size (int): The largest total size of the cache directory in bytes.
+    - sort_buffer (int): The number of bytes of lines the stream engine sorts in memory if an input is not sorted.
+    - sort_dir (str): The directory of the temporary files of that sort.
+    - backend (str): One of BACKENDS, see replace_genotypes. Inputs compressed with gzip instead of bgzip, which 
+      pysam cannot read, are merged by the python backend.
+    - lazy (bool): Whether to defer parsing the lines of A, see run_dict_engine.
+    - multihetsep (str): If given, the heterozygous sites of the merged VCF are also written to this file in the 
+      multihetsep format (gzipped if the name ends with .gz), in the same pass, see replace_genotypes.
 
     Returns:
-    - dict: A dictionary with genomic coordinates as keys and genotypes as values.
+    - dict: The count of every event of this merge.
     """
-    vcf_data = {}
-    with open_file(file_path) as file:
-        for line in file:
-            if not line.startswith('#'):
-                parts = line.strip().split('\t')
-                coordinate = (parts[0], int(parts[1]))
-                ref = parts[3]
-                alt = parts[4]
-                format_genotype = parts[9].split(':')[0]
-                format_other = "".join(parts[9].split(':')[1:])
-                vcf_data[coordinate] = (line, ref, alt, format_genotype, format_other)
-    return vcf_data
-
-def replace_genotypes(file_a, file_b):
+    if backend == "pysam":
+        for path in (file_a, file_b):
+            if path.endswith('.gz') and not is_bgzf(path):
+                print(f"WARNING: {path} is compressed with gzip instead of bgzip, which pysam cannot read; "
+                      "merging with the python backend", file=sys.stderr)
+                backend = "python"
+                break
+    bcf_output = output_path.endswith('.bcf')
+    # checked before the output is created, so that no empty output is left behind
+    if engine == "block" and backend == "python":
+        for path in (file_a, file_b):
+            if is_bcf(path):
+                sys.exit(f"Error: The block engine cannot read the BCF file {path}, use the dict or stream engine")
+    if backend == "python" and output_format == "vcf" and bcf_output != is_bcf(file_a):
+        sys.exit(f"Error: The python backend writes a BCF file A as BCF and a VCF file A as VCF, use --backend pysam to write {output_path} from {file_a}")
+    merge_events.PROFILER = PhaseProfiler() if profile else None
+
+    if cache_dir and phased is None and regions is None and engine != "stream":
+        with profile_phase("parse_b"):
+            phased = PhasedCache(cache_dir, cache_size).load(file_b, sample, arrays=engine == "block")
+
+    engine_options = {name: value for name, value in (("lazy", lazy), ("sort_buffer", sort_buffer), ("sort_dir", sort_dir), 
+                                                       ("block_size", block_size)) if name in ENGINE_OPTIONS.get(engine, ())}
+    # the stream engine detects unsorted input while merging; the output is then written again from 
+    # the start, with that input sorted by external_sort
+    while True:
+        for event in EVENT_LOGGER:
+            EVENT_LOGGER[event] = 0
+        merge_events.EVENT_SINK = EventSink(event_dir) if event_dir else None
+        indexer = None
+        if index_format != "none" and output_path.endswith(('.gz', '.bcf')) and output_format == "vcf":
+            indexer = TabixIndexer(index_format, bcf=bcf_output, required=index_format != "auto")
+
+        callable_mask = CallableMask(mask, mask_min_depth, mask_max_depth, mask_min_qual) if mask else None
+        try:
+            if backend == "pysam":
+                with PysamWriter(output_path) as sink:
+                    replace_genotypes(file_a, file_b, sink=sink, engine=engine, write_header=write_header, regions=regions, 
+                                      sample=sample, phased=phased, output_format=output_format, mask=callable_mask, 
+                                      multihetsep=multihetsep, backend=backend, **engine_options)
+                break
+            with open_file(output_path, "wb" if bcf_output else "wt") as output_file, \
+                 open_file(multihetsep, "wt") if multihetsep else nullcontext() as multihetsep_file:
+                with BcfWriter(output_file, buffer_size, indexer) if bcf_output else VcfWriter(output_file, buffer_size, indexer) as sink, \
+                     VcfWriter(multihetsep_file, buffer_size) if multihetsep else nullcontext() as multihetsep_sink:
+                    replace_genotypes(file_a, file_b, sink=sink, engine=engine, write_header=write_header, regions=regions, 
+                                      sample=sample, phased=phased, output_format=output_format, mask=callable_mask, 
+                                      multihetsep=multihetsep_sink, **engine_options)
+                with profile_phase("write"):
+                    output_file.close()
+        except UnsortedInputError as error:
+            if backend == "pysam":
+                sys.exit(f"Error: {error}; the pysam backend cannot sort its input, use the dict engine")
+            print(f"INFO: {error}, merging again with file {error.input_name.upper()} sorted by an external sort", file=sys.stderr)
+            engine_options["sort_inputs"] = engine_options.get("sort_inputs", ()) + (error.input_name,)
+            continue
+        finally:
+            if callable_mask is not None:
+                callable_mask.close()
+        break
+
+    if indexer is not None and backend == "pysam":
+        # the index format is resolved from the ##contig lines as TabixIndexer does it
+        for line in read_vcf_header(file_a):
+            indexer.add(line, 0, 0)
+        with profile_phase("write"):
+            pysam.tabix_index(output_path, preset="vcf", force=True, csi=indexer.index_path(output_path).endswith(".csi"))
+    elif indexer is not None:
+        bgzf_writer = output_file.raw if bcf_output else output_file.buffer.raw
+        with profile_phase("write"):
+            indexer.write(indexer.index_path(output_path), bgzf_writer.virtual_offset)
+
+    if merge_events.EVENT_SINK is not None:
+        merge_events.EVENT_SINK.close()
+        merge_events.EVENT_SINK = None
+    if merge_events.PROFILER is not None:
+        write_profile(merge_events.PROFILER.report(EVENT_LOGGER), profile)
+        merge_events.PROFILER = None
+    return dict(EVENT_LOGGER)
+
+def _merge_part(file_a, file_b, output_path, threads, options):
+    # runs in a worker process of merge_files_parallel
+    bgzf.IO_THREADS = threads
+    return merge_files(file_a, file_b, output_path, **options)
+
+def merge_files_parallel(file_a, file_b, output_path, jobs, threads=1, index_format="auto", write_header=True, regions=None, **options):
     """
-    Replaces unphased genotypes in file A with phased genotypes from file B based on genomic coordinates.
+    Merges file A and B like merge_files, but splits the work by contig and merges the contigs in a pool of 
+    jobs processes. Each contig is read through the tabix or CSI index of the inputs and merged into a part 
+    file of its own; the parts are concatenated in the order of the ##contig lines of file A. An indexed
+    contig without a ##contig line follows the contig before it in the index, see ContigOrder. BGZF parts
+    are concatenated without recompressing them.
+
+    The output equals that of merge_files for input sorted by contig in header order. If file A is not indexed 
+    and no regions are given, its contigs are unknown and everything is merged in one process.
 
     Args:
     - file_a (str): Path to the VCF file for sample A.
     - file_b (str): Path to the VCF-like file containing phased genotypes.
+    - output_path (str): Path to the output VCF file, gzipped if the name ends with .gz.
+    - jobs (int): The number of worker processes.
+    - threads (int): The number of BGZF threads of every worker.
+    - index_format (str): The index written next to a gzipped output, one of INDEX_FORMATS. The parts are indexed in 
+      the format resolved from the header of file A, and a part that cannot be indexed is an error.
+    - write_header (bool): Whether to write the header of file A.
+    - regions (list): Regions as tuples of contig, start and end (1-based, inclusive), or None for all records.
+    - options: Further keyword arguments of merge_files.
 
     Returns:
-    - str: The updated content for sample A in VCF format.
+    - dict: The count of every event, summed over all contigs.
     """
-    vcf_a = read_vcf(file_a)
-    vcf_b = read_vcf(file_b)
-
-    updated_content = []
-
-    for coordinate, (line_a, ref_a, alt_a, format_genotype_a, format_other_a) in vcf_a.items():
-        EVENT_LOGGER["read_lines"].append(coordinate)
-        if coordinate in vcf_b:
-            (line_b, ref_b, alt_b, format_genotype_b, format_other_b) = vcf_b[coordinate]
-
-            # Check consistency of REF and ALT alleles
-            if format_genotype_a not in ALLOWED_GENOTYPES:
-                sys.exit("Error: Unphased genotype in file A must be {",".join(ALLOWED_GENOTYPES)}")
-            if format_genotype_b not in map(phase_genotype, ALLOWED_GENOTYPES):
-                sys.exit("Error: Phased genotype in file B must be {",".join(map(phase_genotype, ALLOWED_GENOTYPES))}")
-
-            ref_alt_a = format_genotype_a.split('/')
-            ref_alt_b = format_genotype_b.split('|')
-
-            if ref_alt_a != ref_alt_b:
-                EVENT_LOGGER["inconsistent_ref_alt_genotypes"].append(coordinate)
-
-                if VERBOSE:
-                    print(f"INFO: Inconsistent REF and ALT genotypes at coordinate {coordinate}: {ref_alt_a} vs {ref_alt_b}", file=sys.stderr)
-            
-            alleles_a = ref_a, alt_a
-            alleles_b = ref_b, alt_b
-
-            if alleles_a != alleles_b:
-                EVENT_LOGGER["inconsistent_ref_alt_alleles"].append(coordinate)
-
-                if VERBOSE:
-                    print(f"WARNING: Inconsistent REF and ALT alleles at coordinate {coordinate}: {alleles_a} vs {alleles_b}", file=sys.stderr)
-
-            
-            # Inejct genotype from file B into line from file A
-            line_b_parts = line_b.strip().split('\t')
-            modified_line_a_parts = line_a.strip().split('\t')
-            modified_line_a_parts[9] = f"{format_genotype_b}:{format_other_a}"
-            modified_line_a = '\t'.join(modified_line_a_parts) + '\n'
-            updated_content.append(modified_line_a)
-            EVENT_LOGGER["replaced_genotypes"].append(coordinate)
-
-            if VERBOSE:
-                print("INFO: Replaced genotype at coordinate", coordinate, file=sys.stderr)
+    if is_bcf(file_a) or output_path.endswith('.bcf'):
+        print("WARNING: BCF files are merged in one process", file=sys.stderr)
+        return merge_files(file_a, file_b, output_path, index_format=index_format, write_header=write_header, regions=regions, **options)
+    header = read_vcf_header(file_a)
+    order = contig_order(header)
+    sizes = {}
+    if regions is not None:
+        parts = {}
+        for contig, start, end in normalize_regions(regions, order):
+            parts.setdefault(contig, []).append((contig, start, end))
+    else:
+        index = find_index(file_a)
+        if index is None:
+            print(f"WARNING: {file_a} is not indexed, merging all contigs in one process", file=sys.stderr)
+            return merge_files(file_a, file_b, output_path, index_format=index_format, write_header=write_header, **options)
+        for contig, (bins, linear, meta) in index.refs.items():
+            order.add(contig)
+            sizes[contig] = meta[2] if meta is not None else 0
+        parts = {contig: [(contig, 1, MAX_POSITION)] for contig in sorted(index.refs, key=order.get)}
+
+    if len(parts) <= 1:
+        return merge_files(file_a, file_b, output_path, index_format=index_format, write_header=write_header, regions=regions, **options)
+    if options.get("backend") == "pysam":
+        print("WARNING: The pysam backend always writes the header and merges all contigs in one process", file=sys.stderr)
+        return merge_files(file_a, file_b, output_path, index_format=index_format, write_header=write_header, regions=regions, **options)
+
+    # all parts share the index format resolved from the header, which only the first part writes
+    compressed = output_path.endswith('.gz')
+    part_format = "none"
+    if compressed and index_format != "none" and options.get("output_format", "vcf") == "vcf":
+        indexer = TabixIndexer(index_format, required=index_format != "auto")
+        for line in header:
+            indexer.add(line, 0, 0)
+        part_format = indexer.index_path(output_path).rpartition('.')[2]
+
+    directory = tempfile.mkdtemp(prefix=os.path.basename(output_path) + ".", dir=os.path.dirname(output_path) or ".")
+    part_paths = [os.path.join(directory, f"{i}.vcf.gz" if compressed else f"{i}.vcf") for i in range(len(parts))]
+    counts = dict.fromkeys(EVENT_LOGGER, 0)
+    # every part is profiled on its own, the profiles are combined once all parts are written
+    profile = options.pop("profile", None)
+    mask = options.pop("mask", None)
+    multihetsep = options.pop("multihetsep", None)
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(parts))) as pool:
+            # the largest contigs are submitted first, so that none of them starts last
+            contigs = list(parts)
+            futures = []
+            for i in sorted(range(len(contigs)), key=lambda i: -sizes.get(contigs[i], 0)):
+                part_options = dict(options, index_format=part_format, write_header=write_header and i == 0, regions=parts[contigs[i]], 
+                                    profile=part_paths[i] + ".profile.json" if profile else None, 
+                                    mask=part_paths[i] + ".mask.bed" if mask else None, 
+                                    multihetsep=part_paths[i] + ".multihetsep.txt" if multihetsep else None)
+                futures.append(pool.submit(_merge_part, file_a, file_b, part_paths[i], threads, part_options))
+            for future in futures:
+                for event, count in future.result().items():
+                    counts[event] += count
+
+        if compressed:
+            # a part that cannot be indexed has ended the merge with an error
+            concat_bgzf(part_paths, output_path, None if part_format == "none" else part_format)
         else:
-            # Coordinate not present in file B, use genotype from file A
-            updated_content.append(line_a)
-            EVENT_LOGGER["kept_genotypes"].append(coordinate)
-
-            if VERBOSE:
-                print("INFO: Kept genotype at coordinate", coordinate, file=sys.stderr)
-            
-
-
-    # Add remaining contents from file A
-    # for coordinate, (line_a,ref_a, alt_a, format_gentype_a, format_other_a, _) in vcf_a.items():
-    #     if coordinate not in vcf_b:
-    #         updated_content.append(line_a)
-    #         print("INFO: Kept genotype at coordinate", coordinate, file=sys.stderr)
-
-
-    return ''.join(updated_content)
+            with open(output_path, 'wb') as output_file:
+                for path in part_paths:
+                    with open(path, 'rb') as part_file:
+                        shutil.copyfileobj(part_file, output_file)
+
+        for side_path, extension in ((mask, ".mask.bed"), (multihetsep, ".multihetsep.txt")):
+            if side_path:
+                with open_file(side_path, 'wb') as side_file:
+                    for path in part_paths:
+                        with open(path + extension, 'rb') as part_file:
+                            shutil.copyfileobj(part_file, side_file)
+
+        if profile:
+            profiles = []
+            for path in part_paths:
+                with open(path + ".profile.json") as profile_file:
+                    profiles.append(json.load(profile_file))
+            write_profile(combine_profiles(profiles, time.perf_counter() - start), profile)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return counts
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        sys.exit("Usage: python script.py <file_A.vcf[.gz]> <file_B.vcf[.gz]> <output.vcf[.gz]")
-    
-    file_a_path = sys.argv[1]
-    file_b_path = sys.argv[2]
-    output_file_path = sys.argv[3]
-
-    header_a  = read_vcf_header(file_a_path)
-    result = replace_genotypes(file_a_path, file_b_path)
-    with open_file(output_file_path, "wt") as output_file:
-        output_file.write("".join(header_a))
-        output_file.write(result)
-    
-    # print event counts in EVENT_LOGGER
-    for event, coordinates in EVENT_LOGGER.items():
-        print(f"{event}\t{len(coordinates)}")
+    parser = argparse.ArgumentParser(description="Inject phased genotypes from file B into the VCF file A.")
+    parser.add_argument("file_a", help="VCF file with unphased genotypes (A), optionally gzipped, or BCF")
+    parser.add_argument("file_b", help="VCF-like file with phased genotypes (B), optionally gzipped, or BCF")
+    parser.add_argument("output", help="Output VCF file, gzipped if the name ends with .gz; BCF if it ends with .bcf, "
+                                       "which the python backend writes for a BCF file A only")
+    parser.add_argument("--sample",
+                        help="sample of a multi-sample file B whose genotypes are injected (default: the first sample column)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="vcf",
+                        help="'multihetsep' writes the heterozygous sites in the input format of MSMC2 instead of a VCF file; "
+                             "requires sorted input and is not indexed (default: vcf)")
+    parser.add_argument("--multihetsep",
+                        help="also write the heterozygous sites of the merged VCF to this file in the input format of MSMC2, "
+                             "in the same pass (gzipped if the name ends with .gz); requires sorted input")
+    parser.add_argument("--mask",
+                        help="write the callable positions of file A to this BED file (gzipped if the name ends with .gz), "
+                             "e.g. for generate_multihetsep.py --mask; with multihetsep output only callable sites are counted")
+    parser.add_argument("--mask-min-depth", type=int, default=0,
+                        help="smallest read depth (FORMAT DP, or INFO DP) of a callable position (default: 0)")
+    parser.add_argument("--mask-max-depth", type=int,
+                        help="largest read depth of a callable position (default: no limit)")
+    parser.add_argument("--mask-min-qual", type=float, default=0,
+                        help="smallest QUAL of a callable position (default: 0)")
+    parser.add_argument("--cache-dir",
+                        help="keep the parsed genotypes of file B in this directory and map them into memory in later runs "
+                             "instead of parsing B again (dict and block engine, whole files only)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE >> 20,
+                        help=f"largest size of the cache directory in MiB; the least recently used files are removed (default: {DEFAULT_CACHE_SIZE >> 20})")
+    parser.add_argument("--sort-buffer", type=int, default=DEFAULT_SORT_BUFFER >> 20,
+                        help="MiB of lines the stream engine sorts in memory at once if an input turns out not to be sorted; "
+                             f"larger inputs are sorted in temporary files (default: {DEFAULT_SORT_BUFFER >> 20})")
+    parser.add_argument("--sort-dir",
+                        help="directory of the temporary files of that sort (default: the system temporary directory)")
+    parser.add_argument("--engine", choices=ENGINES, default="dict",
+                        help="merge engine; 'stream' keeps memory constant for coordinate-sorted input and sorts unsorted input in temporary files, "
+                             "'block' requires NumPy and processes records in vectorized blocks (default: dict)")
+    parser.add_argument("--backend", choices=BACKENDS, default="python",
+                        help="'pysam' reads and writes with htslib through pysam (dict and stream engine, VCF output only); "
+                             "it re-encodes the records of A and keeps their FORMAT fields apart from GT intact (default: python)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                        help=f"number of bytes of each input tokenized at once by the block engine (default: {DEFAULT_BLOCK_SIZE})")
+    parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE,
+                        help=f"number of characters collected before they are written to the output (default: {DEFAULT_BUFFER_SIZE})")
+    parser.add_argument("--event-dir",
+                        help="write the positions of every logged event to one binary file per contig and event type in this directory")
+    parser.add_argument("--threads", type=int, default=bgzf.IO_THREADS,
+                        help=f"number of threads for BGZF decompression and compression (default: {bgzf.IO_THREADS})")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes merging the contigs of indexed inputs in parallel, each with --threads threads (default: 1)")
+    parser.add_argument("--index", choices=INDEX_FORMATS, default="auto",
+                        help="index written next to a gzipped output; 'auto' writes .tbi, or .csi for contigs longer than 2^29 bp, "
+                             "and no index for unsorted output, for which 'tbi' and 'csi' exit with an error; "
+                             "BCF is always indexed as .csi (default: auto)")
+    parser.add_argument("--no-header", action="store_true",
+                        help="do not write the header of file A, e.g. for all but the first chunk of a chromosome")
+    parser.add_argument("--region", action="append",
+                        help="only merge records within this region, given as contig[:start[-end]] with 1-based inclusive coordinates; may be repeated")
+    parser.add_argument("--regions-file",
+                        help="only merge records within the regions of this BED file")
+    parser.add_argument("--lazy", action="store_true",
+                        help="parse REF, ALT and the genotype of a VCF line of A only if B has a record at its position; "
+                             "saves memory in the dict engine when few sites of A are in B, but is slower when most are")
+    parser.add_argument("--profile",
+                        help="write the wall and CPU time of each phase (header, parsing A and B, merging, writing), "
+                             "records per second and peak RSS to this JSON file")
+    parser.add_argument("--profile-stats",
+                        help="run the merge under cProfile and dump the statistics to this file for pstats; "
+                             "with --jobs only the main process is covered")
+    args = parser.parse_args()
+
+    bgzf.IO_THREADS = max(1, args.threads)
+
+    regions = None
+    if args.region or args.regions_file:
+        regions = [parse_region(region) for region in args.region or []]
+        if args.regions_file:
+            regions.extend(read_bed_regions(args.regions_file))
+
+    options = dict(engine=args.engine, index_format=args.index, write_header=not args.no_header, regions=regions, 
+                   buffer_size=args.buffer_size, block_size=args.block_size, event_dir=args.event_dir, sample=args.sample, 
+                   profile=args.profile, output_format=args.output_format, mask=args.mask, mask_min_depth=args.mask_min_depth, 
+                   mask_max_depth=args.mask_max_depth, mask_min_qual=args.mask_min_qual, cache_dir=args.cache_dir, cache_size=args.cache_size << 20, 
+                   sort_buffer=args.sort_buffer << 20, sort_dir=args.sort_dir, backend=args.backend, lazy=args.lazy, multihetsep=args.multihetsep)
+    profiler = cProfile.Profile() if args.profile_stats else None
+    if profiler is not None:
+        profiler.enable()
+    if args.jobs > 1:
+        counts = merge_files_parallel(args.file_a, args.file_b, args.output, args.jobs, bgzf.IO_THREADS, **options)
+    else:
+        counts = merge_files(args.file_a, args.file_b, args.output, **options)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile_stats)
 
+    # print event counts in EVENT_LOGGER
+    print_event_counts(counts)
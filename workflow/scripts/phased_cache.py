@@ -0,0 +1,192 @@
+"""
+License: MIT
+
+PhasedCache, a directory of files B parsed once and stored in a memory-mapped columnar format.
+"""
+
+import os
+import sys
+import json
+import mmap
+import hashlib
+import struct
+import tempfile
+from array import array
+
+from phased_index import PhasedContig, PhasedIndex, read_phased_index
+from block_engine import PhasedArrays, np
+
+# largest total size of the files in a PhasedCache directory before the least recently used are removed
+DEFAULT_CACHE_SIZE = 4 << 30
+
+# the four 2-bit genotype codes packed into each byte of PhasedContig.genotypes
+_UNPACKED_CODES = [bytes((byte & 3, byte >> 2 & 3, byte >> 4 & 3, byte >> 6)) for byte in range(256)]
+
+class PhasedCache:
+    """
+    A directory of the phased genotypes of files B, parsed once and stored in a columnar binary file that later 
+    runs map into memory instead of decompressing and parsing B again. An entry is keyed by the absolute path, 
+    modification time and size of B and by the sample read, so a changed file B gets a new entry. Entries 
+    serve both the dict engine (PhasedIndex) and the block engine (PhasedArrays). 
+    Only whole files are cached; merges restricted to regions read B as usual.
+
+    An entry holds a JSON header and, per contig, the sorted positions (int64), the offsets of the 
+    tab-separated REF and ALT of each record (int64) and the alleles, the 2-bit genotype codes packed four 
+    per byte and one code per record (255 for genotypes without a code, which are kept in the header). 
+    The header also lists the positions of the dropped duplicate records, so that they are logged on every use. 
+    When the files of the directory exceed max_size bytes, the least recently used ones are removed.
+
+    Args:
+    - directory (str): The cache directory, created if missing.
+    - max_size (int): The largest total size of the cache files in bytes.
+    """
+    MAGIC = b'MGPHASE2'
+    EXTENSION = ".phased"
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+
+    def entry_path(self, file_path, sample=None):
+        """
+        Returns the path of the cache file of a file B and sample.
+        """
+        stat = os.stat(file_path)
+        key = json.dumps([os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, sample])
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + self.EXTENSION)
+
+    def load(self, file_path, sample=None, arrays=False):
+        """
+        Returns the phased genotypes of a file B from the cache, parsing B and adding it first if it is missing.
+
+        Args:
+        - file_path (str): The path to file B.
+        - sample (str): The sample to read, by default the first sample column.
+        - arrays (bool): Whether to return PhasedArrays for the block engine instead of a PhasedIndex.
+
+        Returns:
+        - PhasedIndex or PhasedArrays: The phased genotypes, backed by the memory-mapped cache file.
+        """
+        path = self.entry_path(file_path, sample)
+        try:
+            header, buffer = self._open(path)
+            # the modification time marks the entry as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            self._write(path, read_phased_index(file_path, sample=sample))
+            self.evict(keep=path)
+            header, buffer = self._open(path)
+        return self._phased_arrays(header, buffer) if arrays else self._phased_index(header, buffer)
+
+    def _write(self, path, index):
+        contigs, chunks = [], []
+        offset = 0
+
+        def add(data):
+            nonlocal offset
+            chunks.append((offset, data))
+            start = offset
+            offset += len(data) + (-len(data) % 8)
+            return start
+
+        for name, contig in index.contigs.items():
+            n = len(contig.positions)
+            codes = bytearray(b''.join(_UNPACKED_CODES[byte] for byte in contig.genotypes)[:n])
+            for i in contig.invalid:
+                codes[i] = 255
+            contigs.append({
+                "name": name,
+                "records": n,
+                "positions": add(contig.positions.tobytes()),
+                "allele_offsets": add(contig.allele_offsets.tobytes()),
+                "alleles": [add(bytes(contig.alleles)), len(contig.alleles)],
+                "genotypes": [add(bytes(contig.genotypes)), len(contig.genotypes)],
+                "codes": add(bytes(codes)),
+                "invalid": {str(i): genotype for i, genotype in contig.invalid.items()},
+                "dropped": contig.dropped.tolist(),
+            })
+        header = json.dumps({"byteorder": sys.byteorder, "contigs": contigs}).encode()
+        header += b' ' * (-(len(self.MAGIC) + 8 + len(header)) % 8)
+        # written under a temporary name and renamed, so that concurrent jobs never read a partial entry
+        file = tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False)
+        try:
+            with file:
+                file.write(self.MAGIC + struct.pack('<Q', len(header)) + header)
+                for start, data in chunks:
+                    file.write(data + bytes(-len(data) % 8))
+            # temporary files are private, the cache may be shared
+            os.chmod(file.name, 0o644)
+            os.replace(file.name, path)
+        except BaseException:
+            os.remove(file.name)
+            raise
+
+    def _open(self, path):
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(f"{path} is no phased cache file")
+        header_size, = struct.unpack_from('<Q', buffer, len(self.MAGIC))
+        data_offset = len(self.MAGIC) + 8 + header_size
+        header = json.loads(buffer[len(self.MAGIC) + 8:data_offset])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written with another byte order")
+        return header, memoryview(buffer)[data_offset:]
+
+    def _phased_index(self, header, buffer):
+        index = PhasedIndex()
+        for entry in header["contigs"]:
+            n = entry["records"]
+            contig = PhasedContig.__new__(PhasedContig)
+            contig.ordered = True
+            contig.positions = buffer[entry["positions"]:entry["positions"] + 8 * n].cast('q')
+            contig.allele_offsets = buffer[entry["allele_offsets"]:entry["allele_offsets"] + 8 * (n + 1)].cast('q')
+            contig.alleles = buffer[entry["alleles"][0]:entry["alleles"][0] + entry["alleles"][1]]
+            contig.genotypes = buffer[entry["genotypes"][0]:entry["genotypes"][0] + entry["genotypes"][1]]
+            contig.invalid = {int(i): genotype for i, genotype in entry["invalid"].items()}
+            contig.dropped = array('q', entry["dropped"])
+            index.contigs[entry["name"]] = contig
+        return index
+
+    def _phased_arrays(self, header, buffer):
+        if np is None:
+            sys.exit("Error: The block engine requires NumPy")
+        index = PhasedArrays()
+        for entry in header["contigs"]:
+            n = entry["records"]
+            positions = np.frombuffer(buffer, dtype=np.int64, count=n, offset=entry["positions"])
+            offsets = np.frombuffer(buffer, dtype=np.int64, count=n + 1, offset=entry["allele_offsets"])
+            codes = np.frombuffer(buffer, dtype=np.uint8, count=n, offset=entry["codes"])
+            alleles = np.frombuffer(buffer, dtype=np.uint8, count=entry["alleles"][1], offset=entry["alleles"][0])
+            index.contigs[entry["name"]] = (positions, codes, offsets[:-1], np.diff(offsets), alleles)
+            index.dropped[entry["name"]] = entry["dropped"]
+        return index
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used cache files until the directory holds at most max_size bytes.
+
+        Args:
+        - keep (str): A cache file that is never removed, e.g. the one just written.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.EXTENSION):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
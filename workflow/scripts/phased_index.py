@@ -0,0 +1,181 @@
+"""
+License: MIT
+
+PhasedIndex, the compact in-memory lookup of the phased genotypes of file B used by the dict engine.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from bcf import is_bcf, parse_bcf_genotypes
+from vcf_reader import iter_vcf_records, parse_sample_genotypes, read_vcf_header, read_vcf_stream, sample_column
+
+# phased genotypes in the order of their 2-bit code in PhasedIndex
+PHASED_GENOTYPES = ('0|0', '0|1', '1|0', '1|1')
+PHASED_GENOTYPE_CODES = {genotype: code for code, genotype in enumerate(PHASED_GENOTYPES)}
+
+class PhasedContig:
+    """
+    The phased genotypes of file B on one contig, see PhasedIndex.
+    """
+    __slots__ = ('positions', 'alleles', 'allele_offsets', 'genotypes', 'invalid', 'ordered', 'dropped')
+
+    def __init__(self):
+        self.positions = array('q')
+        # REF and ALT of record i are alleles[allele_offsets[i]:allele_offsets[i + 1]], separated by a tab
+        self.alleles = bytearray()
+        self.allele_offsets = array('q', [0])
+        # one code per byte while reading, four 2-bit codes per byte after finish()
+        self.genotypes = bytearray()
+        # genotypes without a 2-bit code, by record index
+        self.invalid = {}
+        self.ordered = True
+        # positions of records replaced by a later record with the same REF and ALT
+        self.dropped = array('q')
+
+    def add(self, pos, ref, alt, genotype):
+        alleles = f"{ref}\t{alt}".encode()
+        code = PHASED_GENOTYPE_CODES.get(genotype)
+        positions = self.positions
+        if positions and pos <= positions[-1]:
+            if pos < positions[-1]:
+                self.ordered = False
+            else:
+                # records of one position are kept side by side, the last one with the same alleles wins
+                i = len(positions) - 1
+                while i >= 0 and positions[i] == pos:
+                    if self.alleles[self.allele_offsets[i]:self.allele_offsets[i + 1]] == alleles:
+                        self.dropped.append(pos)
+                        self.invalid.pop(i, None)
+                        if code is None:
+                            self.invalid[i] = genotype
+                        self.genotypes[i] = code or 0
+                        return
+                    i -= 1
+        if code is None:
+            self.invalid[len(positions)] = genotype
+            code = 0
+        positions.append(pos)
+        self.alleles += alleles
+        self.allele_offsets.append(len(self.alleles))
+        self.genotypes.append(code)
+
+    def finish(self):
+        if not self.ordered:
+            self._sort()
+        codes = self.genotypes + bytes(-len(self.genotypes) % 4)
+        self.genotypes = bytearray(a | b << 2 | c << 4 | d << 6 for a, b, c, d in zip(codes[0::4], codes[1::4], codes[2::4], codes[3::4]))
+
+    def _sort(self):
+        # stable sort by position, of the records with the same position, REF and ALT the last one wins
+        order = sorted(range(len(self.positions)), key=self.positions.__getitem__)
+        positions, alleles, offsets, genotypes, invalid, dropped = self.positions, self.alleles, self.allele_offsets, self.genotypes, self.invalid, self.dropped
+        self.__init__()
+        self.dropped = dropped
+        for i in order:
+            genotype = invalid[i] if i in invalid else PHASED_GENOTYPES[genotypes[i]]
+            self.add(positions[i], *self._split(alleles[offsets[i]:offsets[i + 1]]), genotype)
+
+    def _split(self, alleles):
+        return str(alleles, 'utf-8').split('\t')
+
+    def _record(self, i):
+        ref, alt = self._split(self.alleles[self.allele_offsets[i]:self.allele_offsets[i + 1]])
+        genotype = self.invalid.get(i) if self.invalid else None
+        if genotype is None:
+            genotype = PHASED_GENOTYPES[self.genotypes[i >> 2] >> ((i & 3) << 1) & 3]
+        return (None, ref, alt, genotype, None)
+
+    def get_all(self, pos):
+        positions = self.positions
+        i = bisect_left(positions, pos)
+        if i == len(positions) or positions[i] != pos:
+            return ()
+        if i + 1 == len(positions) or positions[i + 1] != pos:
+            return (self._record(i),)
+        return tuple(self._record(j) for j in range(i, bisect_right(positions, pos)))
+
+class PhasedIndex:
+    """
+    Compact in-memory lookup of the phased genotypes in file B for input A in any order. 
+    Per contig, the positions are held in a sorted array('q') and searched with bisect, REF and ALT 
+    are packed into one byte string and the genotypes are stored as 2-bit codes. Genotypes without 
+    a code are kept aside so that they are still reported when matched. Records that share a position 
+    are kept next to each other, unless they also share REF and ALT: then the last one wins.
+    """
+    def __init__(self):
+        self.contigs = {}
+
+    def add(self, coordinate, ref, alt, genotype):
+        contig = self.contigs.get(coordinate[0])
+        if contig is None:
+            contig = self.contigs[coordinate[0]] = PhasedContig()
+        contig.add(coordinate[1], ref, alt, genotype)
+
+    def finish(self):
+        for contig in self.contigs.values():
+            contig.finish()
+
+    def get_all(self, coordinate):
+        """
+        Returns the records of file B at a coordinate in the form of iter_vcf_records 
+        (without line and sample offset) as a tuple, empty if there are none.
+        """
+        contig = self.contigs.get(coordinate[0])
+        return () if contig is None else contig.get_all(coordinate[1])
+
+    @property
+    def dropped(self):
+        """
+        The positions of the records of B replaced by a later record with the same coordinate, REF and ALT, by contig.
+        """
+        return {name: contig.dropped for name, contig in self.contigs.items()}
+
+def read_phased_index(file_path, regions=None, sample=None, backend="python"):
+    """
+    Reads the phased genotypes of file B into a PhasedIndex.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions, or None for all records.
+    - sample (str): The sample to read, by default the first sample column.
+    - backend (str): One of BACKENDS, see read_vcf_stream.
+
+    Returns:
+    - PhasedIndex: The phased genotypes by coordinate.
+    """
+    if sample is not None and backend == "python":
+        return read_phased_indices(file_path, [sample], regions)[sample]
+    index = PhasedIndex()
+    for coordinate, (line, ref, alt, format_genotype, sample_offset) in iter_vcf_records(file_path, regions, sample, backend):
+        index.add(coordinate, ref, alt, format_genotype)
+    index.finish()
+    return index
+
+def read_phased_indices(file_path, samples, regions=None):
+    """
+    Reads the phased genotypes of several samples of a multi-sample file B in one pass, 
+    into one PhasedIndex per sample. Each line is scanned up to the last requested sample column.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - samples (list): The sample names.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions, or None for all records.
+
+    Returns:
+    - dict: The PhasedIndex of every sample.
+    """
+    header = read_vcf_header(file_path)
+    columns = sorted({sample_column(header, sample, file_path): sample for sample in samples}.items())
+    indices = [PhasedIndex() for _ in columns]
+    sample_columns = [column for column, sample in columns]
+    # the genotypes of a BCF record are found from the offset of the first sample, those of a line from the first requested one
+    bcf = is_bcf(file_path)
+    parse_genotypes = parse_bcf_genotypes if bcf else parse_sample_genotypes
+    header, records = read_vcf_stream(file_path, regions, column=0 if bcf else sample_columns[0])
+    for coordinate, (line, ref, alt, format_genotype, sample_offset) in records:
+        for index, genotype in zip(indices, parse_genotypes(line, sample_offset, sample_columns)):
+            index.add(coordinate, ref, alt, genotype)
+    for index in indices:
+        index.finish()
+    return {sample: index for (column, sample), index in zip(columns, indices)}
@@ -0,0 +1,126 @@
+"""
+License: MIT
+
+The pysam backend: VCF and BCF files are read and written by htslib through pysam.VariantFile (requires pysam).
+"""
+
+import sys
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+import bgzf
+from merge_events import profile_phase
+from regions import MAX_POSITION
+
+class PysamWriter:
+    """
+    Writes the records of the pysam backend with htslib through pysam.VariantFile, in place of a VcfWriter. 
+    A name ending with .bcf is written as BCF and one ending with .gz as BGZF-compressed VCF, both with bgzf.IO_THREADS 
+    threads, any other as text VCF. The file is opened once the header of A is known, which htslib always writes first.
+
+    Args:
+    - file_path (str): The path to the output file.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = None
+
+    def open(self, header):
+        mode = 'wb' if self.file_path.endswith('.bcf') else 'wz' if self.file_path.endswith('.gz') else 'w'
+        self.file = open_variant_file(self.file_path, mode, header)
+
+    def write(self, record):
+        try:
+            self.file.write(record)
+        except OSError as error:
+            sys.exit(f"Error: Cannot write the record at {record.contig}:{record.pos} with pysam ({error}); "
+                     "the header of file A has to define all its INFO and FORMAT fields")
+
+    def writelines(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        if self.file is not None:
+            with profile_phase("write"):
+                self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_variant_file(file_path, mode='r', header=None):
+    """
+    Opens a VCF or BCF file with htslib through pysam.VariantFile, using bgzf.IO_THREADS threads for BGZF.
+
+    Args:
+    - file_path (str): The path to the file.
+    - mode (str): The mode of pysam.VariantFile, e.g. 'r', 'w' for text VCF, 'wz' for BGZF-compressed VCF or 'wb' for BCF.
+    - header (pysam.VariantHeader): The header of a file opened for writing.
+
+    Returns:
+    - pysam.VariantFile: The open file.
+    """
+    if pysam is None:
+        sys.exit("Error: The pysam backend requires pysam")
+    try:
+        return pysam.VariantFile(file_path, mode, header=header, threads=bgzf.IO_THREADS)
+    except NotImplementedError:
+        # htslib seeks in the files it reads, which plain gzip does not allow
+        sys.exit(f"Error: Cannot open {file_path} with pysam, it has to be compressed with bgzip (BGZF) instead of gzip")
+    except (OSError, ValueError) as error:
+        sys.exit(f"Error: Cannot open {file_path} with pysam: {error}")
+
+def pysam_genotype(call):
+    """
+    Formats the GT field of a pysam.VariantRecordSample as in a VCF line, e.g. "0/1" or "1|0".
+    """
+    return ('|' if call.phased else '/').join('.' if allele is None else str(allele) for allele in call['GT'])
+
+def read_pysam_stream(file_path, regions=None, sample=None):
+    """
+    Reads a VCF or BCF file with htslib through pysam, see read_vcf_stream. Records are yielded in the form of 
+    iter_vcf_records, but carry the pysam.VariantRecord instead of the line and the index of the sample instead 
+    of its offset. Regions are fetched through the index of the file, or filtered while scanning it without one.
+
+    Args:
+    - file_path (str): The path to the VCF or BCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions.
+    - sample (str): The sample to take the genotypes from, by default the first sample.
+
+    Returns:
+    - tuple: The pysam.VariantHeader and a generator of records.
+    """
+    variant_file = open_variant_file(file_path)
+    samples = list(variant_file.header.samples)
+    if sample is not None and sample not in samples:
+        sys.exit(f"Error: Sample {sample} not found in {file_path}, which holds {', '.join(samples)}")
+    if not samples:
+        sys.exit(f"Error: {file_path} holds no sample")
+    return variant_file.header, _iter_pysam_records(variant_file, file_path, regions, samples.index(sample) if sample is not None else 0)
+
+def _iter_pysam_records(variant_file, file_path, regions, column):
+    if regions is None:
+        records = variant_file
+    elif variant_file.index is not None:
+        # regions open to the end of a contig are fetched without an end, pysam takes 32-bit positions
+        records = (record for contig, start, end in regions if contig in variant_file.index
+                   for record in variant_file.fetch(contig, start - 1, end if end < MAX_POSITION else None) if start <= record.pos <= end)
+    else:
+        intervals = {}
+        for contig, start, end in regions:
+            intervals.setdefault(contig, []).append((start, end))
+        records = (record for record in variant_file if any(start <= record.pos <= end for start, end in intervals.get(record.contig, ())))
+    with variant_file:
+        try:
+            for record in records:
+                alts = record.alts
+                yield (record.contig, record.pos), (record, record.ref, ','.join(alts) if alts else '.', pysam_genotype(record.samples[column]), column)
+        except OSError as error:
+            sys.exit(f"Error: Cannot read {file_path} with pysam: {error}")
@@ -0,0 +1,223 @@
+"""
+License: MIT
+
+Matching of the records of A and B at a coordinate and injection of the phased genotype of B, shared by the 
+dict and stream engines.
+"""
+
+import sys
+
+import merge_events
+from merge_events import log_event
+from bcf import bcf_genotype_values
+
+def phase_genotype(gt): 
+    return gt.replace('/', '|')
+
+ALLOWED_GENOTYPES = {'0/0', '1/0', '0/1', '1/1'}
+
+# phased counterpart of every allowed unphased genotype
+PHASED_ALLOWED_GENOTYPES = {genotype: phase_genotype(genotype) for genotype in ALLOWED_GENOTYPES}
+ALLOWED_PHASED_GENOTYPES = set(PHASED_ALLOWED_GENOTYPES.values())
+
+def check_genotypes(coordinate, record_a, record_b):
+    """
+    Validates the genotypes of a record from file A and the record from file B at the same coordinate 
+    and logs inconsistent genotypes and alleles.
+
+    Args:
+    - coordinate (tuple): The genomic coordinate of both records.
+    - record_a (tuple): The record from file A as returned by iter_vcf_records.
+    - record_b (tuple): The record from file B as returned by iter_vcf_records or PhasedIndex.get_all.
+    """
+    (line_a, ref_a, alt_a, format_genotype_a, sample_offset_a) = record_a
+    (line_b, ref_b, alt_b, format_genotype_b, sample_offset_b) = record_b
+
+    # Check consistency of REF and ALT alleles
+    phased_genotype_a = PHASED_ALLOWED_GENOTYPES.get(format_genotype_a)
+    if phased_genotype_a is None:
+        sys.exit(f"Error: Unphased genotype in file A must be {','.join(sorted(ALLOWED_GENOTYPES))}")
+    if format_genotype_b not in ALLOWED_PHASED_GENOTYPES:
+        sys.exit(f"Error: Phased genotype in file B must be {','.join(sorted(ALLOWED_PHASED_GENOTYPES))}")
+
+    if phased_genotype_a != format_genotype_b:
+        log_event("inconsistent_ref_alt_genotypes", coordinate)
+
+        if merge_events.VERBOSE:
+            print(f"INFO: Inconsistent REF and ALT genotypes at coordinate {coordinate}: {format_genotype_a.split('/')} vs {format_genotype_b.split('|')}", file=sys.stderr)
+
+    if ref_a != ref_b or alt_a != alt_b:
+        log_event("inconsistent_ref_alt_alleles", coordinate)
+
+        if merge_events.VERBOSE:
+            print(f"WARNING: Inconsistent REF and ALT alleles at coordinate {coordinate}: {(ref_a, alt_a)} vs {(ref_b, alt_b)}", file=sys.stderr)
+
+def inject_genotype(coordinate, record_a, record_b):
+    """
+    Checks a record from file A against the record from file B at the same coordinate
+    and injects the phased genotype from file B.
+
+    Args:
+    - coordinate (tuple): The genomic coordinate of both records.
+    - record_a (tuple): The record from file A as returned by iter_vcf_records.
+    - record_b (tuple): The record from file B as returned by iter_vcf_records or PhasedIndex.get_all.
+
+    Returns:
+    - str: The line from file A carrying the genotype from file B.
+    """
+    check_genotypes(coordinate, record_a, record_b)
+    line_a, sample_offset_a, format_genotype_b = record_a[0], record_a[4], record_b[3]
+
+    # Inejct genotype from file B into line from file A, replacing only the sample column. 
+    # The other FORMAT fields of A follow the genotype without their separators, as they always did.
+    line_a = line_a.rstrip()
+    end = line_a.find('\t', sample_offset_a)
+    if end < 0:
+        end = len(line_a)
+    format_other_a = line_a[sample_offset_a:end].partition(':')[2]
+    if ':' in format_other_a:
+        format_other_a = format_other_a.replace(':', '')
+    modified_line_a = f"{line_a[:sample_offset_a]}{format_genotype_b}:{format_other_a}{line_a[end:]}\n"
+    log_event("replaced_genotypes", coordinate)
+
+    if merge_events.VERBOSE:
+        print("INFO: Replaced genotype at coordinate", coordinate, file=sys.stderr)
+
+    return modified_line_a
+
+def inject_genotype_pysam(coordinate, record_a, record_b):
+    """
+    Injects the phased genotype from file B into a record from file A read by the pysam backend, see inject_genotype. 
+    Only GT is set; the other FORMAT fields of A are kept as they are.
+
+    Returns:
+    - pysam.VariantRecord: The record from file A carrying the genotype from file B.
+    """
+    check_genotypes(coordinate, record_a, record_b)
+    record, column = record_a[0], record_a[4]
+    call = record.samples[column]
+    call['GT'] = tuple(int(allele) for allele in record_b[3].split('|'))
+    call.phased = True
+    log_event("replaced_genotypes", coordinate)
+
+    if merge_events.VERBOSE:
+        print("INFO: Replaced genotype at coordinate", coordinate, file=sys.stderr)
+
+    return record
+
+def inject_genotype_bcf(coordinate, record_a, record_b):
+    """
+    Injects the phased genotype from file B into a record from a BCF file A, see inject_genotype. 
+    The GT values of the sample are overwritten in place; the rest of the record is copied as it is.
+
+    Returns:
+    - bytes: The BCF record from file A carrying the genotype from file B.
+    """
+    check_genotypes(coordinate, record_a, record_b)
+    record, (start, size, count) = record_a[0], record_a[4]
+    values = bcf_genotype_values(record_b[3], size, count)
+    modified_record_a = b''.join((record[:start], values, record[start + len(values):]))
+    log_event("replaced_genotypes", coordinate)
+
+    if merge_events.VERBOSE:
+        print("INFO: Replaced genotype at coordinate", coordinate, file=sys.stderr)
+
+    return modified_record_a
+
+def keep_genotype(coordinate, record_a):
+    """
+    Keeps a record from file A that has no counterpart in file B.
+
+    Args:
+    - coordinate (tuple): The genomic coordinate of the record.
+    - record_a (tuple): The record from file A as returned by iter_vcf_records.
+
+    Returns:
+    - str: The unchanged line from file A.
+    """
+    log_event("kept_genotypes", coordinate)
+
+    if merge_events.VERBOSE:
+        print("INFO: Kept genotype at coordinate", coordinate, file=sys.stderr)
+
+    return record_a[0]
+
+def match_record(coordinate, record_a, records_b, shared=False):
+    """
+    Picks the record of file B that a record of file A is merged with, out of the records of B at its coordinate. 
+    If A and B both hold a single record there, the record of B is picked whatever its alleles, which 
+    check_genotypes then compares. Otherwise the one with the REF and ALT of A is picked; if there is none, 
+    the match is ambiguous and logged, so that e.g. an indel of A is not merged with the SNP of B next to it.
+
+    Args:
+    - coordinate (tuple): The genomic coordinate of the records.
+    - record_a (tuple): The record from file A as returned by iter_vcf_records.
+    - records_b (tuple): The records from file B at the coordinate, see PhasedIndex.get_all.
+    - shared (bool): Whether file A holds other records at the coordinate, see flag_shared_records.
+
+    Returns:
+    - tuple: The record from file B, or None if there is none or the match is ambiguous.
+    """
+    if len(records_b) == 1 and not shared:
+        return records_b[0]
+    if not records_b:
+        return None
+    ref_a, alt_a = record_a[1], record_a[2]
+    for record_b in records_b:
+        if record_b[1] == ref_a and record_b[2] == alt_a:
+            return record_b
+    log_event("ambiguous_duplicates", coordinate)
+
+    if merge_events.VERBOSE:
+        print(f"WARNING: None of the records of file B at coordinate {coordinate} has the REF and ALT alleles {(ref_a, alt_a)}", file=sys.stderr)
+
+    return None
+
+def flag_shared_records(records):
+    """
+    Flags the records of file A that share their coordinate with the record before or after them.
+
+    Args:
+    - records (iterable): Records of file A as yielded by iter_vcf_records.
+
+    Yields:
+    - tuple: The genomic coordinate, the record and whether it shares the coordinate with a neighbouring record.
+    """
+    end = (None, None)
+    records = iter(records)
+    coordinate, record = next(records, end)
+    shared = False
+    while coordinate is not None:
+        next_coordinate, next_record = next(records, end)
+        following = next_coordinate == coordinate
+        yield coordinate, record, shared or following
+        coordinate, record, shared = next_coordinate, next_record, following
+
+def group_records(records):
+    """
+    Groups a coordinate-sorted stream of records of file B by coordinate. Of records with the same 
+    coordinate, REF and ALT only the last one is kept and the others are logged as dropped duplicates.
+
+    Args:
+    - records (iterator): Records of file B as yielded by iter_vcf_records.
+
+    Yields:
+    - tuple: The genomic coordinate and a tuple of the records at it, usually a single one.
+    """
+    end = (None, None)
+    records = iter(records)
+    coordinate, record = next(records, end)
+    while coordinate is not None:
+        next_coordinate, next_record = next(records, end)
+        if next_coordinate != coordinate:
+            yield coordinate, (record,)
+        else:
+            unique = {(record[1], record[2]): record}
+            while next_coordinate == coordinate:
+                alleles = (next_record[1], next_record[2])
+                if alleles in unique:
+                    log_event("dropped_duplicates", coordinate)
+                unique[alleles] = next_record
+                next_coordinate, next_record = next(records, end)
+            yield coordinate, tuple(unique.values())
+        coordinate, record = next_coordinate, next_record
@@ -0,0 +1,132 @@
+"""
+License: MIT
+
+Contigs and regions: the rank of each contig from the ##contig lines of a VCF header, and regions given on the 
+command line or in a BED file.
+"""
+
+import re
+
+from bgzf import open_file
+
+CONTIG_ID_PATTERN = re.compile(r'[<,]ID=([^,>]+)')
+
+# end of regions given without an end coordinate
+MAX_POSITION = (1 << 63) - 1
+
+class ContigOrder(dict):
+    """
+    Maps the contigs of file A to their sort rank. The contigs of its ##contig lines are ranked in header 
+    order; a contig that A holds without listing it is ranked right after the contig of the record before 
+    it, see add. Ranks are tuples, so that such contigs fit in between the listed ones. Only file A adds 
+    contigs, the contigs of file B are looked up, so that B cannot change the order of A.
+    """
+    def __init__(self):
+        super().__init__()
+        self.current = None
+        self._inserted = {}
+        self._unknown = {}
+
+    def add(self, contig):
+        """
+        Takes the contig of the next record of A.
+
+        Returns:
+        - tuple: The rank of the contig, which is ranked after the contig of the previous record if it is new.
+        """
+        rank = self.get(contig)
+        if rank is None:
+            base = self[self.current][0] if self.current is not None else -1
+            inserted = self._inserted[base] = self._inserted.get(base, 0) + 1
+            rank = self[contig] = (base, inserted)
+        self.current = contig
+        return rank
+
+    def rank(self, contig):
+        """
+        Looks up the rank of a contig without adding it.
+
+        Returns:
+        - tuple: The rank of the contig; contigs that A has not met rank after all of its contigs, 
+          in the order they are looked up.
+        """
+        rank = self.get(contig)
+        if rank is None:
+            rank = self._unknown.setdefault(contig, (float('inf'), len(self._unknown)))
+        return rank
+
+def contig_order(header):
+    """
+    Builds the contig order from the ##contig lines of a VCF header.
+
+    Args:
+    - header (list): The header lines of a VCF file, as str or bytes.
+
+    Returns:
+    - ContigOrder: A mapping of contig names to their rank.
+    """
+    order = ContigOrder()
+    for line in header:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.startswith('##contig='):
+            match = CONTIG_ID_PATTERN.search(line)
+            if match:
+                order.setdefault(match.group(1), (len(order), 0))
+    return order
+
+def parse_region(region):
+    """
+    Parses a region string "contig", "contig:start" or "contig:start-end" with 1-based inclusive coordinates.
+
+    Args:
+    - region (str): The region string.
+
+    Returns:
+    - tuple: The contig, start and end of the region.
+    """
+    contig, _, span = region.rpartition(':')
+    if not contig or not re.fullmatch(r'[\d,]+(-[\d,]*)?', span):
+        return region, 1, MAX_POSITION
+    start, _, end = span.replace(',', '').partition('-')
+    return contig, int(start), int(end) if end else MAX_POSITION
+
+def read_bed_regions(file_path):
+    """
+    Reads regions from a BED file.
+
+    Args:
+    - file_path (str): The path to the BED file, optionally gzipped.
+
+    Returns:
+    - list: The regions as tuples of contig, start and end with 1-based inclusive coordinates.
+    """
+    regions = []
+    with open_file(file_path) as file:
+        for line in file:
+            if line.startswith(('#', 'track', 'browser')) or not line.strip():
+                continue
+            contig, start, end = line.split('\t')[:3]
+            regions.append((contig, int(start) + 1, int(end)))
+    return regions
+
+def normalize_regions(regions, order):
+    """
+    Sorts regions by contig order and start and merges overlapping regions, so that every 
+    record falls into at most one region and sorted inputs stay sorted.
+
+    Args:
+    - regions (list): Regions as tuples of contig, start and end.
+    - order (ContigOrder): The rank of each contig. Contigs that it does not hold follow in the order of the regions, 
+      see ContigOrder.rank.
+
+    Returns:
+    - list: The normalized regions.
+    """
+    merged = []
+    for contig, start, end in sorted(regions, key=lambda region: (order.rank(region[0]), region[1], region[2])):
+        if merged and merged[-1][0] == contig and start <= merged[-1][2] + 1:
+            merged[-1] = (contig, merged[-1][1], max(end, merged[-1][2]))
+        else:
+            merged.append((contig, start, end))
+    return merged
@@ -0,0 +1,177 @@
+"""
+License: MIT
+
+The stream engine: a merge-join of two coordinate-sorted record streams, with an external merge sort for input 
+that turns out not to be sorted.
+"""
+
+import heapq
+import tempfile
+from collections import deque
+
+from merge_events import log_event
+from record_merge import flag_shared_records, group_records, inject_genotype, keep_genotype, match_record
+from vcf_reader import parse_deferred
+
+# number of bytes of lines sorted in memory by external_sort before they are spilled to a temporary file
+DEFAULT_SORT_BUFFER = 1 << 28
+
+def merge_sorted_records(records_a, records_b, order, inject=inject_genotype, file_b=None):
+    """
+    Merges two coordinate-sorted record streams by walking both at the same time. Only the current 
+    records of A and B are held in memory and every output line is yielded as soon as its coordinate 
+    is settled. For sorted input the output is identical to the one of the "dict" engine. The contigs 
+    of A are added to order as they come; records of B on a contig that A has not met are skipped.
+
+    Args:
+    - records_a (iterator): Records of file A as yielded by iter_vcf_records.
+    - records_b (iterator): Records of file B as yielded by iter_vcf_records.
+    - order (ContigOrder): The rank of each contig of A.
+    - inject (function): Injects a genotype of B into a record of A, by default inject_genotype.
+    - file_b (str): The path to file B, reported by UnsortedInputError.
+
+    Yields:
+    - str: The lines for sample A in VCF format, without header.
+
+    Raises:
+    - UnsortedInputError: If A meets a contig whose records of B have been skipped, B is not sorted like A.
+    """
+    end = (None, ())
+    groups_b = group_records(records_b)
+    coordinate_b, group_b = next(groups_b, end)
+    matched_coordinate, matched_records = None, ()
+    skipped = set()
+
+    for coordinate, record_a, shared in flag_shared_records(records_a):
+        log_event("read_lines", coordinate)
+        if coordinate != matched_coordinate:
+            # Advance B up to the coordinate of A and take the records of B at this coordinate
+            matched_coordinate, matched_records = coordinate, ()
+            contig_a, pos_a = coordinate
+            rank_a = order.add(contig_a)
+            if contig_a in skipped:
+                raise UnsortedInputError("b", file_b, f"file A holds {contig_a} after contigs that follow it here")
+            while coordinate_b is not None:
+                contig_b, pos_b = coordinate_b
+                if contig_b == contig_a:
+                    if pos_b > pos_a:
+                        break
+                    if pos_b == pos_a:
+                        matched_records = group_b
+                elif contig_b not in order:
+                    skipped.add(contig_b)
+                elif order[contig_b] > rank_a:
+                    break
+                coordinate_b, group_b = next(groups_b, end)
+
+        if matched_records:
+            record_a = parse_deferred(record_a)
+        record_b = match_record(coordinate, record_a, matched_records, shared)
+        if record_b is not None:
+            yield inject(coordinate, record_a, record_b)
+        else:
+            # Coordinate not present in file B, use genotype from file A
+            yield keep_genotype(coordinate, record_a)
+
+    # the rest of B is read to log its duplicates as the other engines do
+    deque(groups_b, maxlen=0)
+
+class UnsortedInputError(Exception):
+    """
+    Raised by check_sorted when a record of an input comes before the previous one.
+
+    Args:
+    - input_name (str): "a" or "b", the input that is not sorted.
+    - file_path (str): The path to the input.
+    - message (str): Where the input is out of order.
+    """
+    def __init__(self, input_name, file_path, message):
+        super().__init__(f"{file_path} is not sorted, {message}")
+        self.input_name = input_name
+        self.file_path = file_path
+
+def check_sorted(records, order, input_name, file_path):
+    """
+    Passes records on while checking that they are sorted as the stream engine expects: the records of 
+    each contig in a row, by position, and the contigs by rank. File A adds its contigs to order; the 
+    contigs of file B are only looked up, and those that A has not met are not compared.
+
+    Args:
+    - records (iterator): Records as yielded by iter_vcf_records.
+    - order (ContigOrder): The rank of each contig of A.
+    - input_name (str): "a" or "b", reported by UnsortedInputError.
+    - file_path (str): The path to the input, reported by UnsortedInputError.
+
+    Yields:
+    - tuple: The records.
+
+    Raises:
+    - UnsortedInputError: At the first record out of order.
+    """
+    contig, pos, passed = None, 0, set()
+    for coordinate, record in records:
+        if coordinate[0] != contig:
+            rank = order.add(coordinate[0]) if input_name == "a" else order.get(coordinate[0])
+            previous_rank = order.get(contig)
+            if coordinate[0] in passed or rank is not None and previous_rank is not None and rank < previous_rank:
+                raise UnsortedInputError(input_name, file_path, f"{coordinate[0]}:{coordinate[1]} follows {contig}:{pos}")
+            passed.add(contig)
+            contig = coordinate[0]
+        elif coordinate[1] < pos:
+            raise UnsortedInputError(input_name, file_path, f"{coordinate[0]}:{coordinate[1]} follows {contig}:{pos}")
+        pos = coordinate[1]
+        yield coordinate, record
+
+def external_sort(records, rank, parse, buffer_size=DEFAULT_SORT_BUFFER, directory=None):
+    """
+    Sorts records by contig rank and position with bounded memory. Records are collected until their lines 
+    add up to buffer_size bytes, sorted and spilled to a temporary file; the spilled runs are then merged 
+    and their lines parsed again. Input that fits into the buffer is sorted in memory without spilling. 
+    The sort is stable, so records at the same coordinate keep their order, and the last record of B at 
+    a coordinate still wins in merge_sorted_records.
+
+    Args:
+    - records (iterator): Records as yielded by iter_vcf_records.
+    - rank (function): Returns the rank of a contig: ContigOrder.add for file A, ContigOrder.rank for file B.
+    - parse (function): Parses a spilled line into a record again, see record_parser.
+    - buffer_size (int): The number of bytes of lines held in memory at once, about a third of the memory used.
+    - directory (str): The directory of the temporary files, by default that of tempfile.
+
+    Yields:
+    - tuple: The records in sorted order.
+    """
+    def key(record):
+        return rank(record[0][0]), record[0][1]
+
+    runs = []
+    try:
+        chunk, size = [], 0
+        for record in records:
+            chunk.append(record)
+            size += len(record[1][0])
+            if size >= buffer_size:
+                runs.append(_spill_run(sorted(chunk, key=key), directory))
+                chunk, size = [], 0
+        if chunk and not chunk[-1][1][0].endswith('\n'):
+            # the last line of the input may come first once sorted
+            chunk[-1] = parse(chunk[-1][1][0] + '\n')
+        chunk.sort(key=key)
+        if not runs:
+            yield from chunk
+            return
+        if chunk:
+            runs.append(_spill_run(chunk, directory))
+        chunk = None
+        yield from heapq.merge(*((parse(line) for line in run) for run in runs), key=key)
+    finally:
+        for run in runs:
+            run.close()
+
+def _spill_run(records, directory):
+    # temporary files are removed when closed
+    run = tempfile.TemporaryFile('w+', dir=directory, encoding='utf-8', newline='')
+    for record in records:
+        line = record[1][0]
+        run.write(line if line.endswith('\n') else line + '\n')
+    run.seek(0)
+    return run
@@ -0,0 +1,411 @@
+"""
+License: MIT
+
+Tabix (.tbi) and CSI indices of BGZF files: built while a file is written, read to start reading at the records 
+of a region, and combined when BGZF files are concatenated.
+"""
+
+import os
+import sys
+import gzip
+import re
+import struct
+from array import array
+
+from bgzf import BGZF_EOF, BgzfWriter, is_bgzf
+
+# binning scheme of tabix indices: 16 kbp windows and 5 levels of bins above them
+TABIX_MIN_SHIFT = 14
+TABIX_DEPTH = 5
+INDEX_FORMATS = ("auto", "tbi", "csi", "none")
+
+def reg2bin(beg, end, min_shift=TABIX_MIN_SHIFT, depth=TABIX_DEPTH):
+    """
+    Returns the smallest bin of the UCSC binning scheme that contains the 0-based interval [beg, end).
+    """
+    end -= 1
+    shift, offset = min_shift, ((1 << 3 * depth) - 1) // 7
+    for level in range(depth, 0, -1):
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+        shift += 3
+        offset -= 1 << 3 * (level - 1)
+    return 0
+
+def bin_first_window(bin, depth=TABIX_DEPTH):
+    """
+    Returns the index of the first linear index window covered by a bin.
+    """
+    offset = 0
+    for level in range(depth + 1):
+        size = 1 << 3 * level
+        if bin < offset + size:
+            return (bin - offset) << 3 * (depth - level)
+        offset += size
+    raise ValueError(f"Bin {bin} is out of range for depth {depth}")
+
+def vcf_interval(line):
+    """
+    Returns contig and 0-based half-open interval [beg, end) spanned by a VCF body line, 
+    using END from the INFO column if present and the length of REF otherwise.
+    """
+    parts = line.split('\t', 8)
+    beg = int(parts[1]) - 1
+    end = beg + len(parts[3])
+    info = parts[7]
+    if 'END=' in info:
+        for field in info.split(';'):
+            if field.startswith('END='):
+                end = int(field[4:])
+                break
+    return parts[0], beg, max(end, beg + 1)
+
+class TabixIndexer:
+    """
+    Builds a tabix (.tbi) or CSI index for a BGZF-compressed VCF file while it is written. 
+    Lines are added with their offsets in the uncompressed stream; these are converted into 
+    virtual offsets when the index is written, after the BGZF file has been closed.
+
+    With index_format "auto", a CSI index is built if a ##contig line declares a contig longer than 
+    tabix supports (2^29 bp), otherwise a tabix index. Records must arrive sorted by contig and position, 
+    otherwise no index is written. A BCF file is always indexed as CSI, with its records added by add_interval.
+
+    Args:
+    - index_format (str): "auto", "tbi" or "csi".
+    - bcf (bool): Whether the file is BCF, whose contigs are given by their index in the header.
+    - required (bool): Whether to exit with an error as soon as a record or ##contig line makes the index 
+      impossible, e.g. because a workflow expects the index, instead of writing no index.
+    """
+    def __init__(self, index_format="auto", bcf=False, required=False):
+        self.index_format = "csi" if bcf else index_format
+        self.bcf = bcf
+        self.required = required
+        self.depth = TABIX_DEPTH
+        self.names = []
+        self.sorted = True
+        self._max_length = 0
+        self._refs = {}
+        self._current = None
+        self._last_beg = -1
+
+    def add(self, line, offset_start, offset_end):
+        if line.startswith('#'):
+            if line.startswith('##contig=') and 'length=' in line:
+                self._max_length = max(self._max_length, int(re.search(r'length=(\d+)', line).group(1)))
+            return
+        contig, beg, end = vcf_interval(line)
+        self.add_interval(contig, beg, end, offset_start, offset_end)
+
+    def add_interval(self, contig, beg, end, offset_start, offset_end):
+        """
+        Adds a record spanning the 0-based interval [beg, end) of a contig, given by name or, for BCF, by index.
+        """
+        if not self._refs:
+            self._set_format()
+
+        if contig != self._current:
+            if contig in self._refs:
+                self.sorted = False
+            self._refs[contig] = ({}, array('q'), [offset_start, offset_end, 0])
+            self.names.append(contig)
+            self._current = contig
+            self._last_beg = -1
+        if beg < self._last_beg or end > 1 << (TABIX_MIN_SHIFT + 3 * self.depth):
+            self.sorted = False
+        if not self.sorted and self.required:
+            sys.exit(f"Error: The output is not sorted by coordinate or exceeds the range of a {self.index_format} index "
+                     f"at {contig}:{beg + 1}, so its index cannot be built")
+        self._last_beg = beg
+
+        bins, linear, meta = self._refs[contig]
+        chunks = bins.setdefault(reg2bin(beg, end, depth=self.depth), [])
+        if chunks and chunks[-1][1] == offset_start:
+            chunks[-1][1] = offset_end
+        else:
+            chunks.append([offset_start, offset_end])
+        last_window = (end - 1) >> TABIX_MIN_SHIFT
+        if len(linear) <= last_window:
+            linear.extend([-1] * (last_window + 1 - len(linear)))
+        for window in range(beg >> TABIX_MIN_SHIFT, last_window + 1):
+            if linear[window] == -1:
+                linear[window] = offset_start
+        meta[1] = offset_end
+        meta[2] += 1
+
+    def _set_format(self):
+        tbi_limit = 1 << (TABIX_MIN_SHIFT + 3 * TABIX_DEPTH)
+        if self.index_format == "auto":
+            self.index_format = "csi" if self._max_length > tbi_limit else "tbi"
+        elif self.index_format == "tbi" and self._max_length > tbi_limit and self.required:
+            sys.exit(f"Error: A contig of {self._max_length} bp is longer than a tbi index supports (2^29 bp), use a csi index")
+        if self.index_format == "csi":
+            self.depth, size = TABIX_DEPTH, tbi_limit
+            while self._max_length + 256 > size:
+                self.depth, size = self.depth + 1, size << 3
+
+    def index_path(self, file_path):
+        """
+        Returns the path of the index of file_path. If no record has been added, an "auto" format is 
+        resolved from the ##contig lines seen so far.
+        """
+        if not self._refs:
+            self._set_format()
+        return f"{file_path}.{self.index_format}"
+
+    def write(self, index_path, virtual_offset):
+        """
+        Writes the BGZF-compressed index.
+
+        Args:
+        - index_path (str): The path to the index file.
+        - virtual_offset (callable): Converts uncompressed offsets into virtual offsets, e.g. BgzfWriter.virtual_offset.
+
+        Returns:
+        - bool: False if the records were not sorted and no index was written.
+        """
+        if not self.sorted:
+            print(f"WARNING: Output is not sorted by coordinate or exceeds the index range, no index written to {index_path}", file=sys.stderr)
+            return False
+        if not self._refs:
+            self._set_format()
+
+        index = VcfIndex()
+        index.csi = self.index_format == "csi"
+        index.bcf = self.bcf
+        index.depth = self.depth
+        for name in self.names:
+            bins, linear, (ref_start, ref_end, n_records) = self._refs[name]
+            # fill empty windows of the linear index with the offset of the previous record
+            previous = ref_start
+            for window, offset in enumerate(linear):
+                if offset == -1:
+                    linear[window] = previous
+                previous = linear[window]
+
+            virtual_bins = {}
+            for bin, chunks in bins.items():
+                loffset = 0
+                if index.csi:
+                    window = bin_first_window(bin, self.depth)
+                    loffset = virtual_offset(linear[window] if window < len(linear) else ref_end)
+                virtual_bins[bin] = (loffset, [virtual_offset(offset) for chunk in chunks for offset in chunk])
+            virtual_linear = array('Q', (virtual_offset(offset) for offset in linear)) if not index.csi else array('Q')
+            index.refs[name] = (virtual_bins, virtual_linear, [virtual_offset(ref_start), virtual_offset(ref_end), n_records, 0])
+        index.write(index_path)
+        return True
+
+def reg2bins(beg, end, min_shift=TABIX_MIN_SHIFT, depth=TABIX_DEPTH):
+    """
+    Returns all bins that may hold records overlapping the 0-based interval [beg, end).
+    """
+    end = min(end, 1 << (min_shift + 3 * depth)) - 1
+    if beg > end:
+        return []
+    bins = []
+    shift, offset = min_shift + 3 * depth, 0
+    for level in range(depth + 1):
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+        offset += 1 << 3 * level
+        shift -= 3
+    return bins
+
+class VcfIndex:
+    """
+    A tabix (.tbi) or CSI index of a BGZF-compressed VCF file.
+
+    For every contig, refs holds the bins (bin -> (loffset, flat list of chunk begin and end virtual offsets)), 
+    the linear index (tabix only) and the metadata of the pseudo-bin (first and last virtual offset, 
+    number of records with and without coordinates). The CSI index of a BCF file names no contigs, 
+    its refs are keyed by the index of the contig in the BCF header instead.
+
+    Args:
+    - index_path (str): The path to the index file, or None for an empty index.
+    """
+    def __init__(self, index_path=None):
+        self.csi = False
+        self.bcf = False
+        self.min_shift, self.depth = TABIX_MIN_SHIFT, TABIX_DEPTH
+        self.refs = {}
+        if index_path is None:
+            return
+
+        with open(index_path, 'rb') as file:
+            data = gzip.decompress(file.read())
+        self.csi = data[:4] == b'CSI\1'
+        if self.csi:
+            self.min_shift, self.depth, l_aux = struct.unpack_from('<3i', data, 4)
+            pos = 16 + l_aux
+            n_ref, = struct.unpack_from('<i', data, pos)
+            pos += 4
+            self.bcf = l_aux < 28
+            names = range(n_ref) if self.bcf else self._read_names(data, 16)
+        elif data[:4] == b'TBI\1':
+            n_ref, = struct.unpack_from('<i', data, 4)
+            names = self._read_names(data, 8)
+            pos = 36 + struct.unpack_from('<i', data, 32)[0]
+        else:
+            raise ValueError(f"{index_path} is not a tabix or CSI index")
+
+        pseudo_bin = self.pseudo_bin
+        for ref in range(n_ref):
+            bins, meta = {}, None
+            n_bin, = struct.unpack_from('<i', data, pos)
+            pos += 4
+            for _ in range(n_bin):
+                if self.csi:
+                    bin, loffset, n_chunk = struct.unpack_from('<IQi', data, pos)
+                    pos += 16
+                else:
+                    (bin, n_chunk), loffset = struct.unpack_from('<Ii', data, pos), 0
+                    pos += 8
+                chunks = list(struct.unpack_from(f'<{2 * n_chunk}Q', data, pos))
+                pos += 16 * n_chunk
+                if bin == pseudo_bin:
+                    meta = chunks
+                else:
+                    bins[bin] = (loffset, chunks)
+            linear = array('Q')
+            if not self.csi:
+                n_intv, = struct.unpack_from('<i', data, pos)
+                linear.frombytes(data[pos + 4:pos + 4 + 8 * n_intv])
+                pos += 4 + 8 * n_intv
+            if bins or meta is not None or not self.bcf:
+                self.refs[names[ref]] = (bins, linear, meta)
+
+    @property
+    def pseudo_bin(self):
+        return ((1 << 3 * (self.depth + 1)) - 1) // 7 + 1
+
+    def write(self, index_path):
+        """
+        Writes the index BGZF-compressed to index_path.
+        """
+        if self.bcf:
+            # a BCF index has no configuration and one entry for every contig up to the last indexed one
+            config, refs = b'', [self.refs.get(ref, ({}, array('Q'), None)) for ref in range(max(self.refs, default=-1) + 1)]
+        else:
+            names = b''.join(name.encode() + b'\0' for name in self.refs)
+            # VCF preset: sequence in column 1, position in column 2, end from REF, '#' for header lines
+            config, refs = struct.pack('<7i', 2, 1, 2, 0, ord('#'), 0, len(names)) + names, list(self.refs.values())
+        if self.csi:
+            out = [b'CSI\1', struct.pack('<3i', self.min_shift, self.depth, len(config)), config, struct.pack('<i', len(refs))]
+        else:
+            out = [b'TBI\1', struct.pack('<i', len(refs)), config]
+
+        for bins, linear, meta in refs:
+            out.append(struct.pack('<i', len(bins) + (meta is not None)))
+            for bin, (loffset, chunks) in sorted(bins.items()):
+                out.append(struct.pack('<IQi', bin, loffset, len(chunks) // 2) if self.csi else struct.pack('<Ii', bin, len(chunks) // 2))
+                out.append(struct.pack(f'<{len(chunks)}Q', *chunks))
+            if meta is not None:
+                out.append(struct.pack('<IQi', self.pseudo_bin, 0, 2) if self.csi else struct.pack('<Ii', self.pseudo_bin, 2))
+                out.append(struct.pack('<4Q', *meta))
+            if not self.csi:
+                out.append(struct.pack('<i', len(linear)))
+                out.append(linear.tobytes())
+        out.append(struct.pack('<Q', 0))
+
+        with BgzfWriter(index_path) as index_file:
+            index_file.write(b''.join(out))
+
+    def extend(self, other, shift):
+        """
+        Adds the records of the index of another BGZF file that is appended to this one 
+        at compressed offset shift, as done by concat_bgzf.
+        """
+        if (other.csi, other.min_shift, other.depth) != (self.csi, self.min_shift, self.depth):
+            raise ValueError("Cannot combine indices of different formats")
+        shift <<= 16
+        for name, (bins, linear, meta) in other.refs.items():
+            own_bins, own_linear, own_meta = self.refs.setdefault(name, ({}, array('Q'), None))
+            for bin, (loffset, chunks) in bins.items():
+                own_loffset, own_chunks = own_bins.get(bin, (None, []))
+                loffset += shift
+                own_bins[bin] = (loffset if own_loffset is None else min(own_loffset, loffset),
+                                 own_chunks + [offset + shift for offset in chunks])
+            # windows covered by both files keep the smaller offset, both are lower bounds
+            for window, offset in enumerate(linear):
+                if window < len(own_linear):
+                    own_linear[window] = min(own_linear[window], offset + shift)
+                else:
+                    own_linear.append(offset + shift)
+            if meta is not None:
+                meta = [meta[0] + shift, meta[1] + shift, meta[2], meta[3]]
+                if own_meta is not None:
+                    meta = [own_meta[0], meta[1], own_meta[2] + meta[2], own_meta[3] + meta[3]]
+            self.refs[name] = (own_bins, own_linear, meta)
+
+    @staticmethod
+    def _read_names(data, pos):
+        l_nm, = struct.unpack_from('<i', data, pos + 24)
+        return [name.decode() for name in data[pos + 28:pos + 28 + l_nm].split(b'\0')[:-1]]
+
+    def start_offset(self, contig, beg, end):
+        """
+        Returns the virtual offset from which to read to find all records overlapping the 
+        0-based interval [beg, end) of a contig, or None if the contig has no such records.
+        """
+        if contig not in self.refs:
+            return None
+        bins, linear, _ = self.refs[contig]
+        if self.csi:
+            # the loffset of the smallest existing bin containing beg
+            min_offset, bin = 0, ((1 << 3 * self.depth) - 1) // 7 + (beg >> self.min_shift)
+            while bin > 0 and bin not in bins:
+                bin = (bin - 1) >> 3
+            if bin in bins:
+                min_offset = bins[bin][0]
+        elif linear:
+            min_offset = linear[min(beg >> self.min_shift, len(linear) - 1)]
+        else:
+            min_offset = 0
+        starts = [chunks[i] for bin in reg2bins(beg, end, self.min_shift, self.depth) if bin in bins
+                  for chunks in (bins[bin][1],) for i in range(0, len(chunks), 2) if chunks[i + 1] > min_offset]
+        return min(starts) if starts else None
+
+def concat_bgzf(input_paths, output_path, index_format=None):
+    """
+    Concatenates BGZF files without recompressing them, e.g. the region chunks of one chromosome. 
+    Only the last EOF marker is kept. If index_format is given, the indices of all inputs 
+    are combined into an index of the output.
+
+    Args:
+    - input_paths (list): The BGZF files in output order.
+    - output_path (str): The path to the concatenated file.
+    - index_format (str): "tbi" or "csi" to combine the input indices with this extension, or None.
+    """
+    index = None
+    with open(output_path, 'wb') as output_file:
+        for input_path in input_paths:
+            if index_format is not None:
+                chunk_index = VcfIndex(f"{input_path}.{index_format}")
+                if index is None:
+                    index = VcfIndex()
+                    index.csi, index.min_shift, index.depth = chunk_index.csi, chunk_index.min_shift, chunk_index.depth
+                index.extend(chunk_index, output_file.tell())
+            with open(input_path, 'rb') as input_file:
+                size = os.fstat(input_file.fileno()).st_size
+                # copy everything but a trailing EOF marker
+                if size >= len(BGZF_EOF):
+                    input_file.seek(size - len(BGZF_EOF))
+                    if input_file.read() == BGZF_EOF:
+                        size -= len(BGZF_EOF)
+                    input_file.seek(0)
+                while size > 0:
+                    data = input_file.read(min(size, 1 << 22))
+                    if not data:
+                        break
+                    output_file.write(data)
+                    size -= len(data)
+        output_file.write(BGZF_EOF)
+    if index is not None:
+        index.write(f"{output_path}.{index_format}")
+
+def find_index(file_path):
+    """
+    Returns the tabix or CSI index of a BGZF file, or None if the file is not indexed.
+    """
+    for extension in ('.tbi', '.csi'):
+        if os.path.exists(file_path + extension) and is_bgzf(file_path):
+            return VcfIndex(file_path + extension)
+    return None
@@ -0,0 +1,338 @@
+"""
+License: MIT
+
+Readers of file A and B. Every record is yielded as its coordinate and a tuple of (line, ref, alt, format_genotype, 
+sample_offset), the form merged by the dict and stream engines.
+"""
+
+import io
+import sys
+from bisect import bisect_right
+
+from bgzf import BGZF_BLOCK_SIZE, BgzfReader, open_file
+from vcf_index import find_index
+from bcf import BcfHeader, bcf_record_parser, is_bcf, iter_bcf_records, read_bcf_header
+from pysam_backend import read_pysam_stream
+
+def read_vcf_header(file_path):
+    """
+    Reads a VCF file and returns list with the header lines. 
+    Reading stops at the first line that is not a header line. The header of a BCF file is read as its text.
+
+    Args:
+    - file_path (str): The path to the VCF or BCF file.
+
+    Returns:
+    - list: A list with header lines
+    """
+    if is_bcf(file_path):
+        with open_file(file_path, 'rb') as file:
+            return read_bcf_header(file, file_path)
+    vcf_data = []
+    with open_file(file_path) as file:
+        for line in file:
+            if not line.startswith('#'):
+                break
+            vcf_data.append(line)
+    return vcf_data
+
+def parse_vcf_line(line):
+    """
+    Splits a VCF body line into the fields used for merging.
+
+    Args:
+    - line (str): A VCF body line.
+
+    Returns:
+    - tuple: The genomic coordinate and a tuple of (line, ref, alt, format_genotype, sample_offset), 
+      where sample_offset is the offset of the sample column in the line.
+    """
+    # the sample column and everything after it stays in one piece, the genotype is sliced from its start
+    parts = line.split('\t', 9)
+    sample = parts[9]
+    sample_offset = len(line) - len(sample)
+    format_genotype, colon, _ = sample.partition(':')
+    if '\t' in format_genotype:
+        # further columns follow a sample column without other FORMAT fields
+        format_genotype = line.strip().split('\t')[9].partition(':')[0]
+    elif not colon:
+        format_genotype = format_genotype.rstrip()
+    return (parts[0], int(parts[1])), (line, parts[3], parts[4], format_genotype, sample_offset)
+
+def sample_column(header, sample, file_path):
+    """
+    Finds a sample among the sample columns named in the #CHROM line of a VCF header.
+
+    Args:
+    - header (list): The header lines of the VCF file, as str or bytes.
+    - sample (str): The sample name.
+    - file_path (str): The path to the VCF file, for error messages.
+
+    Returns:
+    - int: The sample column, 0 for the first sample (the 10th column of the VCF).
+    """
+    for line in reversed(header):
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.startswith('#CHROM'):
+            samples = line.rstrip('\r\n').split('\t')[9:]
+            if sample not in samples:
+                sys.exit(f"Error: Sample '{sample}' not found in {file_path}, which holds {', '.join(samples) or 'no samples'}")
+            return samples.index(sample)
+    sys.exit(f"Error: {file_path} has no #CHROM line to look up sample '{sample}'")
+
+def parse_sample_genotypes(line, sample_offset, columns):
+    """
+    Reads the genotypes of some sample columns of a VCF body line. The line is only scanned up to 
+    the last requested column; the columns after it are not split.
+
+    Args:
+    - line (str): A VCF body line.
+    - sample_offset (int): The offset of the first sample column in the line.
+    - columns (list): The sample columns in ascending order, 0 for the first.
+
+    Returns:
+    - list: The genotype of every requested column.
+    """
+    genotypes = []
+    start, column = sample_offset, 0
+    for target in columns:
+        while column < target:
+            start = line.find('\t', start) + 1
+            if start == 0:
+                sys.exit(f"Error: VCF record without sample column {target + 1}: {line[:80]!r}")
+            column += 1
+        end = line.find('\t', start)
+        field = line[start:end] if end >= 0 else line[start:].rstrip()
+        genotypes.append(field.partition(':')[0])
+    return genotypes
+
+def parse_vcf_line_sample(line, column):
+    """
+    Splits a VCF body line like parse_vcf_line, but takes the genotype from the given sample column, 
+    see parse_sample_genotypes.
+
+    Args:
+    - line (str): A VCF body line.
+    - column (int): The sample column, 0 for the first.
+
+    Returns:
+    - tuple: The genomic coordinate and a tuple of (line, ref, alt, format_genotype, sample_offset).
+    """
+    parts = line.split('\t', 9)
+    sample_offset = len(line) - len(parts[9])
+    format_genotype, = parse_sample_genotypes(line, sample_offset, (column,))
+    return (parts[0], int(parts[1])), (line, parts[3], parts[4], format_genotype, sample_offset)
+
+def parse_vcf_line_lazy(line):
+    """
+    Parses the coordinate of a VCF body line and defers all other fields: the record holds only the line, 
+    so a record of A without a match is written without any further parsing. REF, ALT, the genotype and 
+    the sample offset are parsed by parse_deferred when records of B are found at its coordinate.
+
+    Args:
+    - line (str): A VCF body line.
+
+    Returns:
+    - tuple: The genomic coordinate and a tuple of (line,).
+    """
+    tab = line.find('\t')
+    return (line[:tab], int(line[tab + 1:line.find('\t', tab + 1)])), (line,)
+
+def parse_deferred(record):
+    """
+    Returns the fields of a record of A as parse_vcf_line returns them, splitting the line of a record read 
+    by parse_vcf_line_lazy. Other records are returned as they are.
+    """
+    return parse_vcf_line(record[0])[1] if len(record) == 1 else record
+
+def record_parser(column=None, lazy=False):
+    """
+    Returns the function that splits body lines: parse_vcf_line or, if a sample column is given, 
+    a parse_vcf_line_sample for that column. With lazy, lines of the first sample column are parsed 
+    by parse_vcf_line_lazy.
+    """
+    if column is None:
+        return parse_vcf_line_lazy if lazy else parse_vcf_line
+    return lambda line: parse_vcf_line_sample(line, column)
+
+def iter_region_records(file_path, regions, column=None, lazy=False):
+    """
+    Reads the records of a VCF file whose position lies within the given regions. 
+    With a tabix or CSI index next to a bgzipped file, reading starts at the first block that can 
+    hold records of each region. Otherwise the whole file is scanned. BCF files are read with bcf_record_parser.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions.
+    - column (int): The sample column to take the genotype from, see record_parser.
+    - lazy (bool): Whether to defer parsing, see record_parser.
+
+    Yields:
+    - tuple: The genomic coordinate and a tuple of (line, ref, alt, format_genotype, sample_offset).
+    """
+    parse = record_parser(column, lazy)
+    index = find_index(file_path)
+    if index is None:
+        print(f"WARNING: {file_path} is not indexed, scanning the whole file for the requested regions", file=sys.stderr)
+        by_contig = {}
+        for contig, start, end in regions:
+            by_contig.setdefault(contig, ([], []))
+            by_contig[contig][0].append(start)
+            by_contig[contig][1].append(end)
+        header, records = read_vcf_stream(file_path, column=column, lazy=lazy)
+        for coordinate, record in records:
+            if coordinate[0] in by_contig:
+                starts, ends = by_contig[coordinate[0]]
+                i = bisect_right(starts, coordinate[1]) - 1
+                if i >= 0 and coordinate[1] <= ends[i]:
+                    yield coordinate, record
+        return
+
+    if index.bcf:
+        # the index and the records of a BCF file refer to contigs by their index in the header
+        header = BcfHeader(read_vcf_header(file_path))
+        contig_ids, parse = header.contig_ids, bcf_record_parser(header, column or 0)
+    for contig, start, end in regions:
+        virtual_offset = index.start_offset(contig_ids.get(contig) if index.bcf else contig, start - 1, end)
+        if virtual_offset is None:
+            continue
+        reader = BgzfReader(file_path)
+        reader.seek_virtual(virtual_offset)
+        file = io.BufferedReader(reader, BGZF_BLOCK_SIZE)
+        if index.bcf:
+            records = iter_bcf_records(file, parse)
+        else:
+            file = io.TextIOWrapper(file)
+            records = (parse(line) for line in file if not line.startswith('#'))
+        with file:
+            for coordinate, record in records:
+                if coordinate[0] != contig or coordinate[1] > end:
+                    break
+                if coordinate[1] >= start:
+                    yield coordinate, record
+
+def read_vcf_stream(file_path, regions=None, sample=None, column=None, backend="python", lazy=False):
+    """
+    Opens a VCF file once, reads its header and returns a generator over the body records 
+    that continues on the same open stream, so the file is decompressed only once. 
+    If regions are given, only records within them are read, see iter_region_records. 
+    A BCF file is read with read_bcf_stream.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions.
+    - sample (str): The sample to take the genotypes from, by default the first sample column.
+    - column (int): The sample column to take the genotypes from, instead of looking up sample.
+    - backend (str): One of BACKENDS; "pysam" reads the file with read_pysam_stream.
+    - lazy (bool): Whether to parse only the coordinate of each line of a VCF file and defer the other fields, 
+      see record_parser.
+
+    Returns:
+    - tuple: A list with header lines and a generator of records as yielded by iter_vcf_records.
+    """
+    if backend == "pysam":
+        return read_pysam_stream(file_path, regions, sample)
+    if is_bcf(file_path):
+        return read_bcf_stream(file_path, regions, sample, column)
+    if regions is not None:
+        header = read_vcf_header(file_path)
+        if sample is not None:
+            column = sample_column(header, sample, file_path)
+        return header, iter_region_records(file_path, regions, column, lazy)
+
+    file = open_file(file_path)
+    header = []
+    first_line = None
+    for line in file:
+        if not line.startswith('#'):
+            first_line = line
+            break
+        header.append(line)
+    if sample is not None:
+        column = sample_column(header, sample, file_path)
+    return header, _iter_body_records(file, first_line, column, lazy)
+
+def _iter_body_records(file, first_line, column=None, lazy=False):
+    parse = record_parser(column, lazy)
+    with file:
+        if first_line is None:
+            return
+        yield parse(first_line)
+        for line in file:
+            if not line.startswith('#'):
+                yield parse(line)
+
+def iter_vcf_records(file_path, regions=None, sample=None, backend="python"):
+    """
+    Reads a VCF file record by record.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions, or None for all records.
+    - sample (str): The sample to take the genotypes from, by default the first sample column.
+    - backend (str): One of BACKENDS, see read_vcf_stream.
+
+    Yields:
+    - tuple: The genomic coordinate and a tuple of (line, ref, alt, format_genotype, sample_offset).
+    """
+    header, records = read_vcf_stream(file_path, regions, sample, backend=backend)
+    yield from records
+
+def read_contigs(file_path):
+    """
+    Lists the contigs that hold records in a VCF file, in the order of their first record: from the tabix 
+    or CSI index of the file if it has one and otherwise by scanning the file.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+
+    Returns:
+    - list: The names of the contigs.
+    """
+    index = find_index(file_path)
+    if index is not None and not index.bcf:
+        return list(index.refs)
+    # only the coordinate of each line is parsed
+    header, records = read_vcf_stream(file_path, lazy=True)
+    return list(dict.fromkeys(coordinate[0] for coordinate, _ in records))
+
+def read_vcf_records(file_path, regions=None, backend="python"):
+    """
+    Reads a VCF file and returns a dictionary where the keys are genomic coordinates
+    and the values are the records of iter_vcf_records. It replaces read_vcf, whose values ended with
+    the FORMAT fields after GT (format_other) instead of the offset of the sample column.
+
+    Args:
+    - file_path (str): The path to the VCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions, or None for all records.
+    - backend (str): One of BACKENDS, see read_vcf_stream.
+
+    Returns:
+    - dict: A dictionary with genomic coordinates as keys and tuples of (line, ref, alt, format_genotype, 
+      sample_offset) as values, where sample_offset is the offset of the sample column in line.
+    """
+    return dict(iter_vcf_records(file_path, regions, backend=backend))
+
+def read_bcf_stream(file_path, regions=None, sample=None, column=None):
+    """
+    Reads a BCF file like read_vcf_stream reads a VCF file. Records are decoded by bcf_record_parser 
+    and carry the BCF record as bytes instead of the line.
+
+    Args:
+    - file_path (str): The path to the BCF file.
+    - regions (list): Sorted, non-overlapping regions as returned by normalize_regions.
+    - sample (str): The sample to take the genotypes from, by default the first sample.
+    - column (int): The sample to take the genotypes from, instead of looking up sample.
+
+    Returns:
+    - tuple: A list with header lines and a generator of records.
+    """
+    file = open_file(file_path, 'rb')
+    header = read_bcf_header(file, file_path)
+    if sample is not None:
+        column = sample_column(header, sample, file_path)
+    if regions is not None:
+        file.close()
+        return header, iter_region_records(file_path, regions, column)
+    return header, iter_bcf_records(file, bcf_record_parser(BcfHeader(header), column or 0))
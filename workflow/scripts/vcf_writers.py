@@ -0,0 +1,345 @@
+"""
+License: MIT
+
+Writers of the merged records. VcfWriter collects lines for a text or BGZF output; the LineSink wrappers derive 
+a callability mask and the multihetsep format of MSMC2 from the lines that pass through them.
+"""
+
+import sys
+
+from merge_events import profile_phase
+from bgzf import open_file
+
+# number of characters collected by VcfWriter before they are written to the output in one batch
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+class VcfWriter:
+    """
+    Collects output lines and writes them to an open file in batches. 
+    At most buffer_size characters are held in memory at any time.
+
+    Args:
+    - file (file object): The open output file.
+    - buffer_size (int): Number of characters to collect before writing them in one batch.
+    - indexer (TabixIndexer): Receives every line with its offsets in the uncompressed output, if given.
+    """
+    def __init__(self, file, buffer_size=DEFAULT_BUFFER_SIZE, indexer=None):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.indexer = indexer
+        self.offset = 0
+        self._lines = []
+        self._size = 0
+        self._separator = ''
+
+    def write(self, line):
+        self._lines.append(line)
+        self._size += len(line)
+        if self.indexer is not None:
+            size = len(line) if line.isascii() else len(line.encode())
+            self.indexer.add(line, self.offset, self.offset + size)
+            self.offset += size
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def write_block(self, data):
+        """
+        Writes a piece of output that holds any number of complete lines. 
+        It is collected as a whole, or line by line if an indexer needs the offset of every line.
+        """
+        if self.indexer is not None:
+            lines = data.split('\n')
+            last = lines.pop()
+            for line in lines:
+                self.write(line + '\n')
+            if last:
+                self.write(last)
+            return
+        self._lines.append(data)
+        self._size += len(data)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            with profile_phase("write"):
+                self.file.write(self._separator.join(self._lines))
+            self._lines = []
+            self._size = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def multihetsep_alleles(ref, alt, sample):
+    """
+    Returns the alleles of a heterozygous SNP as written in the fourth column of the multihetsep format, 
+    e.g. "AC" for the phased genotype 0|1 of REF A and ALT C, and "AC,CA" for the unphased genotype 0/1. 
+
+    Args:
+    - ref (str): The REF allele.
+    - alt (str): The ALT alleles, separated by commas.
+    - sample (str): The sample column, starting with the genotype.
+
+    Returns:
+    - str: The alleles, or None if the site is no heterozygous SNP or its genotype is missing.
+    """
+    genotype = sample.partition(':')[0].rstrip()
+    phased = '|' in genotype
+    indices = genotype.split('|' if phased else '/')
+    if len(indices) != 2 or indices[0] == indices[1] or not all(index.isdigit() for index in indices):
+        return None
+    alleles = [ref] + alt.split(',')
+    if any(int(index) >= len(alleles) for index in indices):
+        return None
+    first, second = alleles[int(indices[0])], alleles[int(indices[1])]
+    if len(first) != 1 or len(second) != 1 or first not in "ACGT" or second not in "ACGT":
+        return None
+    return first + second if phased else f"{first}{second},{second}{first}"
+
+def record_depth(parts):
+    """
+    Returns the read depth of a VCF record: the DP field of its first sample if FORMAT lists one, 
+    otherwise the DP entry of INFO.
+
+    Args:
+    - parts (list): The first ten columns of the record.
+
+    Returns:
+    - int: The depth, or None if the record has none.
+    """
+    keys = parts[8].split(':')
+    if 'DP' in keys:
+        values = parts[9].rstrip().split(':')
+        i = keys.index('DP')
+        if i < len(values) and values[i].isdigit():
+            return int(values[i])
+        return None
+    for field in parts[7].split(';'):
+        if field.startswith('DP='):
+            value = field[3:]
+            return int(value) if value.isdigit() else None
+    return None
+
+class CallableMask:
+    """
+    Collects the callable positions of file A into a BED mask as read by MSMC2 (generate_multihetsep.py --mask). 
+    A record is callable if its genotype is called and its depth (see record_depth) and QUAL pass the thresholds; 
+    consecutive callable positions are joined into one interval. For the mask to cover invariant sites, file A has 
+    to list every site, as written by e.g. bcftools call without -v. Records must be sorted within each contig.
+
+    Args:
+    - file_path (str): The BED file, gzipped (BGZF) if the name ends with .gz.
+    - min_depth (int): The smallest depth of a callable record.
+    - max_depth (int): The largest depth of a callable record, or None for no limit.
+    - min_qual (float): The smallest QUAL of a callable record; a missing QUAL passes only if this is 0.
+    """
+    def __init__(self, file_path, min_depth=0, max_depth=None, min_qual=0):
+        self.file = open_file(file_path, 'wt')
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.min_qual = min_qual
+        # number of callable positions of the current contig so far, see MultihetsepWriter
+        self.called = 0
+        self.contig = None
+        self._contigs = set()
+        self._position = 0
+        self._start = self._end = None
+
+    def add(self, parts):
+        """
+        Adds a record to the mask.
+
+        Args:
+        - parts (list): The first ten columns of the record.
+
+        Returns:
+        - bool: Whether the record is callable.
+        """
+        contig = parts[0]
+        position = int(parts[1])
+        if contig != self.contig:
+            if contig in self._contigs:
+                sys.exit(f"Error: The callability mask requires the records of each contig in one run, {contig} appears again")
+            self._contigs.add(contig)
+            self._write_interval()
+            self.contig, self.called, self._position = contig, 0, 0
+        elif position < self._position:
+            sys.exit(f"Error: The callability mask requires records sorted by position, {contig}:{position} follows {contig}:{self._position}")
+        self._position = position
+        if self._end == position:
+            # a further record at a callable position, e.g. an indel at a SNP
+            return True
+        if not self.is_callable(parts):
+            return False
+        if self._end is None or position > self._end + 1:
+            self._write_interval()
+            self._start = position - 1
+        self._end = position
+        self.called += 1
+        return True
+
+    def is_callable(self, parts):
+        genotype = parts[9].split(':', 1)[0].rstrip()
+        if not genotype or '.' in genotype.replace('|', '/').split('/'):
+            return False
+        if self.min_depth or self.max_depth is not None:
+            depth = record_depth(parts)
+            if depth is None or depth < self.min_depth or (self.max_depth is not None and depth > self.max_depth):
+                return False
+        if self.min_qual:
+            try:
+                return float(parts[5]) >= self.min_qual
+            except ValueError:
+                return False
+        return True
+
+    def _write_interval(self):
+        if self._end is not None:
+            self.file.write(f"{self.contig}\t{self._start}\t{self._end}\n")
+        self._start = self._end = None
+
+    def close(self):
+        self._write_interval()
+        self.file.close()
+
+class LineSink:
+    """
+    Base of the output adapters that look at every merged line before it reaches a VcfWriter. 
+    Subclasses implement write for one line; blocks are split into lines.
+    """
+    def __init__(self, sink):
+        self.sink = sink
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def write_block(self, data):
+        lines = data.split('\n')
+        last = lines.pop()
+        for line in lines:
+            self.write(line + '\n')
+        if last:
+            self.write(last)
+
+    def flush(self):
+        self.sink.flush()
+
+    def split(self, line):
+        """
+        Returns the first ten columns of a body line, or None for a header line.
+        """
+        if line.startswith('#'):
+            return None
+        parts = line.split('\t', 10)
+        if len(parts) < 10:
+            sys.exit(f"Error: VCF record with fewer than 10 columns: {line.rstrip()!r}")
+        return parts[:10]
+
+class MaskWriter(LineSink):
+    """
+    Passes merged VCF lines on to a VcfWriter unchanged and adds each record to a CallableMask, so that the mask 
+    is written in the same pass as the output.
+
+    Args:
+    - sink (VcfWriter): Receives the lines.
+    - mask (CallableMask): Receives every record.
+    """
+    def __init__(self, sink, mask):
+        super().__init__(sink)
+        self.mask = mask
+
+    def write(self, line):
+        parts = self.split(line)
+        if parts is not None:
+            self.mask.add(parts)
+        self.sink.write(line)
+
+    def write_block(self, data):
+        for line in data.split('\n'):
+            parts = self.split(line) if line else None
+            if parts is not None:
+                self.mask.add(parts)
+        self.sink.write_block(data)
+
+class TeeWriter(LineSink):
+    """
+    Passes merged VCF lines on to a VcfWriter unchanged and to a second sink, such as a MultihetsepWriter, 
+    so that both outputs are written in the same pass.
+
+    Args:
+    - sink (VcfWriter): Receives the lines.
+    - side (LineSink): Receives the lines as well.
+    """
+    def __init__(self, sink, side):
+        super().__init__(sink)
+        self.side = side
+
+    def write(self, line):
+        self.side.write(line)
+        self.sink.write(line)
+
+    def write_block(self, data):
+        self.side.write_block(data)
+        self.sink.write_block(data)
+
+    def flush(self):
+        self.side.flush()
+        self.sink.flush()
+
+class MultihetsepWriter(LineSink):
+    """
+    Converts merged VCF lines into the multihetsep format read by MSMC2 and passes them on to a VcfWriter, 
+    instead of writing the VCF and converting it with generate_multihetsep.py of msmc-tools afterwards. 
+    Each heterozygous SNP becomes one line of contig, position, number of called sites since the previous 
+    line on the contig (this one included) and alleles, see multihetsep_alleles. Without a mask every site 
+    is taken as called, so the number is the distance to the previous heterozygous site; with a CallableMask 
+    it counts the callable records and heterozygous sites that are not callable are dropped. Header lines and 
+    all other sites are dropped. The lines have to be sorted by position within each contig.
+
+    Args:
+    - sink (VcfWriter): Receives the multihetsep lines.
+    - mask (CallableMask): Receives every record and decides which sites are called, if given.
+    """
+    def __init__(self, sink, mask=None):
+        super().__init__(sink)
+        self.mask = mask
+        self.contig = None
+        self.last_position = 0
+        self.last_called = 0
+        self._contigs = set()
+
+    def write(self, line):
+        parts = self.split(line)
+        if parts is None:
+            return
+        contig, position = parts[0], int(parts[1])
+        if contig != self.contig:
+            if contig in self._contigs:
+                sys.exit(f"Error: The multihetsep output requires the records of each contig in one run, {contig} appears again")
+            self._contigs.add(contig)
+            self.contig, self.last_position, self.last_called = contig, 0, 0
+        elif position < self.last_position:
+            sys.exit(f"Error: The multihetsep output requires records sorted by position, {contig}:{position} follows {contig}:{self.last_position}")
+        if self.mask is not None and not self.mask.add(parts):
+            return
+        alleles = multihetsep_alleles(parts[3], parts[4], parts[9])
+        if alleles is None or position == self.last_position:
+            # one line per position, further records at the same position are dropped
+            return
+        called = self.mask.called - self.last_called if self.mask is not None else position - self.last_position
+        output = f"{contig}\t{position}\t{called}\t{alleles}\n"
+        self.last_position = position
+        if self.mask is not None:
+            self.last_called = self.mask.called
+        self.sink.write(output)